@@ -0,0 +1,32 @@
+"""Gunicorn settings for the chat API (api/server.py).
+
+    gunicorn -c api/gunicorn_conf.py api.server:app
+
+The app is imported once in the master (preload_app), so models and
+memory-mapped indexes are loaded before the workers are forked and their
+pages are shared between them.
+"""
+import os
+import sys
+
+
+# Loopback by default; bind a public address only behind the load balancer.
+bind = os.getenv("API_BIND", "127.0.0.1:8000")
+workers = int(os.getenv("API_WORKERS", str(os.cpu_count() or 1)))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# Proxies whose X-Forwarded-For is trusted, so anonymous turns are queued
+# by the real client address.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# LightRAG and LlamaCloud agents take a while to build in a fresh worker,
+# and streamed answers hold a request open for as long as generation runs.
+timeout = int(os.getenv("API_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    # Every worker would otherwise start one torch thread per core.
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(max(1, (os.cpu_count() or 1) // workers))
@@ -0,0 +1,258 @@
+"""Headless HTTP API for the chat pipeline.
+
+    gunicorn -c api/gunicorn_conf.py api.server:app
+
+serves the backend selected with CHAT_BACKEND (LlamaCloud agents, LightRAG
+or CAG) without Streamlit:
+
+- POST /v1/chat answers as JSON;
+- POST /v1/chat/stream streams the answer as server-sent events;
+- GET /healthz reports whether this worker's backend is built;
+- GET /metrics serves this worker's Prometheus metrics.
+
+Public mode is open to anyone. Private mode, like the UI's login-only
+private chat, needs one of API_KEYS as a bearer token; so do choosing the
+session a turn is queued under and reading the metrics.
+
+Importing this module loads the read-only state every turn needs: the
+backend's modules, the embedding and reranking models and the
+memory-mapped indexes. Gunicorn imports it once with preload_app and then
+forks its workers, which share those pages. Clients, database handles and
+threads are only created in the workers, after the fork.
+"""
+import os
+import hmac
+import json
+import asyncio
+import importlib
+import threading
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from backends import BACKENDS, CHAT_BACKEND, PRIVATE_MODE, PUBLIC_MODE, ChatError, load_backend
+from cache.faq_index import get_faq_index
+from llm.scheduler import ScheduledBackend
+from observability.metrics import REGISTRY, span
+
+
+API_PRELOAD = os.getenv("API_PRELOAD", "1") == "1"
+API_MAX_MESSAGE_CHARS = int(os.getenv("API_MAX_MESSAGE_CHARS", "2000"))
+API_MAX_HISTORY = int(os.getenv("API_MAX_HISTORY", "50"))
+# Comma-separated keys of trusted clients (e.g. the WhatsApp bridge), sent
+# as "Authorization: Bearer <key>".
+API_KEYS = [key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()]
+
+
+class Message(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+
+
+class ChatRequest(BaseModel):
+    message: str = Field(min_length=1, max_length=API_MAX_MESSAGE_CHARS)
+    history: list[Message] = Field(default=[], max_length=API_MAX_HISTORY)
+    mode: Literal["public", "private"] = PUBLIC_MODE
+    # Turns are queued fairly per session (see llm/scheduler.py). Only
+    # authenticated clients choose it; others are queued by address.
+    session: str | None = None
+
+
+class ChatResponse(BaseModel):
+    answer: str
+    backend: str
+    mode: str
+
+
+def preload(name=CHAT_BACKEND):
+    """Load the state workers can share before they are forked.
+
+    Nothing here may start a thread or open a connection, and no model is
+    run: threads do not survive a fork, and neither do torch's thread
+    pools once started.
+    """
+    module_name, _ = BACKENDS[name].split(":")
+    importlib.import_module(module_name)
+
+    from rag.chunk_store import get_chunk_store
+    get_faq_index()
+    get_chunk_store()
+    if name == "cag":
+        return
+
+    # The answer cache, local retriever and LightRAG all embed with this
+    # model; both retrieval paths rerank.
+    from cache.semantic_cache import ANSWER_CACHE
+    from rag.embedding_service import get_embedding_service
+    from retrieval.hybrid_retriever import get_local_retriever, local_index_exists
+    from retrieval.reranker import get_reranker
+    if name == "lightrag" or ANSWER_CACHE or local_index_exists():
+        get_embedding_service().model
+    try:
+        get_local_retriever()
+    except ValueError as e:
+        # A stale local index only costs the LlamaCloud fallback.
+        print(f"Local index unusable, running without it: {e}")
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.load()
+    if name == "lightrag":
+        from rag.keyword_extractor import get_keyword_extractor
+        from rag.rag_agent_func import WORKING_DIR
+        get_keyword_extractor(WORKING_DIR)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def chat_backend():
+    """Return this worker's scheduled chat backend, building it on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = load_backend()
+                if hasattr(backend, "warm_up"):
+                    backend.warm_up()
+                _backend = ScheduledBackend(backend, CHAT_BACKEND)
+    return _backend
+
+
+def warm_up_backend():
+    try:
+        chat_backend()
+    except Exception as e:
+        print(f"Chat backend warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Build the backend in the background; /healthz reports 503 and turns
+    # wait until it is ready.
+    asyncio.get_running_loop().run_in_executor(None, warm_up_backend)
+    yield
+
+
+app = FastAPI(title="PTI Chatbot API", lifespan=lifespan)
+
+
+def faq_answer(prompt, conversation_history):
+    faq = get_faq_index()
+    if faq is None:
+        return None
+    with span("faq"):
+        return faq.lookup(prompt, conversation_history)
+
+
+def answer_chunks(chat, session):
+    """The answer to `chat`, chunk by chunk, as the Streamlit UI gets it."""
+    with span("turn"):
+        # Like the UI, backends get the history including the new question.
+        history = [message.model_dump() for message in chat.history]
+        history.append({"role": "user", "content": chat.message})
+        faq = faq_answer(chat.message, history)
+        if faq is not None:
+            yield faq
+            return
+        yield from chat_backend().stream_chat(chat.message, history, mode=chat.mode, session=session)
+
+
+def authenticated(request):
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and any(hmac.compare_digest(token.strip(), key) for key in API_KEYS)
+
+
+def turn_session(chat, request):
+    """The session to queue the turn under; rejects unauthenticated private turns."""
+    trusted = authenticated(request)
+    if chat.mode == PRIVATE_MODE and not trusted:
+        raise HTTPException(status_code=401, detail="Private mode needs an API key",
+                            headers={"WWW-Authenticate": "Bearer"})
+    if trusted and chat.session:
+        return f"client:{chat.session}"
+    return request.client.host if request.client else None
+
+
+async def ready_backend():
+    try:
+        await run_in_threadpool(chat_backend)
+    except Exception as e:
+        print(f"Chat backend unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Chat backend unavailable")
+
+
+@app.post("/v1/chat", response_model=ChatResponse)
+async def chat(chat: ChatRequest, request: Request):
+    session = turn_session(chat, request)
+    await ready_backend()
+    try:
+        answer = await run_in_threadpool(lambda: "".join(answer_chunks(chat, session)))
+    except ChatError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        print(f"Chat turn failed: {e}")
+        raise HTTPException(status_code=502, detail="The chat backend failed to answer")
+    return ChatResponse(answer=answer, backend=CHAT_BACKEND, mode=chat.mode)
+
+
+def sse(data, event=None):
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+
+def sse_answer(chat, session):
+    # Starlette iterates this in its thread pool, one chunk at a time.
+    try:
+        for chunk in answer_chunks(chat, session):
+            if chunk:
+                yield sse({"text": chunk})
+    except ChatError as e:
+        yield sse({"detail": str(e)}, event="error")
+        return
+    except Exception as e:
+        print(f"Chat turn failed: {e}")
+        yield sse({"detail": "The chat backend failed to answer"}, event="error")
+        return
+    yield sse({}, event="done")
+
+
+@app.post("/v1/chat/stream")
+async def chat_stream(chat: ChatRequest, request: Request):
+    session = turn_session(chat, request)
+    await ready_backend()
+    return StreamingResponse(
+        sse_answer(chat, session),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/healthz")
+async def healthz():
+    if _backend is None:
+        raise HTTPException(status_code=503, detail="Chat backend is not ready")
+    return {"status": "ok", "backend": CHAT_BACKEND, "pid": os.getpid()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    if not authenticated(request):
+        raise HTTPException(status_code=401, detail="Metrics need an API key", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+if API_PRELOAD:
+    preload()
+
+
+if __name__ == "__main__":
+    # One process, for development; use gunicorn to run several workers.
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")))
@@ -0,0 +1,51 @@
+import os
+import importlib
+import threading
+
+
+PUBLIC_MODE = "public"
+PRIVATE_MODE = "private"
+
+ERROR_MESSAGE = "Sorry, there was an error. please try again later ☹️!"
+
+# Backend name -> "module:factory". Nothing is imported until a backend is
+# selected, so the LlamaCloud UI never pays for torch, sentence_transformers
+# or lightrag, and vice versa.
+BACKENDS = {
+    "llamacloud": "llmaindex.agent_pool:get_agent_pool",
+    "lightrag": "rag.rag_agent_func:get_lightrag_backend",
+    "cag": "cag.cag_agent:CagAgent",
+}
+
+CHAT_BACKEND = os.getenv("CHAT_BACKEND", "llamacloud")
+
+class ChatError(Exception):
+    """Raised by `stream_chat` when a backend cannot answer.
+
+    The message is meant for the user; the underlying error is chained.
+    """
+
+    def __init__(self, message=ERROR_MESSAGE):
+        super().__init__(message)
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_backend(name=CHAT_BACKEND):
+    """Import and build the named chat backend once per process.
+
+    Every backend exposes `chat(prompt, conversation_history, mode)` and
+    `stream_chat(prompt, conversation_history, mode)`. A stream that fails,
+    before or after its first chunk, raises ChatError.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown chat backend {name!r}, expected one of {sorted(BACKENDS)}")
+
+    with _loaded_lock:
+        if name not in _loaded:
+            module_name, factory_name = BACKENDS[name].split(":")
+            factory = getattr(importlib.import_module(module_name), factory_name)
+            _loaded[name] = factory()
+        return _loaded[name]
@@ -0,0 +1,359 @@
+"""Replay a recorded question set through the chat pipelines, fully offline.
+
+Gemini, LlamaCloud, the LightRAG store and Supabase are replaced by local
+fakes with configurable latency, so the numbers measure our own hot path:
+the FAQ lookup, the scheduler, retrieval plumbing, prompt building,
+history compaction, streaming and persistence. Backends are built with
+`backends.load_backend()` and wrapped in `ScheduledBackend`, as the UI and
+the API do, with the answer cache off and the reranker set by --reranker.
+Each pipeline runs in its own interpreter so peak RSS is per pipeline.
+
+    python -m bench.chat_pipeline
+    python -m bench.chat_pipeline --sessions 8 --pipelines llamacloud-private cag
+    python -m bench.chat_pipeline --save-baseline
+
+Results are compared against bench/baseline.json; the exit status is 1 if
+any metric regressed by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import argparse
+import resource
+import datetime
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT_DIR, "bench")
+QUESTIONS_PATH = os.path.join(BENCH_DIR, "questions.json")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+PIPELINES = ["llamacloud-private", "llamacloud-public", "lightrag", "cag"]
+RERANKERS = ["llamacloud", "local", "off"]
+
+# metric -> True if higher is better
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "first_chunk_p50_ms": False,
+    "turns_per_s": True,
+    "prompt_tokens_per_turn": False,
+    "peak_rss_mb": False,
+}
+# Differences smaller than this are noise, whatever the relative change.
+ABSOLUTE_SLACK = {"p50_ms": 2, "p95_ms": 5, "p99_ms": 5, "first_chunk_p50_ms": 2, "peak_rss_mb": 10}
+
+
+class FakeRetriever:
+    """Stands in for the LlamaCloud retriever.
+
+    Waits `latency` seconds, then returns `top_k` consecutive chunks from the
+    local chunk store, starting at a position derived from the query, so
+    prompts have realistic sizes and every run sees the same context.
+    """
+
+    def __init__(self, chunks, latency, top_k=3):
+        self.chunks = chunks
+        self.latency = latency
+        self.top_k = top_k
+
+    def _nodes(self, query):
+        from llama_index.core.schema import NodeWithScore, TextNode
+
+        start = zlib.crc32(query.encode("utf-8")) % len(self.chunks)
+        nodes = []
+        for rank in range(self.top_k):
+            index = (start + rank) % len(self.chunks)
+            chunk = self.chunks[index]
+            node = TextNode(id_=f"bench-{index}", text=chunk["text"], metadata={"url": chunk["url"]})
+            nodes.append(NodeWithScore(node=node, score=1.0 / (rank + 1)))
+        return nodes
+
+    def retrieve(self, query):
+        time.sleep(self.latency)
+        return self._nodes(query)
+
+    async def aretrieve(self, query):
+        await asyncio.sleep(self.latency)
+        return self._nodes(query)
+
+
+class FakeLightRAG:
+    """Stands in for a LightRAG instance.
+
+    Retrieval is faked; generation goes through the real `llm_model_func`,
+    so history compaction and the provider are part of the measurement.
+    """
+
+    working_dir = None
+
+    def __init__(self, retriever):
+        self.retriever = retriever
+
+    async def aquery(self, query, param):
+        from rag.rag_agent_func import llm_model_func
+
+        nodes = await self.retriever.aretrieve(query)
+        context = "\n\n".join(node.get_content() for node in nodes)
+        prompt = f"---Knowledge Base---\n{context}\n\nUser Question: {query}"
+        return await llm_model_func(prompt, history_messages=param.conversation_history, stream=param.stream)
+
+    def query(self, query, param):
+        from lightrag.utils import always_get_an_event_loop
+        return always_get_an_event_loop().run_until_complete(self.aquery(query, param))
+
+
+class FakeChatHistoryStore:
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def insert(self, rows):
+        time.sleep(self.latency)
+
+
+def install_fakes(backend, args):
+    """Point the backend's network-bound parts at the fakes."""
+    from rag.chunk_store import get_chunk_store
+
+    chunks = get_chunk_store()
+    latency = args.retrieval_ms / 1000
+
+    if backend == "llamacloud":
+        from llmaindex.llma_index_agent import LmmaIndexAgent
+        from retrieval.reranker import RERANK_CANDIDATES, RerankingRetriever
+
+        # Agents are built as usual; only the LlamaCloud index is faked.
+        def create_llama_cloud_retriever(agent):
+            if agent.reranker is not None:
+                return RerankingRetriever(FakeRetriever(chunks, latency, top_k=RERANK_CANDIDATES), agent.reranker)
+            return FakeRetriever(chunks, latency)
+
+        LmmaIndexAgent.create_llama_cloud_retriever = create_llama_cloud_retriever
+
+    elif backend == "lightrag":
+        import rag.rag_agent_func
+
+        rag.rag_agent_func.rag = lambda: FakeLightRAG(FakeRetriever(chunks, latency))
+
+
+def build_turn(pipeline, args):
+    """Return turn(question, history, session) -> iterator of answer chunks."""
+    from backends import PRIVATE_MODE, PUBLIC_MODE, load_backend
+    from cache.faq_index import get_faq_index
+    from llm.scheduler import ScheduledBackend
+
+    if pipeline not in PIPELINES:
+        raise ValueError(f"Unknown pipeline {pipeline!r}; choose from {', '.join(PIPELINES)}")
+    name = pipeline.split("-")[0]
+    mode = PRIVATE_MODE if pipeline == "llamacloud-private" else PUBLIC_MODE
+
+    install_fakes(name, args)
+    backend = load_backend(name)
+    if hasattr(backend, "warm_up"):
+        backend.warm_up()
+    backend = ScheduledBackend(backend, name)
+    faq = get_faq_index()
+
+    def turn(question, history, session):
+        # As the UI and the API answer a turn.
+        answer = faq.lookup(question, history) if faq is not None else None
+        if answer is not None:
+            return iter([answer])
+        return backend.stream_chat(question, history, mode=mode, session=session)
+
+    return turn
+
+
+def run_pipeline(pipeline, args):
+    """Run `args.sessions` concurrent sessions, each replaying every question."""
+    # Configure the fakes before any project module reads its settings.
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["LLM_FAKE_FIRST_TOKEN_DELAY"] = str(args.llm_first_token_ms / 1000)
+    os.environ["LLM_FAKE_TOKEN_DELAY"] = str(args.llm_token_ms / 1000)
+    os.environ["RERANKER"] = args.reranker
+    # Every turn runs the whole pipeline, as many times as the fakes allow.
+    os.environ["ANSWER_CACHE"] = "0"
+    os.environ["RATE_LIMIT_LLAMACLOUD"] = "0"
+    os.environ["AGENT_POOL_SIZE"] = str(args.sessions)
+
+    from observability.metrics import LLM_TOKENS
+    from storage.chat_history_writer import ChatHistoryWriter
+
+    with open(args.questions, "r", encoding="utf-8") as file:
+        questions = json.load(file)
+
+    turn = build_turn(pipeline, args)
+    writer = ChatHistoryWriter(FakeChatHistoryStore(args.persist_ms / 1000),
+                               spool_path=os.path.join(BENCH_DIR, ".bench_spool.jsonl"))
+
+    def session(session_id):
+        history, latencies, first_chunks = [], [], []
+        for question in questions:
+            start = time.perf_counter()
+            history.append({"role": "user", "content": question})
+            chunks = []
+            for chunk in turn(question, history, f"bench-{session_id}"):
+                if not chunks:
+                    first_chunks.append(time.perf_counter() - start)
+                chunks.append(chunk)
+            answer = "".join(chunks)
+            history.append({"role": "assistant", "content": answer})
+            timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            writer.enqueue([{"user_id": f"bench-{session_id}", "role": message["role"],
+                             "content": message["content"], "timestamp": timestamp} for message in history[-2:]])
+            latencies.append(time.perf_counter() - start)
+        return latencies, first_chunks
+
+    # One untimed turn pays for imports, agent construction and lazy setup.
+    list(turn(questions[0], [{"role": "user", "content": questions[0]}], "bench-warm-up"))
+    tokens_before = sum(value for (_, kind), value in LLM_TOKENS.values().items() if kind == "prompt")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        results = list(executor.map(session, range(args.sessions)))
+    elapsed = time.perf_counter() - start
+    writer.close()
+
+    latencies = np.array([value for result in results for value in result[0]]) * 1000
+    first_chunks = np.array([value for result in results for value in result[1]]) * 1000
+    prompt_tokens = sum(value for (_, kind), value in LLM_TOKENS.values().items() if kind == "prompt") - tokens_before
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    return {
+        "turns": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "first_chunk_p50_ms": round(float(np.percentile(first_chunks, 50)), 1),
+        "turns_per_s": round(len(latencies) / elapsed, 2),
+        # Public-mode synthesis prompts are built inside llama_index and
+        # are not counted.
+        "prompt_tokens_per_turn": round(prompt_tokens / len(latencies), 1),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def run_in_subprocess(pipeline, args):
+    command = [
+        sys.executable, "-m", "bench.chat_pipeline", "--worker", pipeline,
+        "--questions", args.questions,
+        "--sessions", str(args.sessions),
+        "--llm-first-token-ms", str(args.llm_first_token_ms),
+        "--llm-token-ms", str(args.llm_token_ms),
+        "--retrieval-ms", str(args.retrieval_ms),
+        "--persist-ms", str(args.persist_ms),
+        "--reranker", args.reranker,
+    ]
+    result = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def config_of(args):
+    return {
+        "questions": os.path.relpath(os.path.abspath(args.questions), ROOT_DIR),
+        "sessions": args.sessions,
+        "llm_first_token_ms": args.llm_first_token_ms,
+        "llm_token_ms": args.llm_token_ms,
+        "retrieval_ms": args.retrieval_ms,
+        "persist_ms": args.persist_ms,
+        "reranker": args.reranker,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return [(pipeline, metric, baseline, current)] for regressed metrics."""
+    regressions = []
+    for pipeline, current in results.items():
+        previous = baseline.get("results", {}).get(pipeline)
+        if not previous or "error" in current:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            change = (old - new) if higher_is_better else (new - old)
+            if change > abs(old) * tolerance and change > ABSOLUTE_SLACK.get(metric, 0):
+                regressions.append((pipeline, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pipelines", nargs="+", default=PIPELINES, choices=PIPELINES)
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated sessions")
+    parser.add_argument("--llm-first-token-ms", type=float, default=50)
+    parser.add_argument("--llm-token-ms", type=float, default=2)
+    parser.add_argument("--retrieval-ms", type=float, default=50)
+    parser.add_argument("--persist-ms", type=float, default=20)
+    parser.add_argument("--reranker", default="llamacloud", choices=RERANKERS,
+                        help="RERANKER setting; local needs the cross-encoder weights")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Agents print progress; keep stdout for the JSON result.
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_pipeline(args.worker, args)
+        print(json.dumps(result))
+        return
+
+    results = {pipeline: run_in_subprocess(pipeline, args) for pipeline in args.pipelines}
+    run = {"config": config_of(args), "results": results}
+
+    if args.json:
+        print(json.dumps(run, indent=2))
+    else:
+        widths = {metric: len(metric) + 2 for metric in METRICS}
+        print(f"{'pipeline':<20}" + "".join(f"{metric:>{widths[metric]}}" for metric in METRICS))
+        for pipeline, result in results.items():
+            if "error" in result:
+                print(f"{pipeline:<20} failed: {result['error']}")
+                continue
+            print(f"{pipeline:<20}" + "".join(f"{result[metric]:>{widths[metric]}}" for metric in METRICS))
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(run, file, indent=2)
+            file.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --save-baseline first.")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("config") != run["config"]:
+        print("Warning: baseline was recorded with different settings:", baseline.get("config"))
+
+    regressions = compare(results, baseline, args.tolerance)
+    for pipeline, metric, old, new in regressions:
+        print(f"REGRESSION {pipeline} {metric}: {old} -> {new}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Report the import cost of the app's entry modules.
+
+Each module is imported in a fresh interpreter with `-X importtime`, so the
+numbers are cold-start costs and do not leak between modules.
+
+    python -m bench.startup_imports
+    python -m bench.startup_imports main rag.rag_agent_func --top 5
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "main",
+    "backends",
+    "llmaindex.agent_pool",
+    "rag.rag_agent_func",
+    "cag.cag_agent",
+]
+
+
+def parse_importtime(stderr):
+    """Return [(module, self_us, cumulative_us)] from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def measure(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    rows = parse_importtime(result.stderr)
+
+    by_package = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    total_us = next((cumulative for name, _, cumulative in rows if name == module), None)
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+        "total_ms": total_us / 1000 if total_us is not None else None,
+        "modules_imported": len(rows),
+        "packages_ms": {name: us / 1000 for name, us in sorted(by_package.items(), key=lambda item: -item[1])},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=8, help="heaviest packages to list per module")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args()
+
+    results = [measure(module) for module in args.modules]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        if not result["ok"]:
+            print(f"{result['module']}: import failed ({result['error']})")
+            continue
+        print(f"{result['module']}: {result['total_ms']:.1f} ms, {result['modules_imported']} modules")
+        for name, ms in list(result["packages_ms"].items())[:args.top]:
+            print(f"    {name:<32} {ms:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""Pre-answered FAQ: vetted answers to the questions asked most often.
+
+    python -m cache.faq_index build [--top 50] [--min-count 3]
+    python -m cache.faq_index review
+    python -m cache.faq_index list
+    python -m cache.faq_index compile
+
+`build` collects candidate questions (SEED_QUESTIONS plus the most frequent
+user questions in chat_history), drafts answers for new ones with the chat
+backend and adds them to data/faq/faq.json unapproved. `review` walks
+through unapproved entries to approve, edit or reject them. Both recompile
+the index from the approved entries.
+
+The index holds a hash of each question's normalized text for exact
+matches and character trigram postings for fuzzy ones, as memory-mapped
+arrays, so `FaqIndex.lookup` answers in well under a millisecond. A fuzzy
+match must also use only words of the FAQ question, question word
+included: "When does the session end?" is not "When does the session
+start?". Follow-up questions are never answered from the FAQ.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import Counter
+
+import numpy as np
+
+from cache.semantic_cache import earlier_turns
+from observability.metrics import REGISTRY, stats_collector
+from retrieval.hybrid_retriever import STOPWORDS, TOKEN_RE
+
+
+FAQ_DIR = os.path.abspath(os.getenv("FAQ_DIR", "./data/faq"))
+FAQ_FILENAME = "faq.json"
+# Minimum Dice similarity of character trigrams for a fuzzy match.
+FAQ_FUZZY_THRESHOLD = float(os.getenv("FAQ_FUZZY_THRESHOLD", "0.9"))
+# Messages scanned for frequent questions by `build`.
+FAQ_HISTORY_SCAN = int(os.getenv("FAQ_HISTORY_SCAN", "20000"))
+
+NGRAM = 3
+# Kept in keys: they decide what is being asked.
+QUESTION_WORDS = frozenset(["how", "what", "when", "where", "which", "who", "why"])
+KEY_STOPWORDS = STOPWORDS - QUESTION_WORDS
+
+SEED_QUESTIONS = [
+    "What are the admission requirements?",
+    "How much are the school fees?",
+    "What courses does PTI offer?",
+    "Who is the rector of PTI?",
+    "How can I contact PTI?",
+    "Where is PTI located?",
+    "How do I apply for admission?",
+    "When does the academic session start?",
+]
+
+
+def faq_key(question):
+    """Lowercased content and question words: what two phrasings of a question share."""
+    return " ".join(token for token in TOKEN_RE.findall(question.lower()) if token not in KEY_STOPWORDS)
+
+
+def fuzzy_match(key, faq_question_key, threshold=FAQ_FUZZY_THRESHOLD):
+    """Whether `key` asks the question keyed `faq_question_key`.
+
+    Every word of `key` must be in the FAQ question (so extra detail, like
+    a particular course, is not answered generically) and their trigrams
+    must be close; this allows a dropped word or reordering, not a
+    different question.
+    """
+    return set(key.split()) <= set(faq_question_key.split()) and dice(key, faq_question_key) >= threshold
+
+
+def key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def ngrams(key):
+    padded = f" {key} "
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+def dice(a, b):
+    a, b = ngrams(a), ngrams(b)
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+def load_faq(faq_dir=FAQ_DIR):
+    path = os.path.join(faq_dir, FAQ_FILENAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_faq(entries, faq_dir=FAQ_DIR):
+    os.makedirs(faq_dir, exist_ok=True)
+    path = os.path.join(faq_dir, FAQ_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(entries, file, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def compile_index(entries, faq_dir=FAQ_DIR):
+    """Write the lookup arrays for the approved `entries`.
+
+    Every question and variant of an entry is a row. Rows are found by the
+    hash of their key (sorted, for binary search) or through CSR trigram
+    postings: rows containing gram g are
+    gram_rows[gram_offsets[g]:gram_offsets[g + 1]].
+    """
+    index_dir = os.path.join(faq_dir, "index")
+    os.makedirs(index_dir, exist_ok=True)
+    approved = [entry for entry in entries if entry.get("approved")]
+
+    row_entry, row_keys, seen = [], [], set()
+    for entry_id, entry in enumerate(approved):
+        for question in [entry["question"], *entry.get("variants", [])]:
+            key = faq_key(question)
+            if key and key not in seen:
+                seen.add(key)
+                row_entry.append(entry_id)
+                row_keys.append(key)
+
+    hashes = np.array([key_hash(key) for key in row_keys], dtype=np.uint64)
+    order = np.argsort(hashes, kind="stable")
+
+    vocab, postings = {}, []
+    row_grams = np.zeros(len(row_keys), dtype=np.int32)
+    for row, key in enumerate(row_keys):
+        grams = ngrams(key)
+        row_grams[row] = len(grams)
+        for gram in grams:
+            gram_id = vocab.setdefault(gram, len(vocab))
+            if gram_id == len(postings):
+                postings.append([])
+            postings[gram_id].append(row)
+    gram_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    gram_offsets[1:] = np.cumsum([len(rows) for rows in postings])
+    gram_rows = np.fromiter((row for rows in postings for row in rows), dtype=np.int32, count=gram_offsets[-1])
+
+    np.save(os.path.join(index_dir, "hashes.npy"), hashes[order])
+    np.save(os.path.join(index_dir, "hash_rows.npy"), order.astype(np.int32))
+    np.save(os.path.join(index_dir, "row_entry.npy"), np.array(row_entry, dtype=np.int32))
+    np.save(os.path.join(index_dir, "row_grams.npy"), row_grams)
+    np.save(os.path.join(index_dir, "gram_offsets.npy"), gram_offsets)
+    np.save(os.path.join(index_dir, "gram_rows.npy"), gram_rows)
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump({
+            "vocab": list(vocab),
+            "keys": row_keys,
+            "questions": [entry["question"] for entry in approved],
+            "answers": [entry["answer"] for entry in approved],
+        }, file, ensure_ascii=False)
+    return len(approved), len(row_keys)
+
+
+class FaqIndex:
+    """Read side of the compiled FAQ, shared by every session."""
+
+    def __init__(self, faq_dir=FAQ_DIR, threshold=FAQ_FUZZY_THRESHOLD):
+        index_dir = os.path.join(faq_dir, "index")
+        self.threshold = threshold
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self.hashes = load("hashes.npy")
+        self.hash_rows = load("hash_rows.npy")
+        self.row_entry = load("row_entry.npy")
+        self.row_grams = load("row_grams.npy")
+        self.gram_offsets = load("gram_offsets.npy")
+        self.gram_rows = load("gram_rows.npy")
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.vocab = {gram: i for i, gram in enumerate(meta["vocab"])}
+        # Indexes compiled before keys were stored only match exactly.
+        self.row_keys = meta.get("keys")
+        self.questions = meta["questions"]
+        self.answers = meta["answers"]
+
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.answers)
+
+    def match(self, question):
+        """Index of the FAQ entry matching `question`, or None."""
+        key = faq_key(question)
+        if not key or not len(self.hashes):
+            return None
+
+        h = np.uint64(key_hash(key))
+        i = int(np.searchsorted(self.hashes, h))
+        if i < len(self.hashes) and self.hashes[i] == h:
+            with self._lock:
+                self.exact_hits += 1
+            return int(self.row_entry[self.hash_rows[i]])
+
+        grams = ngrams(key)
+        gram_ids = [self.vocab[gram] for gram in grams if gram in self.vocab]
+        if gram_ids and self.row_keys is not None:
+            rows = np.concatenate([self.gram_rows[self.gram_offsets[g]:self.gram_offsets[g + 1]] for g in gram_ids])
+            overlap = np.bincount(rows, minlength=len(self.row_grams))
+            scores = 2 * overlap / (len(grams) + self.row_grams)
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for row in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                if fuzzy_match(key, self.row_keys[row], self.threshold):
+                    with self._lock:
+                        self.fuzzy_hits += 1
+                    return int(self.row_entry[row])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def lookup(self, question, conversation_history=()):
+        """Vetted answer for `question`, or None.
+
+        Follow-ups (a question after earlier turns) may depend on those
+        turns, so they always miss.
+        """
+        if earlier_turns(question, conversation_history):
+            return None
+        entry = self.match(question)
+        return None if entry is None else self.answers[entry]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.fuzzy_hits + self.misses
+            return {
+                "size": len(self.answers),
+                "exact_hits": self.exact_hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+            }
+
+
+_faq_index = None
+_faq_index_lock = threading.Lock()
+
+
+def get_faq_index():
+    """Return the process-wide FAQ index, or None if none has been built."""
+    global _faq_index
+    if _faq_index is None:
+        with _faq_index_lock:
+            if _faq_index is None and os.path.exists(os.path.join(FAQ_DIR, "index", "meta.json")):
+                _faq_index = FaqIndex()
+                REGISTRY.add_collector(stats_collector(
+                    "pti_faq", _faq_index.stats, counters=("exact_hits", "fuzzy_hits", "misses")))
+    return _faq_index
+
+
+def frequent_questions(questions, min_count, top):
+    """[(question, count, variants)] for the `top` most asked questions.
+
+    Phrasings whose keys are fuzzy matches are counted together; the most
+    common phrasing represents the group.
+    """
+    counts = Counter()
+    phrasing = {}
+    for question in questions:
+        key = faq_key(question)
+        if key:
+            counts[key] += 1
+            phrasing.setdefault(key, " ".join(question.split()))
+
+    groups = []  # [key, count, [variant keys]]
+    for key, count in counts.most_common():
+        for group in groups:
+            if fuzzy_match(key, group[0]):
+                group[1] += count
+                group[2].append(key)
+                break
+        else:
+            groups.append([key, count, []])
+
+    groups = sorted((group for group in groups if group[1] >= min_count), key=lambda group: -group[1])[:top]
+    return [(phrasing[key], count, [phrasing[variant] for variant in variants]) for key, count, variants in groups]
+
+
+def draft_answer(backend, question):
+    from backends import PUBLIC_MODE
+    return "".join(backend.stream_chat(question, [], mode=PUBLIC_MODE)).strip()
+
+
+def build(top, min_count, faq_dir=FAQ_DIR):
+    entries = load_faq(faq_dir)
+
+    candidates = [(question, 0, []) for question in SEED_QUESTIONS]
+    try:
+        from storage.chat_history_store import create_chat_history_store
+        questions = create_chat_history_store().recent_user_questions(FAQ_HISTORY_SCAN)
+        candidates += frequent_questions(questions, min_count, top)
+        print(f"Scanned {len(questions)} questions from chat_history")
+    except Exception as e:
+        print(f"Could not read chat_history ({e}); using the seed questions only")
+
+    backend = None
+    for question, count, variants in candidates:
+        key = faq_key(question)
+        existing = next((entry for entry in entries
+                         if any(fuzzy_match(key, faq_key(q))
+                                for q in [entry["question"], *entry.get("variants", [])])), None)
+        if existing is not None:
+            # Known question: just learn the new phrasings.
+            known = {faq_key(q) for q in [existing["question"], *existing.get("variants", [])]}
+            existing.setdefault("variants", []).extend(v for v in [question, *variants] if faq_key(v) not in known)
+            existing["count"] = max(existing.get("count", 0), count)
+            continue
+
+        if backend is None:
+            from backends import load_backend
+            backend = load_backend()
+        print(f"Drafting an answer for: {question}")
+        entries.append({
+            "question": question,
+            "variants": variants,
+            "answer": draft_answer(backend, question),
+            "count": count,
+            "approved": False,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+
+    save_faq(entries, faq_dir)
+    pending = sum(not entry.get("approved") for entry in entries)
+    print(f"{len(entries)} FAQ entries, {pending} awaiting review")
+
+
+def read_answer():
+    print("New answer; end with a line containing only '.':")
+    lines = []
+    for line in sys.stdin:
+        if line.rstrip("\n") == ".":
+            break
+        lines.append(line.rstrip("\n"))
+    return "\n".join(lines).strip()
+
+
+def review(faq_dir=FAQ_DIR, include_approved=False):
+    entries = load_faq(faq_dir)
+    kept = []
+    for i, entry in enumerate(entries):
+        if entry.get("approved") and not include_approved:
+            kept.append(entry)
+            continue
+
+        print(f"\n[{i + 1}/{len(entries)}] {entry['question']}  (asked {entry.get('count', 0)} times)")
+        if entry.get("variants"):
+            print("Also asked as: " + " | ".join(entry["variants"]))
+        print(f"\n{entry['answer']}\n")
+        choice = input("[a]pprove, [e]dit, [r]eject, [s]kip, [q]uit? ").strip().lower()[:1]
+        if choice == "q":
+            kept.extend(entries[i:])
+            break
+        if choice == "r":
+            continue
+        if choice == "e":
+            entry["answer"] = read_answer() or entry["answer"]
+            entry["approved"] = True
+        elif choice == "a":
+            entry["approved"] = True
+        if choice in ("a", "e"):
+            entry["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        kept.append(entry)
+
+    save_faq(kept, faq_dir)
+
+
+def list_entries(faq_dir=FAQ_DIR):
+    for entry in load_faq(faq_dir):
+        status = "approved" if entry.get("approved") else "pending"
+        print(f"{status:9} {entry.get('count', 0):5}  {entry['question']}  (+{len(entry.get('variants', []))} variants)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and review the pre-answered FAQ.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="add frequent questions with drafted answers")
+    build_parser.add_argument("--top", type=int, default=50, help="most frequent questions to consider")
+    build_parser.add_argument("--min-count", type=int, default=3, help="times a question must have been asked")
+    review_parser = commands.add_parser("review", help="approve, edit or reject drafted answers")
+    review_parser.add_argument("--all", action="store_true", help="also review approved entries")
+    commands.add_parser("list", help="show the FAQ entries")
+    commands.add_parser("compile", help="rebuild the index from faq.json")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.top, args.min_count)
+    elif args.command == "review":
+        review(include_approved=args.all)
+    elif args.command == "list":
+        list_entries()
+
+    if args.command != "list":
+        approved, rows = compile_index(load_faq())
+        print(f"Index rebuilt: {approved} approved answers, {rows} phrasings")
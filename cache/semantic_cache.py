@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from backends import CHAT_BACKEND
+from observability.metrics import REGISTRY, stats_collector
+from rag.embedding_service import get_embedding_service
+
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 60 * 60)))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# Questions are embedded with the local model, which needs torch. LightRAG
+# loads it anyway; the LlamaCloud deployment otherwise never does, so there
+# the cache is off unless ANSWER_CACHE=1.
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "0" if CHAT_BACKEND == "llamacloud" else "1") == "1"
+
+
+def normalize_question(question):
+    question = question.lower()
+    question = re.sub(r"[^\w\s]", " ", question)
+    return " ".join(question.split())
+
+
+def earlier_turns(question, conversation_history):
+    """The messages before `question`; callers may already have appended it."""
+    history = list(conversation_history or ())
+    last = history[-1] if history else None
+    if isinstance(last, dict) and last.get("role") == "user" and last.get("content") == question:
+        history.pop()
+    return history
+
+
+def default_embed(texts):
+    return get_embedding_service().encode(texts, normalize=True)
+
+
+class CacheEntry:
+
+    def __init__(self, question, embedding, answer, created_at):
+        self.question = question
+        self.embedding = embedding
+        self.answer = answer
+        self.created_at = created_at
+
+
+class SemanticCache:
+    """Answer cache keyed on the meaning of the question.
+
+    A lookup first tries the normalized question text, then falls back to
+    cosine similarity against the stored question embeddings. Entries expire
+    after `ttl` seconds and the least recently used entry is evicted once
+    `max_size` is reached. Answers are kept in separate namespaces (one per
+    backend/mode) because the same question gets different answers there.
+
+    Answers depend on the conversation they were given in, so only
+    stand-alone questions are cached: `get` and `put` do nothing when
+    `conversation_history` holds earlier turns.
+    """
+
+    def __init__(self, embed=default_embed, max_size=SEMANTIC_CACHE_SIZE,
+                 ttl=SEMANTIC_CACHE_TTL, threshold=SEMANTIC_CACHE_THRESHOLD, clock=time.monotonic):
+        self.embed = embed
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _embedding(self, question):
+        # Remember the embedding of recent lookups so a miss followed by a
+        # put for the same question only embeds it once.
+        with self._lock:
+            embedding = self._embeddings.get(question)
+            if embedding is not None:
+                self._embeddings.move_to_end(question)
+                return embedding
+
+        embedding = np.asarray(self.embed([question])[0], dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm:
+            embedding = embedding / norm
+
+        with self._lock:
+            self._embeddings[question] = embedding
+            while len(self._embeddings) > self.max_size:
+                self._embeddings.popitem(last=False)
+        return embedding
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
+
+    def get(self, question, namespace="default", conversation_history=()):
+        if earlier_turns(question, conversation_history):
+            return None
+        question = normalize_question(question)
+        if not question:
+            return None
+
+        exact_key = (namespace, question)
+        with self._lock:
+            self._expire(self.clock())
+            entry = self._entries.get(exact_key)
+            if entry is not None:
+                self._entries.move_to_end(exact_key)
+                self.hits += 1
+                return entry.answer
+            if not any(key[0] == namespace for key in self._entries):
+                self.misses += 1
+                return None
+
+        embedding = self._embedding(question)
+
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == namespace]
+            if keys:
+                matrix = np.stack([self._entries[key].embedding for key in keys])
+                scores = matrix @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self._entries[keys[best]].answer
+            self.misses += 1
+            return None
+
+    def put(self, question, answer, namespace="default", conversation_history=()):
+        if earlier_turns(question, conversation_history):
+            return
+        question = normalize_question(question)
+        if not question or not answer:
+            return
+
+        embedding = self._embedding(question)
+
+        with self._lock:
+            key = (namespace, question)
+            self._entries[key] = CacheEntry(question, embedding, answer, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._embeddings.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class NoAnswerCache:
+    """Stands in for the answer cache when it is turned off."""
+
+    def get(self, question, namespace="default", conversation_history=()):
+        return None
+
+    def put(self, question, answer, namespace="default", conversation_history=()):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {"size": 0, "hits": 0, "misses": 0, "hit_rate": 0.0, "evictions": 0, "expirations": 0}
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache shared by all backends."""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticCache() if ANSWER_CACHE else NoAnswerCache()
+                REGISTRY.add_collector(stats_collector(
+                    "pti_answer_cache", _answer_cache.stats, counters=("hits", "misses", "evictions", "expirations")))
+    return _answer_cache
@@ -1,77 +1,127 @@
 import os
-from firecrawl import FirecrawlApp
-from google import genai
-from google.genai import types
-import pathlib
-import httpx
 import json
+import itertools
 from dotenv import load_dotenv
 
+from backends import ChatError
+from llm.context_cache import ContextCache, get_context_cache, is_cache_gone
+from llm.provider import get_llm_provider
+from rag.chunk_store import get_chunk_store
+
 # Load environment variables from .env file
 load_dotenv()
 
+# "cached": register the site's pages once with Gemini's context caching and
+# send only the cache handle with each question; "inline": send the pages
+# with every question; "url": send only the site's address.
+CAG_MODE = os.getenv("CAG_MODE", "cached")
+SITE_PROMPT = 'go to https://pti.edu.ng'
+
 
 class CagAgent:
 
-    def __init__(self, prompt):
+    def __init__(self, prompt=None, provider=None):
         self.prompt = prompt
 
-        google_api_key = os.getenv('GOOGLE_API_KEY')
-        firecrawl_api_key = os.getenv('FIRECRAWL_API_KEY')
-
-        print(google_api_key) 
-
-        self.client = genai.Client(api_key=google_api_key)
-
-        self.fire = FirecrawlApp(api_key=firecrawl_api_key)
-
-        all_markdowns = self.get_markdown_from_file()
-
-        formatted_prompt = self.create_prompt(prompt)
-
-        # self.cag_response = self.cag_response_call(all_markdowns, formatted_prompt)
-        self.cag_response = self.cag_response_call('go to https://pti.edu.ng', formatted_prompt)
-
-    def get_markdown_from_urls(self, urls: list[str]):
-        url = "https://pti.edu.ng"
-
-        # Get all links from the website
-        all_links = self.fire.map_url(url).get('links')[1:]  
-
-        batch_scrape_result = self.fire.batch_scrape_urls(all_links, {'formats': ['markdown']})
-
-        all_markdown = []
-
-        for page in batch_scrape_result['data']:
-            all_markdown.append({
-                "url": page['metadata']['url'],
-                "markdown": page['markdown']
-            })
-
-        return all_markdown
+        self.provider = provider or get_llm_provider()
+        # The shared cache, unless the agent was handed its own provider.
+        self.context_cache = ContextCache("cag", provider) if provider else get_context_cache("cag")
+
+        self._corpus = None
+
+        # Without a prompt the agent is a reusable backend; see chat/stream_chat.
+        if prompt is not None:
+            self.cag_response = self.cag_response_call(self.create_prompt(prompt))
+
+    def warm_up(self):
+        # Upload the pages before the first question rather than during it.
+        if CAG_MODE == "cached":
+            self.request_contents("")
+
+    def chat(self, prompt, conversation_history=[], mode=None):
+        return self.cag_response_call(self.create_prompt(prompt))
+
+    def stream_chat(self, prompt, conversation_history=[], mode=None):
+        yield from self.cag_response_stream(self.create_prompt(prompt))
+
+    def get_markdown_from_urls(self, urls: list[str] = None):
+        """Crawl the site (incrementally, see crawler/site_crawler.py) and
+        return every page crawled so far."""
+        from crawler.site_crawler import CRAWL_OUTPUT, CRAWL_SEED_URL, crawl_site
+        from rag.corpus import load_pages
+
+        crawl_site(urls or [CRAWL_SEED_URL])
+        return load_pages(CRAWL_OUTPUT)
+
+    def save_markdown_to_file(self, markdowns, filename="pti_pages.jsonl"):
+        # JSONL, so adding pages is an append rather than a rewrite.
+        from crawler.site_crawler import append_jsonl
+        append_jsonl(filename, markdowns)
+
+    def get_markdown_from_file(self):
+        # Compacted pages: site chrome and near-duplicate sections removed.
+        return [page['markdown'] for page in get_chunk_store().pages()]
+
+    @property
+    def corpus(self):
+        if self._corpus is None:
+            self._corpus = json.dumps(self.get_markdown_from_file())
+        return self._corpus
+
+    def request_contents(self, prompt):
+        """(contents, config) for a question in the configured CAG_MODE."""
+        if CAG_MODE == "url":
+            return [SITE_PROMPT, prompt], {}
+        if CAG_MODE == "cached":
+            try:
+                return [prompt], {"cached_content": self.context_cache.handle([self.corpus])}
+            except Exception as e:
+                # e.g. the pages are below the model's minimum cache size.
+                print(f"Context caching unavailable ({e}), sending the pages inline")
+        return [self.corpus, prompt], {}
+
+    def _with_cache_retry(self, call, prompt):
+        # A cache can expire or be deleted between `handle` and the call;
+        # re-upload it once.
+        contents, config = self.request_contents(prompt)
+        try:
+            return call(contents, config)
+        except Exception as e:
+            if "cached_content" not in config or not is_cache_gone(e):
+                raise
+            self.context_cache.invalidate(config["cached_content"])
+        return call(*self.request_contents(prompt))
 
-    def save_markdown_to_file(self, markdowns, filename="pti_markdown_results_all.json"):
-        with open(filename, "w", encoding="utf-8") as file:
-            json.dump(markdowns, file, indent=4, ensure_ascii=False)
+    def cag_response_call(self, prompt):
+        try:
+            print("Fetching response")
+            return self._with_cache_retry(
+                lambda contents, config: self.provider.generate(
+                    "cag", contents, max_output_tokens=None, temperature=None, **config),
+                prompt,
+            )
 
-    def get_markdown_from_file(self, filename="data/pti_markdown_results_all.json"):
-        with open(filename, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        
-        markdowns = [item['markdown'] for item in data]
-        return markdowns
+        except Exception as e:
+            return(f'An exception occurred: {e}')
 
-    def cag_response_call(self, all_markdowns, prompt):
+    def cag_response_stream(self, prompt):
         try:
-            print("Fetching response")
-            response = self.client.models.generate_content(
-                model="gemini-1.5-flash-8b",
-                contents=[json.dumps(all_markdowns), prompt])
-            
-            return(response.text)
+            print("Streaming response")
+            stream = self._with_cache_retry(
+                lambda contents, config: self._started(self.provider.stream(
+                    "cag", contents, max_output_tokens=None, temperature=None, **config)),
+                prompt,
+            )
+            yield from stream
 
         except Exception as e:
-            return(f'An exception occurred: {e.message}')
+            print(f"Streamed answer failed: {e}")
+            raise ChatError() from e
+
+    def _started(self, stream):
+        # Run the stream up to its first chunk so errors surface here.
+        first_chunk = next(stream, None)
+        return stream if first_chunk is None else itertools.chain([first_chunk], stream)
     
     def create_prompt(self, user_input):
         prompt = f"""
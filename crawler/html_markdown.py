@@ -0,0 +1,132 @@
+"""Convert fetched HTML pages to the markdown the chunker expects.
+
+Covers what the site uses: headings, paragraphs, lists, links, images,
+emphasis, code and tables. Scripts, styles and other non-content elements
+are dropped; repeated site chrome is removed later by rag/chunker.py.
+"""
+import re
+from urllib.parse import urljoin
+
+
+DROPPED_TAGS = ("script", "style", "noscript", "template", "svg", "iframe", "head")
+BLOCK_TAGS = {"p", "div", "section", "article", "main", "header", "footer", "nav", "aside",
+              "form", "figure", "figcaption", "blockquote", "dl", "dd", "dt", "address"}
+
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+SPACES_RE = re.compile(r"[ \t\r\f\v]+")
+
+
+def parse_html(html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser")
+
+
+def _inline(node, base_url):
+    from bs4 import NavigableString, Tag
+
+    if isinstance(node, NavigableString):
+        return SPACES_RE.sub(" ", str(node).replace("\n", " "))
+    if not isinstance(node, Tag):
+        return ""
+
+    name = node.name
+    if name == "br":
+        return "\n"
+    if name == "img":
+        src = node.get("src")
+        return f"![{node.get('alt', '').strip()}]({urljoin(base_url, src)})" if src else ""
+
+    text = "".join(_inline(child, base_url) for child in node.children)
+    if name == "a" and node.get("href") and text.strip():
+        return f"[{text.strip()}]({urljoin(base_url, node['href'])})"
+    if name in ("strong", "b") and text.strip():
+        return f"**{text.strip()}**"
+    if name in ("em", "i") and text.strip():
+        return f"*{text.strip()}*"
+    if name == "code" and node.parent is not None and node.parent.name != "pre":
+        return f"`{text}`"
+    return text
+
+
+def _table(node, base_url):
+    rows = []
+    for tr in node.find_all("tr"):
+        cells = [" ".join(_inline(cell, base_url).split()).replace("|", "\\|") for cell in tr.find_all(["th", "td"])]
+        if cells:
+            rows.append(cells)
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    lines = ["| " + " | ".join(rows[0]) + " |", "|" + " --- |" * width]
+    lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    return "\n".join(lines)
+
+
+def _blocks(node, base_url, out, list_depth=0):
+    from bs4 import NavigableString, Tag
+
+    inline = []
+
+    def flush():
+        text = "".join(inline).strip()
+        if text:
+            out.append(text)
+        inline.clear()
+
+    for child in node.children:
+        if isinstance(child, NavigableString) or not isinstance(child, Tag):
+            inline.append(_inline(child, base_url))
+            continue
+
+        name = child.name
+        if re.fullmatch(r"h[1-6]", name):
+            flush()
+            text = " ".join(_inline(child, base_url).split())
+            if text:
+                out.append("#" * int(name[1]) + " " + text)
+        elif name in ("ul", "ol"):
+            flush()
+            for i, item in enumerate(child.find_all("li", recursive=False), 1):
+                marker = f"{i}." if name == "ol" else "-"
+                nested = []
+                _blocks(item, base_url, nested, list_depth + 1)
+                text = "\n".join(nested).strip()
+                if text:
+                    indent = "  " * list_depth
+                    out.append(indent + marker + " " + text.replace("\n", "\n" + indent + "  "))
+        elif name == "table":
+            flush()
+            table = _table(child, base_url)
+            if table:
+                out.append(table)
+        elif name == "pre":
+            flush()
+            out.append("```\n" + child.get_text().strip("\n") + "\n```")
+        elif name == "hr":
+            flush()
+            out.append("---")
+        elif name in BLOCK_TAGS or name == "li":
+            flush()
+            _blocks(child, base_url, out, list_depth)
+        else:
+            inline.append(_inline(child, base_url))
+    flush()
+
+
+def convert_page(html, base_url=""):
+    """(markdown, links) for a page.
+
+    The markdown covers the page's main content (its <main> or <article>,
+    else <body>); `links` are the absolute URLs of every <a href> on the
+    page, menus included, for discovering more pages.
+    """
+    soup = parse_html(html)
+    links = [urljoin(base_url, a["href"]) for a in soup.find_all("a", href=True)]
+    for tag in soup(DROPPED_TAGS):
+        tag.decompose()
+    root = soup.find("main") or soup.find("article") or soup.body or soup
+
+    out = []
+    _blocks(root, base_url, out)
+    return BLANK_LINES_RE.sub("\n\n", "\n\n".join(out)).strip(), links
@@ -0,0 +1,379 @@
+"""Incremental, resumable crawler for the PTI website.
+
+    python -m crawler.site_crawler [--ingest] [--max-pages N] [seed_url ...]
+
+Pages are fetched by a bounded pool of async workers, following links on
+the seed's host. Every fetch sends the ETag / Last-Modified seen last time,
+so unchanged pages cost a 304. Per-URL state goes to an append-only JSONL
+crawl ledger, and changed pages are appended to a JSONL pages file (later
+lines for a URL win; see rag/corpus.py). A page that a complete crawl no
+longer reaches is gone, like one answering 404. An interrupted run picks up
+where it stopped. With --ingest, a crawl that changed anything rebuilds the chunk
+store (and the local index, if built) from the pages file and brings the
+LightRAG store in line with it (rag/ingest.py), exactly as ingesting the
+chunk store does.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from urllib.parse import urldefrag, urlsplit
+
+from crawler.html_markdown import convert_page
+
+
+CRAWL_SEED_URL = os.getenv("CRAWL_SEED_URL", "https://pti.edu.ng")
+CRAWL_OUTPUT = os.path.abspath(os.getenv("CRAWL_OUTPUT", "./data/pti_pages.jsonl"))
+CRAWL_LEDGER = os.path.abspath(os.getenv("CRAWL_LEDGER", "./data/crawl_ledger.jsonl"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "2000"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "20"))  # seconds per request
+CRAWL_MAX_RETRIES = int(os.getenv("CRAWL_MAX_RETRIES", "2"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "PTI-Chatbot-Crawler/1.0 (+https://pti.edu.ng)")
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+GONE_STATUS_CODES = frozenset({404, 410})
+SKIPPED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".zip", ".doc", ".docx",
+                      ".xls", ".xlsx", ".ppt", ".pptx", ".mp3", ".mp4", ".css", ".js", ".xml")
+
+# Outcome of a fetch, as recorded in the ledger.
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+GONE = "gone"
+SKIPPED = "skipped"
+FAILED = "failed"
+# Cleared when a page is gone, so it counts as changed if it comes back.
+FORGET = {"etag": None, "last_modified": None, "content_hash": None}
+
+
+def normalize_url(url):
+    """Drop the fragment, query and trailing slash, so each page has one key."""
+    url = urldefrag(url)[0].split("?", 1)[0]
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/")
+    return f"{parts.scheme}://{parts.netloc.lower()}{path}"
+
+
+def is_crawlable(url, host):
+    parts = urlsplit(url)
+    return (parts.scheme in ("http", "https") and parts.netloc.lower() == host
+            and not parts.path.lower().endswith(SKIPPED_EXTENSIONS))
+
+
+def markdown_hash(markdown):
+    return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+
+def append_jsonl(path, records):
+    with open(path, "a", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        file.flush()
+
+
+def rewrite_jsonl(path, records):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+class CrawlLedger:
+    """Append-only JSONL record of each URL's last fetch and of crawl runs.
+
+    Each fetch appends one line, so recording state is cheap and survives
+    an interrupted run; the latest line for a URL wins. `compact` rewrites
+    the file with one line per URL once a run is done.
+    """
+
+    def __init__(self, path=CRAWL_LEDGER):
+        self.path = path
+        self.entries = {}
+        self.run = None
+        self.run_finished = True
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash.
+                        continue
+                    if "url" in record:
+                        self.entries[record["url"]] = record
+                    elif record.get("event") == "start":
+                        self.run, self.run_finished = record["run"], False
+                    elif record.get("event") == "finish":
+                        self.run_finished = True
+
+    def begin_run(self):
+        """Resume the last run if it was interrupted, else start a new one."""
+        if self.run is not None and not self.run_finished:
+            print(f"Resuming crawl run {self.run}")
+            return self.run
+        # Run ids are timestamps, kept increasing for runs in the same second.
+        self.run, self.run_finished = max(int(time.time()), (self.run or 0) + 1), False
+        append_jsonl(self.path, [{"event": "start", "run": self.run}])
+        return self.run
+
+    def finish_run(self):
+        self.run_finished = True
+        append_jsonl(self.path, [{"event": "finish", "run": self.run}])
+
+    def record(self, url, **state):
+        entry = {**self.entries.get(url, {}), **state, "url": url, "run": self.run, "fetched_at": time.time()}
+        self.entries[url] = entry
+        append_jsonl(self.path, [entry])
+        return entry
+
+    def compact(self):
+        records = list(self.entries.values())
+        if self.run is not None:
+            records.append({"event": "start", "run": self.run})
+            if self.run_finished:
+                records.append({"event": "finish", "run": self.run})
+        rewrite_jsonl(self.path, records)
+
+
+class CrawlResult:
+
+    def __init__(self, changed=None, gone=None, unchanged=0, failed=0):
+        self.changed = changed or []  # {url, markdown} pages
+        self.gone = gone or []  # URLs
+        self.unchanged = unchanged
+        self.failed = failed
+
+    def summary(self):
+        return {"changed": len(self.changed), "gone": len(self.gone), "unchanged": self.unchanged, "failed": self.failed}
+
+
+class SiteCrawler:
+
+    def __init__(self, seeds=(CRAWL_SEED_URL,), output=CRAWL_OUTPUT, ledger=None, concurrency=CRAWL_CONCURRENCY,
+                 max_pages=CRAWL_MAX_PAGES, timeout=CRAWL_TIMEOUT, max_retries=CRAWL_MAX_RETRIES, client=None):
+        self.seeds = [normalize_url(url) for url in seeds]
+        self.host = urlsplit(self.seeds[0]).netloc.lower()
+        self.output = output
+        self.ledger = ledger or CrawlLedger()
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.client = client
+
+        self._seen = set()
+        self._queue = None
+        # Set when max_pages cut the crawl short, so not every page was reached.
+        self._truncated = False
+        # Without the pages file, what the ledger says we have is gone too.
+        self._have_output = False
+
+    def _enqueue(self, url):
+        url = normalize_url(url)
+        if url in self._seen or not is_crawlable(url, self.host):
+            return
+        if len(self._seen) >= self.max_pages:
+            self._truncated = True
+            return
+        self._seen.add(url)
+        self._queue.put_nowait(url)
+
+    def _conditional_headers(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def _get(self, client, url, headers):
+        import httpx
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.get(url, headers=headers)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                    return response
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError):
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+    async def _visit(self, client, url, run):
+        entry = self.ledger.entries.get(url, {})
+        if entry.get("run") == run:
+            # Already fetched earlier in this (resumed) run.
+            for link in entry.get("links", []):
+                self._enqueue(link)
+            return
+
+        if not self._have_output:
+            entry = {}
+        try:
+            response = await self._get(client, url, self._conditional_headers(entry))
+        except Exception as e:
+            print(f"Could not fetch {url}: {e}")
+            self.ledger.record(url, outcome=FAILED, error=str(e))
+            return
+
+        if response.status_code == 304:
+            self.ledger.record(url, outcome=UNCHANGED, status=304)
+        elif response.status_code in GONE_STATUS_CODES:
+            self.ledger.record(url, outcome=GONE, status=response.status_code, links=[], **FORGET)
+        elif response.status_code != 200:
+            self.ledger.record(url, outcome=FAILED, status=response.status_code)
+        elif "html" not in response.headers.get("content-type", ""):
+            self.ledger.record(url, outcome=SKIPPED, status=200, links=[], **FORGET)
+        else:
+            markdown, links = convert_page(response.text, str(response.url))
+            links = sorted({normalize_url(link) for link in links if is_crawlable(normalize_url(link), self.host)})
+            digest = markdown_hash(markdown)
+            changed = bool(markdown) and digest != entry.get("content_hash")
+            if changed:
+                append_jsonl(self.output, [{"url": url, "markdown": markdown}])
+            self.ledger.record(
+                url,
+                outcome=CHANGED if changed else UNCHANGED,
+                status=200,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+                content_hash=digest,
+                links=links,
+            )
+
+        for link in self.ledger.entries[url].get("links", []):
+            self._enqueue(link)
+
+    async def _worker(self, client, run):
+        while True:
+            url = await self._queue.get()
+            try:
+                await self._visit(client, url, run)
+            except Exception as e:
+                print(f"Crawling {url} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def acrawl(self):
+        """Crawl the site; return the pages that changed and the URLs now gone."""
+        import httpx
+
+        os.makedirs(os.path.dirname(self.output) or ".", exist_ok=True)
+        self._have_output = os.path.exists(self.output)
+        run = self.ledger.begin_run()
+        self._seen, self._queue, self._truncated = set(), asyncio.Queue(), False
+        for url in self.seeds:
+            self._enqueue(url)
+
+        client = self.client or httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            headers={"User-Agent": CRAWL_USER_AGENT},
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        workers = [asyncio.create_task(self._worker(client, run)) for _ in range(self.concurrency)]
+        try:
+            await self._queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self.client is None:
+                await client.aclose()
+
+        if not self._truncated:
+            self.forget_unreached(run)
+        result = self.collect(run)
+        self.ledger.finish_run()
+        self.ledger.compact()
+        compact_pages(self.output, gone=set(result.gone))
+        return result
+
+    def crawl(self):
+        return asyncio.run(self.acrawl())
+
+    def forget_unreached(self, run):
+        """Mark as gone the known pages that no link led to in a complete `run`."""
+        for url, entry in list(self.ledger.entries.items()):
+            if entry.get("run") != run and entry.get("outcome") != GONE:
+                self.ledger.record(url, outcome=GONE, status=None, links=[], **FORGET)
+
+    def collect(self, run):
+        """Outcomes of `run`, including the part done before a resume."""
+        visited = [entry for entry in self.ledger.entries.values() if entry.get("run") == run]
+        changed_urls = {entry["url"] for entry in visited if entry.get("outcome") == CHANGED}
+        pages = {}
+        if changed_urls and os.path.exists(self.output):
+            from rag.corpus import read_jsonl
+            for page in read_jsonl(self.output):
+                if page["url"] in changed_urls:
+                    pages[page["url"]] = page
+        return CrawlResult(
+            changed=list(pages.values()),
+            gone=[entry["url"] for entry in visited if entry.get("outcome") == GONE],
+            unchanged=sum(entry.get("outcome") == UNCHANGED for entry in visited),
+            failed=sum(entry.get("outcome") == FAILED for entry in visited),
+        )
+
+
+def compact_pages(path, gone=frozenset()):
+    """Rewrite the pages file with one line per URL, dropping gone pages."""
+    if not os.path.exists(path):
+        return
+    from rag.corpus import read_jsonl
+
+    lines = read_jsonl(path)
+    pages = {page["url"]: page for page in lines if page["url"] not in gone}
+    if len(pages) < len(lines):
+        rewrite_jsonl(path, pages.values())
+
+
+def crawl_site(seeds=(CRAWL_SEED_URL,), **kwargs):
+    return SiteCrawler(seeds, **kwargs).crawl()
+
+
+def rebuild_corpus(pages_path=CRAWL_OUTPUT):
+    """Rebuild the chunk store, and the local index if one is built, from
+    the crawled pages. Returns the compacted pages LightRAG ingests."""
+    from rag.chunk_store import ChunkStore, write_chunk_store
+    from rag.chunker import chunk_pages
+    from rag.corpus import load_pages
+    from retrieval.hybrid_retriever import build_index, local_index_exists
+
+    # Boilerplate is found across the whole site, not just the changed pages.
+    write_chunk_store(chunk_pages(load_pages(pages_path)))
+    store = ChunkStore()
+    if local_index_exists():
+        from rag.embedding_service import get_embedding_service
+        build_index(store, embed=get_embedding_service().encode)
+    return store.pages()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl the PTI website into a JSONL pages file.")
+    parser.add_argument("seeds", nargs="*", default=[CRAWL_SEED_URL])
+    parser.add_argument("--max-pages", type=int, default=CRAWL_MAX_PAGES)
+    parser.add_argument("--concurrency", type=int, default=CRAWL_CONCURRENCY)
+    parser.add_argument("--ingest", action="store_true",
+                        help="rebuild the chunk store and local index and update the LightRAG store")
+    args = parser.parse_args()
+
+    result = crawl_site(args.seeds, max_pages=args.max_pages, concurrency=args.concurrency)
+    print(f"Crawl done: {result.summary()}, pages in {CRAWL_OUTPUT}")
+
+    if args.ingest and (result.changed or result.gone):
+        from rag.ingest import ingest_pages
+        from rag.rag_agent_func import rag as init_rag
+
+        # Same pages, and so the same content hashes, as
+        # rag_insert_data_to_db: only pages whose stripped text changed are
+        # re-inserted, and pages no longer crawled are deleted.
+        pages = rebuild_corpus()
+        plan = ingest_pages(init_rag(), pages)
+        print(f"Ingest done: {plan.summary()}")
@@ -6,5 +6,8 @@ create table chat_history (
   timestamp timestamptz not null default now()
 );
 
--- Optional: Index for faster queries by user
-create index idx_chat_history_user_id on chat_history(user_id);
\ No newline at end of file
+-- Serves the keyset-paginated history query:
+--   where user_id = ? [and (timestamp, id) < (?, ?)] order by timestamp desc, id desc limit ?
+create index idx_chat_history_user_timestamp on chat_history(user_id, timestamp desc, id desc);
+-- Existing databases: the composite index also serves plain user_id lookups.
+-- drop index if exists idx_chat_history_user_id;
@@ -0,0 +1,132 @@
+import os
+import time
+import hashlib
+import datetime
+import threading
+
+from dotenv import load_dotenv
+
+from llm.provider import get_llm_provider, model_for
+
+
+load_dotenv()
+
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))  # seconds
+# Extend a cache this long before it expires rather than risk a turn
+# hitting an expired handle.
+CONTEXT_CACHE_REFRESH_MARGIN = 120
+# Status codes Gemini answers with when a cached-content handle is gone.
+CACHE_GONE_STATUS_CODES = frozenset({403, 404})
+
+
+def content_digest(contents):
+    digest = hashlib.sha256()
+    for part in contents:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def is_cache_gone(error):
+    return getattr(error, "code", None) in CACHE_GONE_STATUS_CODES
+
+
+def _expires_at(cache):
+    # Seconds on the time.time() clock; 0 when the API did not say.
+    expire_time = getattr(cache, "expire_time", None)
+    return expire_time.timestamp() if isinstance(expire_time, datetime.datetime) else 0.0
+
+
+class ContextCache:
+    """Registers a large, rarely changing context with Gemini's cached-content API.
+
+    `handle(contents)` returns the name of a cache holding `contents`, to be
+    sent as `cached_content=` instead of the contents themselves. Caches are
+    keyed by a hash of the contents (in their display name, so other
+    processes and restarts find and reuse them), extended shortly before
+    their TTL runs out, and re-created once expired.
+    """
+
+    def __init__(self, task, provider=None, ttl=CONTEXT_CACHE_TTL, refresh_margin=CONTEXT_CACHE_REFRESH_MARGIN):
+        self.task = task
+        self.provider = provider or get_llm_provider()
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+
+        # digest -> (cache name, expires at)
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self.provider.client
+
+    def display_name(self, digest):
+        return f"pti-{self.task}-{digest[:16]}"
+
+    def handle(self, contents):
+        digest = content_digest(contents)
+        with self._lock:
+            name, expires_at = self._handles.get(digest, (None, 0.0))
+            now = time.time()
+            if name and expires_at - now > self.refresh_margin:
+                return name
+
+            cache = None
+            if name and expires_at > now:
+                cache = self._extend(name)
+            if cache is None:
+                cache = self._find(digest) or self._create(digest, contents)
+            self._handles[digest] = (cache.name, _expires_at(cache) or now + self.ttl)
+            return cache.name
+
+    def invalidate(self, name):
+        """Forget a handle the API reported as gone."""
+        with self._lock:
+            for digest, (cached_name, _) in list(self._handles.items()):
+                if cached_name == name:
+                    del self._handles[digest]
+
+    def _extend(self, name):
+        from google.genai import types
+        try:
+            return self.client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+        except Exception as e:
+            print(f"Could not extend context cache {name}: {e}")
+            return None
+
+    def _find(self, digest):
+        # A cache another process (or an earlier run) created for the same
+        # contents and model.
+        model = model_for(self.task)
+        display_name = self.display_name(digest)
+        try:
+            for cache in self.client.caches.list():
+                if cache.display_name == display_name and (cache.model or "").endswith(model) \
+                        and _expires_at(cache) - time.time() > self.refresh_margin:
+                    return cache
+        except Exception as e:
+            print(f"Could not list context caches: {e}")
+        return None
+
+    def _create(self, digest, contents):
+        from google.genai import types
+        print(f"Uploading context cache {self.display_name(digest)}")
+        return self.client.caches.create(
+            model=model_for(self.task),
+            config=types.CreateCachedContentConfig(
+                ttl=f"{self.ttl}s", display_name=self.display_name(digest), contents=list(contents)),
+        )
+
+
+_context_caches = {}
+_context_caches_lock = threading.Lock()
+
+
+def get_context_cache(task):
+    """Return the process-wide context cache for `task`."""
+    if task not in _context_caches:
+        with _context_caches_lock:
+            if task not in _context_caches:
+                _context_caches[task] = ContextCache(task)
+    return _context_caches[task]
@@ -0,0 +1,169 @@
+import time
+import asyncio
+import datetime
+import itertools
+
+
+DEFAULT_FAKE_ANSWER = (
+    "The Petroleum Training Institute (PTI) is located in Effurun, Delta State, Nigeria. "
+    "It offers National Diploma and Higher National Diploma programmes in petroleum "
+    "and allied engineering disciplines."
+)
+
+
+class FakeResponse:
+    """Mimics the parts of `types.GenerateContentResponse` the agents read."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeAPIError(Exception):
+    """Carries an HTTP status `code` like `google.genai.errors.APIError`."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeCachedContent:
+
+    def __init__(self, name, display_name, model, contents, expire_time):
+        self.name = name
+        self.display_name = display_name
+        self.model = model
+        self.contents = contents
+        self.expire_time = expire_time
+        self.usage_metadata = None
+
+
+def _field(config, name):
+    if isinstance(config, dict):
+        return config.get(name)
+    return getattr(config, name, None)
+
+
+def _expire_time(config):
+    ttl = _field(config, "ttl") or "3600s"
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=float(ttl.rstrip("s")))
+
+
+class FakeCaches:
+    """Emulates the cached-content API: handles that expire after their TTL."""
+
+    def __init__(self):
+        self._caches = {}
+        self._ids = itertools.count(1)
+        self.created = 0
+
+    def _live(self, name):
+        cache = self._caches.get(name)
+        if cache is None or cache.expire_time <= datetime.datetime.now(datetime.timezone.utc):
+            self._caches.pop(name, None)
+            raise FakeAPIError(404, f"CachedContent not found: {name}")
+        return cache
+
+    def create(self, *, model, config=None):
+        name = f"cachedContents/fake-{next(self._ids)}"
+        self._caches[name] = FakeCachedContent(
+            name, _field(config, "display_name"), model, _field(config, "contents"), _expire_time(config))
+        self.created += 1
+        return self._caches[name]
+
+    def get(self, *, name, config=None):
+        return self._live(name)
+
+    def update(self, *, name, config=None):
+        cache = self._live(name)
+        cache.expire_time = _expire_time(config)
+        return cache
+
+    def delete(self, *, name, config=None):
+        self._live(name)
+        del self._caches[name]
+
+    def list(self, *, config=None):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return [cache for cache in self._caches.values() if cache.expire_time > now]
+
+
+class FakeModels:
+
+    def __init__(self, text=DEFAULT_FAKE_ANSWER, first_token_delay=0.0, token_delay=0.0, caches=None):
+        self.text = text
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.caches = caches
+        self.calls = []
+
+    def _check_cache(self, config):
+        # Like Gemini, refuse a cached-content handle that has expired.
+        name = _field(config, "cached_content")
+        if name and self.caches is not None:
+            self.caches.get(name=name)
+
+    def _tokens(self):
+        # Split on spaces but keep them attached so the chunks join back
+        # into exactly `self.text`.
+        words = self.text.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def generate_content(self, *, model, contents, config=None):
+        self.calls.append({"model": model, "contents": contents, "config": config, "stream": False})
+        self._check_cache(config)
+        time.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+        return FakeResponse(self.text)
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        self.calls.append({"model": model, "contents": contents, "config": config, "stream": True})
+        self._check_cache(config)
+        time.sleep(self.first_token_delay)
+        for token in self._tokens():
+            yield FakeResponse(token)
+            time.sleep(self.token_delay)
+
+
+class FakeAsyncModels:
+
+    def __init__(self, models):
+        self.models = models
+
+    async def generate_content(self, *, model, contents, config=None):
+        self.models.calls.append({"model": model, "contents": contents, "config": config, "stream": False})
+        self.models._check_cache(config)
+        await asyncio.sleep(self.models.first_token_delay + self.models.token_delay * len(self.models._tokens()))
+        return FakeResponse(self.models.text)
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        # Like the real client this is a coroutine returning an async iterator.
+        self.models.calls.append({"model": model, "contents": contents, "config": config, "stream": True})
+        self.models._check_cache(config)
+
+        async def stream():
+            await asyncio.sleep(self.models.first_token_delay)
+            for token in self.models._tokens():
+                yield FakeResponse(token)
+                await asyncio.sleep(self.models.token_delay)
+
+        return stream()
+
+
+class FakeAio:
+
+    def __init__(self, models):
+        self.models = FakeAsyncModels(models)
+
+
+class FakeGenAIClient:
+    """Offline stand-in for `genai.Client`.
+
+    Returns a canned answer, optionally word by word with a configurable
+    first-token and per-token delay, so the streaming UI and agents can be
+    exercised without a Google API key or network access. `caches` stands
+    in for the cached-content API used by the CAG backend.
+    """
+
+    def __init__(self, text=DEFAULT_FAKE_ANSWER, first_token_delay=0.0, token_delay=0.0):
+        self.caches = FakeCaches()
+        self.models = FakeModels(text, first_token_delay, token_delay, self.caches)
+        self.aio = FakeAio(self.models)
@@ -0,0 +1,199 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# Total prompt size the agents aim for: system prompt, question, history
+# and retrieved context together.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Upper bound for the history part (summary + verbatim turns).
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Most recent turns (user + assistant message pairs) kept word for word.
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "300"))
+# "extractive" (local, no model call) or "llm" (the provider's summary model)
+HISTORY_SUMMARIZER = os.getenv("HISTORY_SUMMARIZER", "extractive")
+SUMMARY_CACHE_SIZE = 1024
+
+CHARS_PER_TOKEN = 4
+SUMMARY_LINE_CHARS = 200
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token for Gemini).
+
+    Good enough for budgeting; counting exactly would cost an API call.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 3)].rstrip() + "..."
+
+
+def render_messages(messages):
+    return "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def extractive_summary(summary, messages, max_tokens=SUMMARY_TOKEN_BUDGET):
+    """Append the first sentence of each message to the running summary.
+
+    The oldest lines are dropped once the summary exceeds `max_tokens`.
+    """
+    lines = summary.split("\n") if summary else []
+    for message in messages:
+        content = " ".join(str(message["content"]).split())
+        first_sentence = SENTENCE_END_RE.split(content, 1)[0]
+        lines.append(f"{message['role']}: {first_sentence[:SUMMARY_LINE_CHARS]}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class LLMSummarizer:
+    """Fold messages into the running summary with a small model."""
+
+    def __init__(self, provider=None, max_tokens=SUMMARY_TOKEN_BUDGET):
+        if provider is None:
+            from llm.provider import get_llm_provider
+            provider = get_llm_provider()
+        self.provider = provider
+        self.max_tokens = max_tokens
+
+    def __call__(self, summary, messages):
+        prompt = f"""
+        Update the summary of a conversation between a user and the PTI chatbot with the new messages.
+        Keep names, numbers and open questions. Answer with the updated summary only.
+
+        ---Summary---
+        {summary or "(empty)"}
+
+        ---New messages---
+        {render_messages(messages)}
+        """
+        try:
+            text = self.provider.generate("summary", prompt, max_output_tokens=self.max_tokens, temperature=0.0)
+            return truncate_to_tokens(text.strip(), self.max_tokens)
+        except Exception as e:
+            print(f"History summarization failed ({e}), using an extractive summary")
+            return extractive_summary(summary, messages, self.max_tokens)
+
+
+class HistoryManager:
+    """Keeps conversation history inside a token budget.
+
+    The last `keep_turns` turns are kept verbatim; everything older is
+    folded into a rolling summary. Summaries are cached by a hash chain over
+    the folded messages, so each turn only summarizes the messages that
+    dropped out of the verbatim window since the previous turn, and the
+    cache is safe to share between sessions.
+    """
+
+    def __init__(self, summarize=None, keep_turns=HISTORY_KEEP_TURNS, history_budget=HISTORY_TOKEN_BUDGET,
+                 summary_budget=SUMMARY_TOKEN_BUDGET, prompt_budget=PROMPT_TOKEN_BUDGET,
+                 cache_size=SUMMARY_CACHE_SIZE):
+        self.summarize = summarize or extractive_summary
+        self.keep_turns = keep_turns
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        self.prompt_budget = prompt_budget
+        self.cache_size = cache_size
+
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def summary_of(self, messages):
+        """Return the rolling summary of `messages`, reusing cached prefixes."""
+        if not messages:
+            return ""
+
+        chain = []
+        digest = b""
+        for message in messages:
+            digest = hashlib.sha1(digest + f"{message['role']}\0{message['content']}".encode("utf-8")).digest()
+            chain.append(digest)
+
+        with self._lock:
+            start, summary = 0, ""
+            for i in range(len(chain) - 1, -1, -1):
+                if chain[i] in self._summaries:
+                    start, summary = i + 1, self._summaries[chain[i]]
+                    self._summaries.move_to_end(chain[i])
+                    break
+
+        if start < len(messages):
+            summary = self.summarize(summary, messages[start:])
+            with self._lock:
+                self._summaries[chain[-1]] = summary
+                while len(self._summaries) > self.cache_size:
+                    self._summaries.popitem(last=False)
+        return summary
+
+    def compact(self, history, max_tokens=None):
+        """Render `history` as text of at most `max_tokens` tokens.
+
+        If the verbatim turns alone are too long, the oldest of them move
+        into the summary until the rest fits next to it.
+        """
+        max_tokens = self.history_budget if max_tokens is None else min(max_tokens, self.history_budget)
+        history = [message for message in history or [] if message.get("content")]
+        if max_tokens <= 0 or not history:
+            return ""
+
+        split = max(0, len(history) - 2 * self.keep_turns)
+        recent_budget = max_tokens - self.summary_budget
+        while split < len(history) - 1 and estimate_tokens(render_messages(history[split:])) > recent_budget:
+            split += 1
+
+        summary = self.summary_of(history[:split])
+        recent = render_messages(history[split:])
+        text = f"Summary of the earlier conversation:\n{summary}\n\n{recent}" if summary else recent
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        # Still too long (one huge message): keep the end, where the
+        # latest messages are.
+        return "..." + text[-(max_tokens * CHARS_PER_TOKEN - 3):]
+
+    def fit(self, reserved, history, context=(), text_of=str):
+        """Split the prompt budget between history and retrieved context.
+
+        `reserved` is the token count of everything else in the prompt
+        (instructions and the question). History gets up to its own budget
+        first; context items, best first, are kept while they fit in what
+        is left, though the best one is always kept. Returns
+        (history_text, kept_context).
+        """
+        available = self.prompt_budget - reserved
+        history_text = self.compact(history, available)
+        available -= estimate_tokens(history_text)
+
+        kept = []
+        for item in context:
+            tokens = estimate_tokens(text_of(item))
+            if tokens > available and kept:
+                break
+            kept.append(item)
+            available -= tokens
+        return history_text, kept
+
+
+_history_manager = None
+_history_manager_lock = threading.Lock()
+
+
+def get_history_manager():
+    """Return the process-wide history manager."""
+    global _history_manager
+    if _history_manager is None:
+        with _history_manager_lock:
+            if _history_manager is None:
+                summarize = LLMSummarizer() if HISTORY_SUMMARIZER == "llm" else None
+                _history_manager = HistoryManager(summarize)
+    return _history_manager
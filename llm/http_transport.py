@@ -0,0 +1,42 @@
+"""An httpx async transport that keeps one connection pool per event loop.
+
+Pooled connections belong to the event loop that opened them. The agents
+run async LLM calls on more than one loop (`asyncio.run` per turn in
+LmmaIndexAgent, LightRAG's per-thread loops), so a single shared pool
+hands out connections whose loop has closed ("Event loop is closed",
+"attached to a different loop"). This transport gives each running loop
+its own pool, created on first use and dropped with the loop.
+"""
+import asyncio
+import threading
+import weakref
+
+import httpx
+
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, **transport_args):
+        self.transport_args = transport_args
+        self._transports = weakref.WeakKeyDictionary()  # event loop -> AsyncHTTPTransport
+        self._lock = threading.Lock()
+
+    def _transport(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self.transport_args)
+            return transport
+
+    async def handle_async_request(self, request):
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self):
+        # Other loops' pools can only be closed from their own loop; they go
+        # when the loop does.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
@@ -0,0 +1,278 @@
+import os
+import time
+import random
+import asyncio
+import itertools
+import threading
+
+from dotenv import load_dotenv
+
+from llm.history import estimate_tokens
+from llm.scheduler import get_rate_limiter
+from observability.metrics import LLM_FIRST_TOKEN_SECONDS, record_tokens, span
+
+
+load_dotenv()
+
+# "gemini", or "fake" for the deterministic offline client in llm/fake_llm.py
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # seconds per attempt
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))  # seconds per call, retries included
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+# Simulated latency of the fake provider, in seconds.
+LLM_FAKE_FIRST_TOKEN_DELAY = float(os.getenv("LLM_FAKE_FIRST_TOKEN_DELAY", "0"))
+LLM_FAKE_TOKEN_DELAY = float(os.getenv("LLM_FAKE_TOKEN_DELAY", "0"))
+
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 8.0
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Model used for each task. Override one with LLM_MODEL_<TASK>,
+# e.g. LLM_MODEL_RAG_ANSWER=gemini-2.0-flash.
+DEFAULT_MODELS = {
+    "answer": "gemini-1.5-flash",  # LlamaCloud private-mode answers
+    "synthesis": "gemini-2.0-flash",  # llama_index response synthesis (public mode)
+    "rag_answer": "gemini-1.5-pro",  # LightRAG answers and entity extraction
+    "keywords": "gemini-1.5-flash-8b",  # LightRAG query keyword extraction
+    "cag": "gemini-1.5-flash-8b",
+    "summary": "gemini-1.5-flash-8b",  # rolling history summaries
+}
+
+
+def model_for(task):
+    return os.getenv(f"LLM_MODEL_{task.upper()}", DEFAULT_MODELS[task])
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+
+    import httpx
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+def http_options(timeout=LLM_TIMEOUT):
+    """One pooled, keep-alive HTTP configuration for every Gemini client."""
+    import httpx
+    from google.genai import types
+
+    from llm.http_transport import LoopLocalTransport
+
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+    return types.HttpOptions(
+        timeout=int(timeout * 1000),
+        client_args={"limits": limits},
+        # Passing a transport makes google-genai use its pooled httpx client
+        # for async calls too, instead of one aiohttp session per request
+        # when aiohttp happens to be installed (LightRAG pulls it in). The
+        # pool is per event loop, since async calls run on several.
+        async_client_args={"transport": LoopLocalTransport(limits=limits)},
+    )
+
+
+def create_client():
+    if LLM_PROVIDER == "fake":
+        from llm.fake_llm import FakeGenAIClient
+        return FakeGenAIClient(first_token_delay=LLM_FAKE_FIRST_TOKEN_DELAY, token_delay=LLM_FAKE_TOKEN_DELAY)
+
+    from google import genai
+    return genai.Client(api_key=os.getenv("GOOGLE_API_KEY"), http_options=http_options())
+
+
+class LLMProvider:
+    """The one way the agents talk to an LLM.
+
+    Wraps a single shared google-genai client (or the offline fake). Each
+    call names a task rather than a model; `model_for` routes it. Every call
+    has a deadline: attempts are individually timed out, and failures with
+    429/5xx or network errors are retried with jittered exponential backoff
+    while the deadline allows. Streams are only retried before their first
+    chunk, since text already shown cannot be taken back. Every attempt
+    first takes a token from the provider's rate limiter.
+    """
+
+    def __init__(self, client=None, timeout=LLM_TIMEOUT, deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES):
+        self.client = client if client is not None else create_client()
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.rate_limit = get_rate_limiter(LLM_PROVIDER)
+
+    def _contents(self, prompt):
+        # A prompt may also be a list of parts (CAG sends the site first).
+        return prompt if isinstance(prompt, list) else [prompt]
+
+    def _config(self, timeout, max_output_tokens, temperature, config):
+        from google.genai import types
+        return types.GenerateContentConfig(
+            max_output_tokens=max_output_tokens,
+            temperature=temperature,
+            http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+            **config,
+        )
+
+    def _record_usage(self, task, prompt, text, usage):
+        # Gemini reports exact counts; the fake client does not.
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        completion_tokens = getattr(usage, "candidates_token_count", None)
+        if prompt_tokens is None:
+            prompt_tokens = sum(estimate_tokens(str(part)) for part in self._contents(prompt))
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(text or "")
+        record_tokens(task, prompt_tokens, completion_tokens)
+
+    def _attempt_timeout(self, deadline_at):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("LLM call deadline exceeded")
+        return min(self.timeout, remaining)
+
+    def _retry_delay(self, error, attempt, deadline_at):
+        """Seconds to wait before the next attempt, or None to give up."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        print(f"LLM call failed ({type(error).__name__}: {error}), retrying in {delay:.1f}s")
+        return delay
+
+    def generate(self, task, prompt, max_output_tokens=500, temperature=0.1, deadline=None, **config):
+        with span("generate"):
+            deadline_at = time.monotonic() + (deadline or self.deadline)
+            for attempt in itertools.count():
+                self.rate_limit.acquire(timeout=deadline_at - time.monotonic())
+                timeout = self._attempt_timeout(deadline_at)
+                try:
+                    response = self.client.models.generate_content(
+                        model=model_for(task),
+                        contents=self._contents(prompt),
+                        config=self._config(timeout, max_output_tokens, temperature, config),
+                    )
+                    self._record_usage(task, prompt, response.text, getattr(response, "usage_metadata", None))
+                    return response.text
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline_at)
+                    if delay is None:
+                        raise
+                time.sleep(delay)
+
+    async def agenerate(self, task, prompt, max_output_tokens=500, temperature=0.1, deadline=None, **config):
+        with span("generate"):
+            deadline_at = time.monotonic() + (deadline or self.deadline)
+            for attempt in itertools.count():
+                await self.rate_limit.aacquire(timeout=deadline_at - time.monotonic())
+                timeout = self._attempt_timeout(deadline_at)
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.aio.models.generate_content(
+                            model=model_for(task),
+                            contents=self._contents(prompt),
+                            config=self._config(timeout, max_output_tokens, temperature, config),
+                        ),
+                        timeout,
+                    )
+                    self._record_usage(task, prompt, response.text, getattr(response, "usage_metadata", None))
+                    return response.text
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline_at)
+                    if delay is None:
+                        raise
+                await asyncio.sleep(delay)
+
+    def stream(self, task, prompt, max_output_tokens=500, temperature=0.1, deadline=None, **config):
+        """Yield the answer's text chunks as they are generated."""
+        with span("generate"):
+            start = time.perf_counter()
+            deadline_at = time.monotonic() + (deadline or self.deadline)
+            for attempt in itertools.count():
+                self.rate_limit.acquire(timeout=deadline_at - time.monotonic())
+                timeout = self._attempt_timeout(deadline_at)
+                chunks, usage = [], None
+                try:
+                    for chunk in self.client.models.generate_content_stream(
+                        model=model_for(task),
+                        contents=self._contents(prompt),
+                        config=self._config(timeout, max_output_tokens, temperature, config),
+                    ):
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        if chunk.text:
+                            if not chunks:
+                                LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, task=task)
+                            chunks.append(chunk.text)
+                            yield chunk.text
+                    self._record_usage(task, prompt, "".join(chunks), usage)
+                    return
+                except Exception as e:
+                    delay = None if chunks else self._retry_delay(e, attempt, deadline_at)
+                    if delay is None:
+                        raise
+                time.sleep(delay)
+
+    async def astream(self, task, prompt, max_output_tokens=500, temperature=0.1, deadline=None, **config):
+        with span("generate"):
+            start = time.perf_counter()
+            deadline_at = time.monotonic() + (deadline or self.deadline)
+            for attempt in itertools.count():
+                await self.rate_limit.aacquire(timeout=deadline_at - time.monotonic())
+                timeout = self._attempt_timeout(deadline_at)
+                chunks, usage = [], None
+                try:
+                    stream = await asyncio.wait_for(
+                        self.client.aio.models.generate_content_stream(
+                            model=model_for(task),
+                            contents=self._contents(prompt),
+                            config=self._config(timeout, max_output_tokens, temperature, config),
+                        ),
+                        timeout,
+                    )
+                    async for chunk in stream:
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        if chunk.text:
+                            if not chunks:
+                                LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, task=task)
+                            chunks.append(chunk.text)
+                            yield chunk.text
+                    self._record_usage(task, prompt, "".join(chunks), usage)
+                    return
+                except Exception as e:
+                    delay = None if chunks else self._retry_delay(e, attempt, deadline_at)
+                    if delay is None:
+                        raise
+                await asyncio.sleep(delay)
+
+    def llama_index_llm(self, task="synthesis", max_tokens=512):
+        """llama_index LLM for response synthesis, routed and timed out like the rest."""
+        if LLM_PROVIDER == "fake":
+            from llama_index.core.llms import MockLLM
+            return MockLLM(max_tokens=max_tokens)
+
+        # GoogleGenAI builds its own client (and looks the model up over the
+        # network), so hand it the same pooled HTTP settings.
+        from llama_index.llms.google_genai import GoogleGenAI
+        return GoogleGenAI(
+            model=model_for(task),
+            api_key=os.getenv("GOOGLE_API_KEY"),
+            max_tokens=max_tokens,
+            max_retries=self.max_retries,
+            http_options=http_options(self.timeout),
+        )
+
+
+_llm_provider = None
+_llm_provider_lock = threading.Lock()
+
+
+def get_llm_provider():
+    """Return the process-wide LLM provider."""
+    global _llm_provider
+    if _llm_provider is None:
+        with _llm_provider_lock:
+            if _llm_provider is None:
+                _llm_provider = LLMProvider()
+    return _llm_provider
@@ -0,0 +1,285 @@
+"""Process-wide admission control in front of the chat backends.
+
+Every Streamlit session used to call LlamaCloud and Gemini on its own, so a
+burst of users asking about the same notice hit the providers' rate limits.
+Turns now go through one `ChatScheduler`:
+
+- identical in-flight stand-alone questions (same backend, mode and
+  normalized text, no earlier turns) share one upstream call, and every
+  asker receives its chunks as they arrive;
+- at most SCHEDULER_CONCURRENCY turns run at once; the rest wait in
+  per-session queues that are served round-robin, so one busy session
+  cannot starve the others;
+- each provider call takes a token from that provider's `TokenBucket`.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+from cache.semantic_cache import earlier_turns, normalize_question
+from observability.metrics import REGISTRY, STAGE_SECONDS, stats_collector
+
+
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "8"))
+
+# Requests per second and burst size per provider. Override one with
+# RATE_LIMIT_<PROVIDER> and RATE_BURST_<PROVIDER>, e.g. RATE_LIMIT_GEMINI=2;
+# a rate of 0 turns the limit off. Providers not listed are not limited.
+DEFAULT_RATE_LIMITS = {
+    "gemini": (5.0, 10),
+    "llamacloud": (5.0, 10),
+}
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by every thread and event loop.
+
+    Callers reserve a token and then sleep until it is theirs; the balance
+    may go negative, so waiting callers are served in arrival order.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+
+    def _reserve(self, timeout):
+        """Take a token; return how long to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                self.rejected += 1
+                raise TimeoutError(f"Rate limit wait of {wait:.1f}s exceeds the deadline")
+            self._tokens -= 1
+            self.acquired += 1
+            if wait:
+                self.waits += 1
+                self.wait_seconds += wait
+        return wait
+
+    def acquire(self, timeout=None):
+        wait = self._reserve(timeout)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, timeout=None):
+        import asyncio
+        wait = self._reserve(timeout)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "rejected": self.rejected,
+            }
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider):
+    """Return the process-wide token bucket for `provider`."""
+    if provider not in _rate_limiters:
+        with _rate_limiters_lock:
+            if provider not in _rate_limiters:
+                rate, burst = DEFAULT_RATE_LIMITS.get(provider, (0.0, 1))
+                rate = float(os.getenv(f"RATE_LIMIT_{provider.upper()}", rate))
+                burst = int(os.getenv(f"RATE_BURST_{provider.upper()}", burst))
+                bucket = TokenBucket(rate, burst)
+                if rate > 0:
+                    REGISTRY.add_collector(stats_collector(
+                        f"pti_rate_limit_{provider}", bucket.stats,
+                        counters=("acquired", "waits", "wait_seconds", "rejected")))
+                _rate_limiters[provider] = bucket
+    return _rate_limiters[provider]
+
+
+class Flight:
+    """Chunks of one upstream answer, readable by any number of askers.
+
+    Each iterator replays the chunks published so far and then follows the
+    answer as it is generated.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._changed = threading.Condition()
+
+    def publish(self, chunk):
+        with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    def finish(self, error=None):
+        with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    def __iter__(self):
+        i = 0
+        while True:
+            with self._changed:
+                while i >= len(self.chunks) and not self.done:
+                    self._changed.wait()
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            i += 1
+            yield chunk
+
+
+class ChatScheduler:
+    """Single-flight, fairly queued, concurrency-capped execution of turns.
+
+    `submit(key, run, session)` returns a `Flight` for the answer. If a
+    turn with the same `key` is queued or running, its flight is shared;
+    otherwise `run()` (a callable returning an iterator of chunks) is
+    queued under `session` and executed by one of `concurrency` worker
+    threads. The worker drains the answer even if every asker stops
+    reading, so it still reaches the answer cache.
+    """
+
+    def __init__(self, concurrency=SCHEDULER_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._flights = {}
+        # session -> deque of queued turns; sessions are served in order
+        # and go to the back after each turn.
+        self._queues = OrderedDict()
+        self._changed = threading.Condition()
+        self._workers = []
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.queued = 0
+        self.running = 0
+
+    def _start_workers(self):
+        while len(self._workers) < self.concurrency:
+            worker = threading.Thread(target=self._work, name=f"chat-scheduler-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def submit(self, key, run, session=None):
+        with self._changed:
+            flight = self._flights.get(key) if key is not None else None
+            if flight is not None:
+                self.coalesced += 1
+                return flight
+
+            flight = Flight()
+            if key is not None:
+                self._flights[key] = flight
+            self._queues.setdefault(session, deque()).append((key, flight, run, time.perf_counter()))
+            self.submitted += 1
+            self.queued += 1
+            self._start_workers()
+            self._changed.notify()
+        return flight
+
+    def _next(self):
+        with self._changed:
+            while not self._queues:
+                self._changed.wait()
+            session, turns = self._queues.popitem(last=False)
+            turn = turns.popleft()
+            if turns:
+                self._queues[session] = turns
+            self.queued -= 1
+            self.running += 1
+        return turn
+
+    def _work(self):
+        while True:
+            key, flight, run, submitted_at = self._next()
+            STAGE_SECONDS.observe(time.perf_counter() - submitted_at, stage="queue")
+            try:
+                for chunk in run():
+                    flight.publish(chunk)
+                flight.finish()
+            except Exception as e:
+                print(f"Scheduled turn failed: {e}")
+                flight.finish(e)
+            finally:
+                with self._changed:
+                    self.running -= 1
+                    if key is not None and self._flights.get(key) is flight:
+                        del self._flights[key]
+
+    def stats(self):
+        with self._changed:
+            return {
+                "concurrency": self.concurrency,
+                "running": self.running,
+                "queued": self.queued,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide chat scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ChatScheduler()
+                REGISTRY.add_collector(stats_collector(
+                    "pti_scheduler", _scheduler.stats, counters=("submitted", "coalesced")))
+    return _scheduler
+
+
+class ScheduledBackend:
+    """A chat backend whose streamed turns go through the scheduler.
+
+    Like the answer cache, only stand-alone questions are coalesced: a
+    follow-up is answered from its own conversation, never from another
+    asker's.
+    """
+
+    def __init__(self, backend, name, scheduler=None):
+        self.backend = backend
+        self.name = name
+        self.scheduler = scheduler or get_scheduler()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def stream_chat(self, prompt, conversation_history=[], mode=None, session=None):
+        question = normalize_question(prompt)
+        standalone = question and not earlier_turns(prompt, conversation_history)
+        key = (self.name, mode, question) if standalone else None
+        # The session keeps appending to its history; queue a snapshot.
+        history = list(conversation_history)
+        flight = self.scheduler.submit(
+            key, lambda: self.backend.stream_chat(prompt, history, mode=mode), session)
+        yield from flight
@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from cache.semantic_cache import get_answer_cache
+from observability.metrics import span
+from llmaindex.llma_index_agent import LmmaIndexAgent, LmmaIndexResponse, PUBLIC_MODE, PRIVATE_MODE, is_error_answer
+
+
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "4"))
+
+
+class AgentPool:
+    """Thread-safe pool of long-lived agents shared by every session.
+
+    Agents are created lazily up to `size`. A caller checks one out for the
+    duration of a turn and hands it back afterwards, so the expensive
+    clients and index handles are built at most `size` times per process.
+    """
+
+    def __init__(self, factory=LmmaIndexAgent, size=AGENT_POOL_SIZE, cache=None):
+        self.factory = factory
+        self.size = max(1, size)
+        self.cache = cache if cache is not None else get_answer_cache()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._warm_up_thread = None
+
+    def _create(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            with span("client_init"):
+                return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def warm_up(self, count=1, background=True):
+        """Build `count` agents ahead of the first turn."""
+        def build():
+            for _ in range(count):
+                try:
+                    agent = self._create()
+                except Exception as e:
+                    print(f"Agent warm-up failed: {e}")
+                    return
+                if agent is None:
+                    return
+                self._idle.put(agent)
+
+        if not background:
+            build()
+            return
+
+        with self._lock:
+            if self._warm_up_thread is not None:
+                return
+            self._warm_up_thread = threading.Thread(target=build, name="agent-pool-warm-up", daemon=True)
+        self._warm_up_thread.start()
+
+    def acquire(self, timeout=None):
+        # A turn that arrives mid warm-up should reuse the agent being built
+        # rather than paying for a second one.
+        warm_up_thread = self._warm_up_thread
+        if warm_up_thread is not None and warm_up_thread.is_alive():
+            warm_up_thread.join(timeout)
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        agent = self._create()
+        if agent is not None:
+            return agent
+
+        # Pool is full: wait for another session to hand an agent back.
+        return self._idle.get(timeout=timeout)
+
+    def release(self, agent):
+        self._idle.put(agent)
+
+    @contextmanager
+    def agent(self, timeout=None):
+        agent = self.acquire(timeout=timeout)
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    def chat(self, prompt, conversation_history=[], mode=None):
+        # Only single-mode turns are cached; each mode has its own namespace.
+        if mode in (PUBLIC_MODE, PRIVATE_MODE):
+            cached = self.cache.get(prompt, namespace=f"llamacloud-{mode}", conversation_history=conversation_history)
+            if cached is not None:
+                if mode == PUBLIC_MODE:
+                    return LmmaIndexResponse(rag_response=None, llma_index_answer=cached, llma_index_context=None)
+                return LmmaIndexResponse(rag_response=cached, llma_index_answer=None, llma_index_context=None)
+
+        with self.agent() as agent:
+            response = agent.chat(prompt, conversation_history, mode)
+
+        if mode in (PUBLIC_MODE, PRIVATE_MODE):
+            answer = response.llma_index_answer if mode == PUBLIC_MODE else response.rag_response
+            if not is_error_answer(answer):
+                self.cache.put(prompt, answer, namespace=f"llamacloud-{mode}",
+                               conversation_history=conversation_history)
+        return response
+
+    def stream_chat(self, prompt, conversation_history=[], mode=PUBLIC_MODE):
+        namespace = f"llamacloud-{mode}"
+        cached = self.cache.get(prompt, namespace=namespace, conversation_history=conversation_history)
+        if cached is not None:
+            yield cached
+            return
+
+        # The agent stays checked out until the caller finishes (or closes)
+        # the stream.
+        chunks = []
+        with self.agent() as agent:
+            for chunk in agent.stream_chat(prompt, conversation_history, mode):
+                chunks.append(chunk)
+                yield chunk
+
+        # A failed stream raises ChatError, so only complete answers get here.
+        self.cache.put(prompt, "".join(chunks), namespace=namespace, conversation_history=conversation_history)
+
+
+_agent_pool = None
+_agent_pool_lock = threading.Lock()
+
+
+def get_agent_pool():
+    """Return the process-wide agent pool, creating it on first use."""
+    global _agent_pool
+    if _agent_pool is None:
+        with _agent_pool_lock:
+            if _agent_pool is None:
+                _agent_pool = AgentPool()
+    return _agent_pool
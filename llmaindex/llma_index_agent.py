@@ -1,41 +1,119 @@
 import os
-from firecrawl import FirecrawlApp
-from google import genai
-from google.genai import types
-import pathlib
-import httpx
-import json
+import asyncio
 from dotenv import load_dotenv
 from llama_cloud_services import LlamaCloudIndex
-from llama_index.llms.google_genai import GoogleGenAI
+from llama_index.core import PromptTemplate, get_response_synthesizer
 import llama_cloud.core.api_error
+from dataclasses import dataclass
+
+from backends import ERROR_MESSAGE, PUBLIC_MODE, PRIVATE_MODE, ChatError
+from llm.history import estimate_tokens, get_history_manager
+from llm.provider import get_llm_provider
+from llm.scheduler import get_rate_limiter
+from observability.metrics import span
+from retrieval.hybrid_retriever import LocalHybridRetriever, get_local_retriever
+from retrieval.reranker import RERANK_CANDIDATES, RERANK_TOP_N, RERANKER, RerankingRetriever, get_reranker
 
 
 
 # Load environment variables from .env file
 load_dotenv()
 
+# "llamacloud" or "local" (see retrieval/hybrid_retriever.py)
+RETRIEVER = os.getenv("RETRIEVER", "llamacloud")
+
+UNEXPECTED_ERROR_MESSAGE = "An unexpected error occurred. please try again later ☹️!"
+
+
+QA_TEMPLATE = """
+        Context information is below.
+        ---------------------
+        {context_str}
+        ---------------------
+        Given the context information and not prior knowledge, answer the query.
+        Query: {query_str}
+        Answer: """
+
+
+def node_text(node):
+    return node.get_content()
+
+
+def is_error_answer(answer):
+    answer = str(answer)
+    return answer in (ERROR_MESSAGE, UNEXPECTED_ERROR_MESSAGE) or answer.startswith("An exception occurred")
+
+
+@dataclass
+class LmmaIndexResponse:
+    rag_response: str
+    llma_index_answer: str
+    llma_index_context: object
+
+
 class LmmaIndexAgent:
+    """Long-lived LlamaCloud agent.
 
-    def __init__(self, prompt, conversation_history=[]):
-        self.prompt = prompt
+    The clients, LLM and retriever are built once here and reused for
+    every turn. Per-request state (the prompt and conversation history) is
+    passed to `chat`/`achat` instead of the constructor, so one agent can
+    serve many Streamlit sessions.
+    """
 
-        google_api_key = os.getenv('GOOGLE_API_KEY')
+    def __init__(self, provider=None, retriever=None, llm=None, history=None):
+        self.provider = provider or get_llm_provider()
 
-        llma_index_api_key = os.getenv('LLMA_INDEX_API_KEY')
+        # GoogleGenAI looks the model up over the network when constructed.
+        self.llm = llm or self.provider.llama_index_llm(max_tokens=512)
 
-        organization_id = os.getenv('LLMA_INDEX_ORG_ID')
+        # The local index (if built) serves every turn when RETRIEVER=local,
+        # and otherwise stands in whenever LlamaCloud fails.
+        try:
+            local_retriever = get_local_retriever()
+        except ValueError as e:
+            # A stale index is fatal only when it is the configured retriever.
+            if RETRIEVER == "local":
+                raise
+            print(f"Local index unusable, running without the local fallback: {e}")
+            local_retriever = None
 
-        self.client = genai.Client(api_key=google_api_key)
+        # With a local reranker, both retrievers over-fetch candidates and
+        # the cross-encoder keeps the best RERANK_TOP_N. The model is loaded
+        # once per process; if it cannot be, LlamaCloud reranks instead.
+        self.reranker = get_reranker()
+        if self.reranker is not None:
+            self.reranker.load()
+            if not self.reranker.ready:
+                self.reranker = None
+            elif local_retriever is not None:
+                local_retriever = RerankingRetriever(
+                    LocalHybridRetriever(index=local_retriever.index, top_k=RERANK_CANDIDATES), self.reranker)
 
-        self.llm = GoogleGenAI(
-            model="gemini-2.0-flash",
-            api_key=google_api_key,
-            max_tokens=512,
-            generation_config=types.GenerateContentConfig(
-                system_instruction=self.create_system_prompt(conversation_history),
-            )
-        )
+        if retriever is None and RETRIEVER == "local":
+            retriever = local_retriever
+
+        # Only LlamaCloud calls count against its rate limit.
+        self.retrieval_limit = None
+        if retriever is None:
+            try:
+                retriever = self.create_llama_cloud_retriever()
+                self.retrieval_limit = get_rate_limiter("llamacloud")
+            except Exception as e:
+                if local_retriever is None:
+                    raise
+                print(f"LLama Cloud unavailable ({e}), using the local index")
+                retriever = local_retriever
+
+        self.retriever = retriever
+        self.fallback_retriever = local_retriever if local_retriever is not retriever else None
+
+        self.history = history or get_history_manager()
+
+
+    def create_llama_cloud_retriever(self):
+        llma_index_api_key = os.getenv('LLMA_INDEX_API_KEY')
+
+        organization_id = os.getenv('LLMA_INDEX_ORG_ID')
 
         self.llma_index = LlamaCloudIndex(
             name="pti_data",
@@ -44,64 +122,190 @@ class LmmaIndexAgent:
             api_key=llma_index_api_key,
         )
 
+        # Resolving a retriever talks to LlamaCloud, so do it once per agent.
+        if self.reranker is not None:
+            # LlamaCloud still reranks the candidates, so a turn whose local
+            # scoring misses its budget keeps a reranked order.
+            return RerankingRetriever(self.llma_index.as_retriever(
+                dense_similarity_top_k=RERANK_CANDIDATES,
+                sparse_similarity_top_k=RERANK_CANDIDATES,
+                alpha=0.5,
+                enable_reranking=True,
+                rerank_top_n=RERANK_CANDIDATES,
+                top_k=RERANK_CANDIDATES,
+            ), self.reranker)
+        return self.llma_index.as_retriever(
+            dense_similarity_top_k=3,
+            sparse_similarity_top_k=3,
+            alpha=0.5,
+            enable_reranking=RERANKER != "off",
+            rerank_top_n=RERANK_TOP_N,
+            top_n=3,
+            top_k=3,
+        )
+
+
+    def chat(self, prompt, conversation_history=[], mode=None):
+        return asyncio.run(self.achat(prompt, conversation_history, mode))
+
+
+    async def achat(self, prompt, conversation_history=[], mode=None):
+        """Answer one turn.
+
+        Retrieval runs once and its nodes feed whichever generation the mode
+        needs: PUBLIC_MODE only synthesizes `llma_index_answer`,
+        PRIVATE_MODE only produces `rag_response`, and `None` runs both
+        concurrently.
+        """
+        rag_response = None
+        llma_index_answer = None
+        llma_index_context = None
+
         try:
-            query = self.answer_query(prompt)
-            
-            self.llma_index_answer = query
+            llma_index_context = await self.aretrieve_context(prompt)
 
-            self.llma_index_context = self.retrieve_context(prompt)
+            generations = {}
+            if mode in (None, PUBLIC_MODE):
+                generations["llma_index_answer"] = self.aanswer_query(
+                    prompt, llma_index_context, conversation_history
+                )
+            if mode in (None, PRIVATE_MODE):
+                formatted_prompt = self.build_prompt(prompt, llma_index_context, conversation_history)
+                generations["rag_response"] = self.arag_response_call(formatted_prompt)
 
-            formatted_prompt = self.create_prompt(prompt, self.llma_index_context, conversation_history)
+            results = dict(zip(generations, await asyncio.gather(*generations.values())))
+            llma_index_answer = results.get("llma_index_answer")
+            rag_response = results.get("rag_response")
 
-            self.rag_response = self.rag_response_call(formatted_prompt)
+        except llama_cloud.core.api_error.ApiError as e:
+            print(f"LLama Cloud API Error: {e}")
+            rag_response = ERROR_MESSAGE
+            llma_index_answer = ERROR_MESSAGE
+            llma_index_context = ERROR_MESSAGE
+        except Exception as e:
+            rag_response = UNEXPECTED_ERROR_MESSAGE
+            llma_index_answer = UNEXPECTED_ERROR_MESSAGE
+            llma_index_context = UNEXPECTED_ERROR_MESSAGE
+
+        return LmmaIndexResponse(
+            rag_response=rag_response,
+            llma_index_answer=llma_index_answer,
+            llma_index_context=llma_index_context,
+        )
+
+
+    def stream_chat(self, prompt, conversation_history=[], mode=PUBLIC_MODE):
+        """Yield the answer for `mode` as text chunks while it is generated."""
+        try:
+            llma_index_context = self.retrieve_context(prompt)
+
+            if mode == PUBLIC_MODE:
+                yield from self.stream_answer_query(prompt, llma_index_context, conversation_history)
+            else:
+                formatted_prompt = self.build_prompt(prompt, llma_index_context, conversation_history)
+                yield from self.rag_response_stream(formatted_prompt)
 
         except llama_cloud.core.api_error.ApiError as e:
             print(f"LLama Cloud API Error: {e}")
-            self.rag_response = "Sorry, there was an error. please try again later ☹️!"
-            self.llma_index_answer = "Sorry, there was an error. please try again later ☹️!"
-            self.llma_index_context = "Sorry, there was an error. please try again later ☹️!"
+            raise ChatError(ERROR_MESSAGE) from e
         except Exception as e:
-            self.rag_response = "An unexpected error occurred. please try again later ☹️!"
-            self.llma_index_answer = "An unexpected error occurred. please try again later ☹️!"
-            self.llma_index_context = "An unexpected error occurred. please try again later ☹️!"
-        
+            print(f"Streamed answer failed: {e}")
+            raise ChatError(UNEXPECTED_ERROR_MESSAGE) from e
 
 
     def retrieve_context(self, query):
-        retriever = self.llma_index.as_retriever(
-            dense_similarity_top_k=3,
-            sparse_similarity_top_k=3,
-            alpha=0.5,
-            enable_reranking=True, 
-            rerank_top_n=3,
-            top_n=3,
-            top_k=3,
-        )
-        nodes = retriever.retrieve(query)
+        with span("retrieve"):
+            try:
+                if self.retrieval_limit is not None:
+                    self.retrieval_limit.acquire()
+                nodes = self.retriever.retrieve(query)
+            except Exception as e:
+                if self.fallback_retriever is None:
+                    raise
+                print(f"Retrieval failed ({e}), falling back to the local index")
+                nodes = self.fallback_retriever.retrieve(query)
+        return nodes
+
+
+    async def aretrieve_context(self, query):
+        with span("retrieve"):
+            try:
+                if self.retrieval_limit is not None:
+                    await self.retrieval_limit.aacquire()
+                nodes = await self.retriever.aretrieve(query)
+            except Exception as e:
+                if self.fallback_retriever is None:
+                    raise
+                print(f"Retrieval failed ({e}), falling back to the local index")
+                nodes = await self.fallback_retriever.aretrieve(query)
         return nodes
     
     
-    def answer_query(self, query):
-        query_engine = self.llma_index.as_query_engine(llm=self.llm)
-        response = query_engine.query(query)
-        return response
+    def answer_query(self, query, nodes, conversation_history=[]):
+        return asyncio.run(self.aanswer_query(query, nodes, conversation_history))
+
+
+    async def aanswer_query(self, query, nodes, conversation_history=[]):
+        # Synthesize from the nodes we already retrieved instead of letting a
+        # query engine run its own retrieval. The synthesizer is a cheap local
+        # object; the history rides along in its QA template so no
+        # per-request state lives on the agent.
+        history_text, nodes = self.fit_prompt(self.create_system_prompt("") + QA_TEMPLATE + query,
+                                              conversation_history, nodes)
+        synthesizer = get_response_synthesizer(
+            llm=self.llm,
+            text_qa_template=self.create_qa_template(history_text),
+        )
+        # Synthesis calls Gemini through llama_index, not the provider.
+        with span("generate"):
+            await self.provider.rate_limit.aacquire()
+            response = await synthesizer.asynthesize(query, nodes)
+        return str(response)
     
 
+    def stream_answer_query(self, query, nodes, conversation_history=[]):
+        history_text, nodes = self.fit_prompt(self.create_system_prompt("") + QA_TEMPLATE + query,
+                                              conversation_history, nodes)
+        synthesizer = get_response_synthesizer(
+            llm=self.llm,
+            text_qa_template=self.create_qa_template(history_text),
+            streaming=True,
+        )
+        with span("generate"):
+            self.provider.rate_limit.acquire()
+            response = synthesizer.synthesize(query, nodes)
+            yield from response.response_gen
+
+
     def rag_response_call(self, prompt):
+        return asyncio.run(self.arag_response_call(prompt))
+
+
+    async def arag_response_call(self, prompt):
         try:
             print("Fetching response")
-            response = self.client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=[prompt],
-                config=types.GenerateContentConfig(max_output_tokens=500, temperature=0.1)
-            )
-            
-            return(response.text)
+            return await self.provider.agenerate("answer", prompt, max_output_tokens=500, temperature=0.1)
 
         except Exception as e:
-            return(f'An exception occurred: {e.message}')
+            return(f'An exception occurred: {e}')
+
+
+    def rag_response_stream(self, prompt):
+        print("Streaming response")
+        yield from self.provider.stream("answer", prompt, max_output_tokens=500, temperature=0.1)
         
     
+    def fit_prompt(self, template, history, nodes):
+        # Share the prompt token budget between the conversation history
+        # (older turns summarized) and the retrieved nodes.
+        return self.history.fit(estimate_tokens(template), history, nodes, text_of=node_text)
+
+
+    def build_prompt(self, user_input, nodes, history):
+        history_text, nodes = self.fit_prompt(self.create_prompt(user_input, "", ""), history, nodes)
+        return self.create_prompt(user_input, "\n\n".join(node_text(node) for node in nodes), history_text)
+
+
     def create_prompt(self, user_input, query, history):
         prompt = f"""
         System: You are an internal chatbot for the Petroleum Training Institute (PTI) in Nigeria.  Your purpose is to provide comprehensive information about PTI to authorized internal personnel.  You have access to and can process all internal data, including but not limited to: student records (names, student IDs, academic performance, contact information, disciplinary records), faculty and staff information (names, roles, contact information, employment history), management structure (organizational charts, contact information, responsibilities), financial records (budgets, expenditures, etc.),  and any other information relevant to PTI's operations.
@@ -132,4 +336,9 @@ class LmmaIndexAgent:
          ---Conversation History---
         {history}
         """
-        return prompt
\ No newline at end of file
+        return prompt
+
+
+    def create_qa_template(self, history):
+        template = self.create_system_prompt("{history}") + QA_TEMPLATE
+        return PromptTemplate(template).partial_format(history=history)
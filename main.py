@@ -1,16 +1,149 @@
 import os
-import asyncio
+import uuid
+import itertools
 import streamlit as st
-from cag.cag_agent import CagAgent
-from rag.rag_agent_func import rag, rag_insert_data_to_db, rag_retrieve
-from llmaindex.llma_index_agent import LmmaIndexAgent
+from backends import CHAT_BACKEND, load_backend, PUBLIC_MODE, PRIVATE_MODE, ChatError
 
 # For Google Auth and Supabase
-from st_supabase_connection import SupabaseConnection, execute_query
+from st_supabase_connection import SupabaseConnection
+from storage.chat_history_store import create_chat_history_store
+from storage.chat_history_writer import ChatHistoryWriter
+from observability.metrics import LLM_TOKENS, REGISTRY, span, stage_summary, start_metrics_server, stats_collector
+from cache.faq_index import get_faq_index
+from llm.scheduler import ScheduledBackend, get_scheduler
+from retrieval.reranker import get_reranker
  # Remove incorrect import; use st.connection instead
-import pandas as pd
 import datetime
 
+# Comma-separated emails that get the metrics panel in the sidebar.
+ADMIN_EMAILS = {email.strip() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+
+@st.cache_resource(show_spinner=False)
+def load_chat_backend():
+    # One backend per server process, shared by every session. Only the
+    # backend selected with CHAT_BACKEND is imported. Warming it up here
+    # means client and index setup happens while the login screen is
+    # showing, not inside the first chat turn. Turns from all sessions go
+    # through one scheduler, which coalesces identical questions and caps
+    # concurrent upstream calls.
+    backend = load_backend()
+    if hasattr(backend, "warm_up"):
+        backend.warm_up()
+    return ScheduledBackend(backend, CHAT_BACKEND)
+
+
+def session_id():
+    # Public sessions are queued fairly under this id; private ones under
+    # the user's id.
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+@st.cache_resource(show_spinner=False)
+def load_chat_history_store():
+    return create_chat_history_store(st.connection("supabase", type=SupabaseConnection).client)
+
+
+@st.cache_resource(show_spinner=False)
+def load_chat_history_writer():
+    # One write-behind queue and worker thread per server process.
+    writer = ChatHistoryWriter(load_chat_history_store())
+    REGISTRY.add_collector(stats_collector("pti_chat_history", writer.stats, counters=("written", "retries")))
+    return writer
+
+
+def load_older_messages(user_id, before=None):
+    # Prepend the page of messages just before the oldest one loaded
+    # (the most recent page when `before` is None).
+    try:
+        with span("history_load"):
+            rows, cursor = load_chat_history_store().fetch_page(user_id, before=before)
+    except Exception as e:
+        print(f"Could not load chat history: {e}")
+        st.session_state.private_history_cursor = None
+        return
+    older = [{"role": row["role"], "content": row["content"]} for row in rows]
+    st.session_state.private_messages[:0] = older
+    st.session_state.private_history_cursor = cursor
+
+
+def faq_answer(prompt, conversation_history):
+    # Vetted answers to the most common questions skip the agents entirely,
+    # unless the question follows earlier turns.
+    faq = get_faq_index()
+    if faq is None:
+        return None
+    with span("faq"):
+        return faq.lookup(prompt, conversation_history)
+
+
+def render_messages(messages):
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+
+def wait_for_first_chunk(stream):
+    # Keep the spinner up while retrieval runs, then let st.write_stream
+    # render the rest of the answer as it is generated.
+    with st.spinner("In progress...", show_time=True):
+        first_chunk = next(stream, "")
+    return first_chunk, stream
+
+
+def write_answer(prompt, messages, mode, session):
+    """Render the answer to `prompt` as it arrives and return it.
+
+    Returns None, after showing the error, when the backend fails.
+    """
+    faq = faq_answer(prompt, messages)
+    if faq is not None:
+        st.markdown(faq)
+        return faq
+    try:
+        first_chunk, stream = wait_for_first_chunk(
+            load_chat_backend().stream_chat(prompt, messages, mode=mode, session=session)
+        )
+        return st.write_stream(itertools.chain([first_chunk], stream))
+    except ChatError as e:
+        st.error(str(e))
+        return None
+
+
+def metrics_panel():
+    # Numbers for this server process; Prometheus scrapes the same data
+    # from the /metrics endpoint.
+    from cache.semantic_cache import get_answer_cache
+
+    with st.sidebar.expander("Metrics"):
+        rows = stage_summary()
+        if rows:
+            st.table(rows)
+        else:
+            st.caption("No turns recorded yet.")
+
+        cache = get_answer_cache().stats()
+        st.caption(f"Answer cache: {cache['hit_rate']:.0%} hit rate, {cache['size']} entries")
+        faq = get_faq_index()
+        if faq is not None:
+            faq_stats = faq.stats()
+            st.caption(f"FAQ: {faq_stats['hit_rate']:.0%} hit rate, {faq_stats['size']} answers")
+        scheduler = get_scheduler().stats()
+        st.caption(f"Scheduler: {scheduler['running']}/{scheduler['concurrency']} running, "
+                   f"{scheduler['queued']} queued, {scheduler['coalesced']} coalesced")
+        reranker = get_reranker()
+        if reranker is not None:
+            rerank = reranker.stats()
+            st.caption(f"Reranker: {rerank['reranked']} reranked, {rerank['fallbacks']} fell back, "
+                       f"{rerank['cache_hits']} cached scores")
+
+        tokens = [{"task": task, "kind": kind, "tokens": value}
+                  for (task, kind), value in sorted(LLM_TOKENS.values().items())]
+        if tokens:
+            st.table(tokens)
+
 
 def login_screen():
     st.header("Welcome to PTI Chatbot")
@@ -32,21 +165,25 @@ def use_public():
 
     if "messages" not in st.session_state:
         st.session_state.messages = []
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    # The history is drawn on full reruns only; chat turns rerun just the
+    # fragment below, which appends the new turn to `transcript`.
+    transcript = st.container()
+    with transcript:
+        render_messages(st.session_state.messages)
+    public_chat(transcript)
+
+
+@st.fragment
+def public_chat(transcript):
     if prompt := st.chat_input("Ask your question about PTI Nigeria"):
         st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        with st.chat_message("assistant"):
-            with st.spinner("In progress...", show_time=True):
-                llmaIndexAgent =  LmmaIndexAgent(prompt, st.session_state.messages)
-                response = llmaIndexAgent.rag_response
-                context = llmaIndexAgent.llma_index_context
-                answer = llmaIndexAgent.llma_index_answer
-                print(f"Answer: {response}")
-                st.markdown(answer)
+        with transcript:
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            with st.chat_message("assistant"), span("turn"):
+                answer = write_answer(prompt, st.session_state.messages, PUBLIC_MODE, session_id())
+        if answer is None:
+            return
         st.session_state.messages.append({"role": "assistant", "content": answer})
 
 
@@ -61,9 +198,11 @@ def main():
             'About': "PTI Chatbot - A chatbot for the Petroleum Training Institute"
         }
     )
+    load_chat_backend()
+    start_metrics_server()
+
     st.logo("assets/pti_logo_bg.jpeg")
-    st.html("<title>PTI chatbot</title>")
-    st.html(hide_streamlit_watermark())
+    st.html(page_chrome_html())
 
     # st.write(st.secrets)
 
@@ -100,86 +239,75 @@ def main():
     authentication_status = True  # If st.user exists, user is authenticated
     if authentication_status:
         st.sidebar.success(f"Logged in as {name}")
+        if email in ADMIN_EMAILS:
+            metrics_panel()
         # st.sidebar.markdown("---")
         # st.sidebar.subheader("Your Private Chat History")
 
-        # --- Supabase connection ---
-        supabase = st.connection("supabase", type=SupabaseConnection)
         user_id = email or username or name or "unknown"
 
-        # Load chat history from Supabase
+        # Load only the most recent page of chat history; older messages
+        # are fetched on demand, so session start and reruns cost the same
+        # however long the user's history is.
         if "private_messages" not in st.session_state:
-            # Try to fetch from Supabase
-            try:
-                df = execute_query(supabase.table("chat_history").select("*").eq("user_id", (user_id)), ttl=0)
-
-                data = df.data if df.data else []
-                if data:
-                    df_data = pd.DataFrame(data)
-                    st.session_state.private_messages = df_data[["role", "content"]].to_dict("records")
-                else:
-                    st.session_state.private_messages = []
-            except Exception as e:
-                st.session_state.private_messages = []
-
-        # Show chat history in sidebar
-        for msg in st.session_state.private_messages:
-            # st.sidebar.markdown(f"**{msg['role'].capitalize()}:** {msg['content']}")
-            pass
+            st.session_state.private_messages = []
+            load_older_messages(user_id)
 
         st.title("PTI Private Chatbot")
         st.caption("A private chatbot for the Petroleum Training Institute (Google Authenticated)")
 
-        # Show chat messages in main pane
-        for message in st.session_state.private_messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
-
-        if prompt := st.chat_input("Ask your private question about PTI Nigeria"):
-            # Prepare user message
-            user_msg = {"role": "user", "content": prompt}
-            st.session_state.private_messages.append(user_msg)
+        if st.session_state.private_history_cursor:
+            st.button("Load older messages", on_click=load_older_messages,
+                      args=(user_id, st.session_state.private_history_cursor))
+
+        # Show chat messages in main pane. As in public mode, only full
+        # reruns draw the history; each turn reruns just `private_chat`.
+        transcript = st.container()
+        with transcript:
+            render_messages(st.session_state.private_messages)
+        private_chat(transcript, user_id)
+
+
+@st.fragment
+def private_chat(transcript, user_id):
+    if prompt := st.chat_input("Ask your private question about PTI Nigeria"):
+        # Prepare user message
+        user_msg = {"role": "user", "content": prompt}
+        st.session_state.private_messages.append(user_msg)
+        with transcript:
             with st.chat_message("user"):
                 st.markdown(prompt)
 
             # Generate assistant response
-            with st.chat_message("assistant"):
-                with st.spinner("In progress...", show_time=True):
-                    llmaIndexAgent =  LmmaIndexAgent(prompt, st.session_state.private_messages)
-                    response = llmaIndexAgent.rag_response
-                    context = llmaIndexAgent.llma_index_context
-                    answer = llmaIndexAgent.llma_index_answer
-                    print(f"Answer: {response}")
-
-                    if "error" in str(response).lower():
-                        st.error(response)
-                    else:
-                        st.markdown(response)
-
-                        # Prepare assistant message
-                        assistant_msg = {"role": "assistant", "content": response}
-                        st.session_state.private_messages.append(assistant_msg)
-
-                        # Save both user and assistant messages to Supabase
-                        try:
-                            timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-                            rows = [
-                                {"user_id": user_id, "role": "user", "content": str(prompt), "timestamp": str(timestamp)},
-                                {"user_id": user_id, "role": "assistant", "content": str(response), "timestamp": str(timestamp)}
-                            ]
-                            df2 = execute_query(
-                                supabase.table("chat_history").insert(rows, count="None"),
-                                ttl=0,
-                            )
-                            # print(df2)
-                        except Exception as e:
-                            st.warning("Could not save chat to database.")
+            with st.chat_message("assistant"), span("turn"):
+                response = write_answer(prompt, st.session_state.private_messages, PRIVATE_MODE, user_id)
+        if response is None:
+            return
+
+        # Prepare assistant message
+        assistant_msg = {"role": "assistant", "content": response}
+        st.session_state.private_messages.append(assistant_msg)
+
+        # Queue both user and assistant messages; a background
+        # worker batches them into Supabase off the request path.
+        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        rows = [
+            {"user_id": user_id, "role": "user", "content": str(prompt), "timestamp": str(timestamp)},
+            {"user_id": user_id, "role": "assistant", "content": str(response), "timestamp": str(timestamp)}
+        ]
+        load_chat_history_writer().enqueue(rows)
+
 
+@st.cache_resource(show_spinner=False)
+def page_chrome_html():
+    # Page title and watermark hiding, built once per process and injected
+    # with a single element.
+    return "<title>PTI chatbot</title>" + hide_streamlit_watermark()
 
 
 def hide_streamlit_watermark():
-    st.html("<style> ._container_gzau3_1, ._viewerBadge_nim44_23, ._profileContainer_gzau3_53 { display: none !important; } </style>")
-    return "<script> const elementsToHide = [...document.querySelectorAll('._container_gzau3_1, ._viewerBadge_nim44_23, ._profileContainer_gzau3_53')]; elementsToHide.forEach(element => { element.style.display = 'none'; }); </script>"
+    return "<style> ._container_gzau3_1, ._viewerBadge_nim44_23, ._profileContainer_gzau3_53 { display: none !important; } </style>" + \
+        "<script> const elementsToHide = [...document.querySelectorAll('._container_gzau3_1, ._viewerBadge_nim44_23, ._profileContainer_gzau3_53')]; elementsToHide.forEach(element => { element.style.display = 'none'; }); </script>"
 
 
 
@@ -0,0 +1,235 @@
+"""In-process metrics for chat turns, exported in Prometheus text format.
+
+    with span("retrieve"):
+        nodes = retriever.retrieve(query)
+
+records how long each stage of a turn took. `start_metrics_server` serves
+everything on http://METRICS_HOST:METRICS_PORT/metrics for Prometheus to scrape.
+"""
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 disables the endpoint
+# Loopback only by default; set e.g. 0.0.0.0 for a Prometheus on another host.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def series(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def quantile(self, q, **labels):
+        """Upper bound of the bucket holding the q-quantile (None if unobserved)."""
+        key = tuple(labels[name] for name in self.labelnames)
+        counts, _, count = self.series().get(key, (None, 0.0, 0))
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in sorted(self.series().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collectors, which are callables returning extra lines
+    computed at scrape time (e.g. cache statistics)."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pti_stage_seconds", "Duration of each stage of a chat turn.", ("stage",)))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "pti_stage_errors_total", "Stages that ended with an exception.", ("stage",)))
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.register(Histogram(
+    "pti_llm_first_token_seconds", "Time until a streamed LLM call yields its first chunk.", ("task",)))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "pti_llm_tokens_total", "Prompt and completion tokens per LLM task.", ("task", "kind")))
+
+
+@contextmanager
+def span(stage):
+    """Time a stage of a chat turn into pti_stage_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # A consumer closing a stream early is not a failure.
+        if not isinstance(e, GeneratorExit):
+            STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def stats_collector(prefix, stats, counters=()):
+    """Collector exporting a `stats()` dict: keys in `counters` as
+    `<prefix>_<key>_total` counters, everything else as gauges."""
+    def collect():
+        lines = []
+        for key, value in stats().items():
+            if key in counters:
+                name, kind = f"{prefix}_{key}_total", "counter"
+            else:
+                name, kind = f"{prefix}_{key}", "gauge"
+            lines += [f"# TYPE {name} {kind}", f"{name} {value}"]
+        return lines
+    return collect
+
+
+def record_tokens(task, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, task=task, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, task=task, kind="completion")
+
+
+def stage_summary():
+    """[{stage, count, mean_ms, p95_ms, errors}] for the admin panel."""
+    errors = {key[0]: value for key, value in STAGE_ERRORS.values().items()}
+    rows = []
+    for (stage,), (_, total, count) in sorted(STAGE_SECONDS.series().items()):
+        p95 = STAGE_SECONDS.quantile(0.95, stage=stage)
+        rows.append({
+            "stage": stage,
+            "count": count,
+            "mean_ms": round(1000 * total / count, 1),
+            "p95_ms": "inf" if p95 == float("inf") else round(1000 * p95),
+            "errors": errors.get(stage, 0),
+        })
+    return rows
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics from a daemon thread; safe to call more than once."""
+    global _metrics_server
+    if not port:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                print(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _metrics_server
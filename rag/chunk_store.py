@@ -0,0 +1,150 @@
+import os
+import json
+import mmap
+import time
+import shutil
+import hashlib
+import threading
+
+import numpy as np
+
+
+CHUNK_STORE_DIR = os.path.abspath(os.getenv("CHUNK_STORE_DIR", "./data/chunks"))
+
+# One row per chunk: byte offset and length in chunks.txt, index into
+# urls.json, and character offset of the chunk's first block in its page.
+TEXT_START, TEXT_LENGTH, URL_ID, PAGE_OFFSET = range(4)
+
+# Names the version directory holding the store's files.
+CURRENT_FILE = "CURRENT"
+
+
+def current_store_dir(store_dir=CHUNK_STORE_DIR):
+    """Directory with the current version of the store.
+
+    Stores written before versions existed keep their files in `store_dir`.
+    """
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), "r", encoding="utf-8") as file:
+            return os.path.join(store_dir, file.read().strip())
+    except FileNotFoundError:
+        return store_dir
+
+
+def write_chunk_store(chunks, store_dir=CHUNK_STORE_DIR):
+    """Write chunks as one UTF-8 text blob plus a small int64 offset table.
+
+    Each write goes to a new version directory, which then replaces the
+    current one in a single rename of CURRENT. Processes that opened an
+    older version keep their mappings of it; the files are never rewritten
+    in place.
+    """
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(store_dir, version)
+    os.makedirs(version_dir)
+
+    urls = {}
+    rows = np.zeros((len(chunks), 4), dtype=np.int64)
+    position = 0
+    with open(os.path.join(version_dir, "chunks.txt"), "wb") as file:
+        for i, chunk in enumerate(chunks):
+            data = chunk["text"].encode("utf-8")
+            file.write(data)
+            rows[i] = (position, len(data), urls.setdefault(chunk["url"], len(urls)), chunk.get("offset", 0))
+            position += len(data)
+
+    np.save(os.path.join(version_dir, "chunks.npy"), rows)
+    with open(os.path.join(version_dir, "urls.json"), "w", encoding="utf-8") as file:
+        json.dump(list(urls), file, ensure_ascii=False)
+
+    current = os.path.join(store_dir, CURRENT_FILE)
+    with open(current + ".tmp", "w", encoding="utf-8") as file:
+        file.write(version)
+    os.replace(current + ".tmp", current)
+
+    # Mapped files outlive their directory entry, except on Windows, where
+    # an old version stays until a later write.
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name.startswith("v") and name != version and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in ("chunks.txt", "chunks.npy", "urls.json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a store written by `write_chunk_store`.
+
+    Chunk text is decoded on access, so opening the store costs the same
+    whatever the corpus size.
+    """
+
+    def __init__(self, store_dir=CHUNK_STORE_DIR):
+        self.store_dir = store_dir
+        data_dir = current_store_dir(store_dir)
+        self.rows = np.load(os.path.join(data_dir, "chunks.npy"), mmap_mode="r")
+        with open(os.path.join(data_dir, "urls.json"), "r", encoding="utf-8") as file:
+            self.urls = json.load(file)
+
+        with open(os.path.join(data_dir, "chunks.txt"), "rb") as file:
+            # mmap refuses empty files.
+            self._text = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self.rows)
+
+    def digest(self):
+        """Hash of the store's contents, to tell which store an index was built from."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(self.rows).tobytes())
+        digest.update(self._text)
+        digest.update(json.dumps(self.urls, ensure_ascii=False).encode("utf-8"))
+        return digest.hexdigest()
+
+    def text(self, index):
+        start, length = int(self.rows[index, TEXT_START]), int(self.rows[index, TEXT_LENGTH])
+        return self._text[start:start + length].decode("utf-8")
+
+    def __getitem__(self, index):
+        row = self.rows[index]
+        return {
+            "url": self.urls[int(row[URL_ID])],
+            "offset": int(row[PAGE_OFFSET]),
+            "text": self.text(index),
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def pages(self):
+        """Regroup the chunks into compacted {url, markdown} pages."""
+        grouped = {}
+        for chunk in self:
+            grouped.setdefault(chunk["url"], []).append(chunk["text"])
+        return [{"url": url, "markdown": "\n\n".join(texts)} for url, texts in grouped.items()]
+
+
+def chunk_store_exists(store_dir=CHUNK_STORE_DIR):
+    return os.path.exists(os.path.join(current_store_dir(store_dir), "chunks.npy"))
+
+
+_chunk_store = None
+_chunk_store_lock = threading.Lock()
+
+
+def get_chunk_store():
+    """Return the shared chunk store, building it from the corpus if missing."""
+    global _chunk_store
+    if _chunk_store is None:
+        with _chunk_store_lock:
+            if _chunk_store is None:
+                if not chunk_store_exists():
+                    from rag.chunker import chunk_pages
+                    from rag.corpus import get_pages
+                    write_chunk_store(chunk_pages(get_pages()))
+                _chunk_store = ChunkStore()
+    return _chunk_store
@@ -0,0 +1,254 @@
+"""Split scraped pages into retrieval-sized, deduplicated markdown chunks.
+
+    python -m rag.chunker [path/to/pages.json]
+
+builds the chunk store in data/chunks (see rag/chunk_store.py).
+"""
+import re
+import sys
+import hashlib
+from collections import Counter, defaultdict
+
+import numpy as np
+
+
+CHUNK_MAX_CHARS = 1200
+# A line that shows up on at least this share of pages is site chrome
+# (menus, login boxes, "You may also like" lists), not content.
+BOILERPLATE_PAGE_RATIO = 0.15
+BOILERPLATE_MIN_PAGES = 5
+# Chunks whose 64-bit SimHashes differ in at most this many bits are
+# treated as the same text.
+SIMHASH_MAX_DISTANCE = 3
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+WORD_RE = re.compile(r"\w+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def is_table_line(line):
+    return line.lstrip().startswith("|")
+
+
+def find_boilerplate(pages, ratio=BOILERPLATE_PAGE_RATIO, min_pages=BOILERPLATE_MIN_PAGES):
+    """Return the set of stripped lines repeated across too many pages."""
+    page_freq = Counter()
+    for page in pages:
+        page_freq.update({line.strip() for line in page["markdown"].split("\n") if line.strip()})
+
+    threshold = max(min_pages, ratio * len(pages))
+    return {line for line, count in page_freq.items() if count >= threshold}
+
+
+def split_blocks(markdown, boilerplate=frozenset()):
+    """Yield (offset, kind, text) blocks: headings, whole tables, paragraphs.
+
+    `offset` is the character offset of the block in `markdown`.
+    """
+    block, block_offset, in_table = [], 0, False
+    offset = 0
+
+    def flush():
+        text = "\n".join(block).strip()
+        return (block_offset, "table" if in_table else "text", text) if text else None
+
+    for line in markdown.split("\n"):
+        line_offset = offset
+        offset += len(line) + 1
+        stripped = line.strip()
+
+        if stripped in boilerplate and not is_table_line(line):
+            continue
+
+        heading = HEADING_RE.match(stripped)
+        starts_new_block = (
+            not stripped
+            or heading
+            or is_table_line(line) != in_table
+        )
+        if starts_new_block and block:
+            flushed = flush()
+            if flushed:
+                yield flushed
+            block = []
+
+        if heading:
+            yield (line_offset, "heading", stripped)
+            in_table = False
+            continue
+        if not stripped:
+            in_table = False
+            continue
+
+        if not block:
+            block_offset = line_offset
+            in_table = is_table_line(line)
+        block.append(line)
+
+    if block:
+        flushed = flush()
+        if flushed:
+            yield flushed
+
+
+def split_text(text, max_chars):
+    """Split an oversized paragraph on line, then sentence boundaries."""
+    pieces = []
+    for line in text.split("\n"):
+        if len(line) <= max_chars:
+            pieces.append(line)
+            continue
+        pieces.extend(SENTENCE_RE.split(line))
+
+    parts, part = [], ""
+    for piece in pieces:
+        while len(piece) > max_chars:
+            # A single run-on "sentence": cut it hard.
+            if part:
+                parts.append(part)
+                part = ""
+            parts.append(piece[:max_chars])
+            piece = piece[max_chars:]
+        if part and len(part) + len(piece) + 1 > max_chars:
+            parts.append(part)
+            part = ""
+        part = f"{part}\n{piece}" if part else piece
+    if part:
+        parts.append(part)
+    return parts
+
+
+def split_table(table, max_chars):
+    """Split an oversized table by rows, repeating its header in each part."""
+    lines = table.split("\n")
+    header, rows = lines[:2], lines[2:]
+    parts, part = [], []
+    for row in rows:
+        if part and len("\n".join(header + part + [row])) > max_chars:
+            parts.append("\n".join(header + part))
+            part = []
+        part.append(row)
+    if part or not parts:
+        parts.append("\n".join(header + part))
+    return parts
+
+
+def chunk_page(page, boilerplate=frozenset(), max_chars=CHUNK_MAX_CHARS):
+    """Chunk one page along its heading structure.
+
+    Chunks never cross a heading. Tables are never cut mid-row. Each chunk
+    starts with the headings it sits under, so it still reads sensibly when
+    retrieved on its own.
+    """
+    chunks = []
+    headings = []  # (level, text) of the current heading path
+    parts, parts_offset = [], 0
+
+    def heading_path():
+        return "\n".join(text for _, text in headings)
+
+    def emit():
+        if parts:
+            body = "\n\n".join(parts)
+            path = heading_path()
+            chunks.append({
+                "url": page["url"],
+                "offset": parts_offset,
+                "text": f"{path}\n\n{body}" if path else body,
+            })
+        parts.clear()
+
+    for offset, kind, text in split_blocks(page["markdown"], boilerplate):
+        if kind == "heading":
+            emit()
+            level = len(HEADING_RE.match(text).group(1))
+            headings[:] = [h for h in headings if h[0] < level] + [(level, text)]
+            continue
+
+        if len(text) <= max_chars:
+            pieces = [text]
+        elif kind == "table":
+            pieces = split_table(text, max_chars)
+        else:
+            pieces = split_text(text, max_chars)
+        for piece in pieces:
+            if parts and len("\n\n".join(parts)) + len(piece) > max_chars:
+                emit()
+            if not parts:
+                parts_offset = offset
+            parts.append(piece)
+
+    emit()
+    return chunks
+
+
+def simhash(text):
+    """64-bit SimHash over word 3-shingles."""
+    words = WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+    hashes = np.array(
+        [hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles],
+        dtype="S8",
+    )
+    # One row of 64 bits per shingle; a fingerprint bit is set when most
+    # shingles have it set.
+    bits = np.unpackbits(np.frombuffer(hashes.tobytes(), dtype=np.uint8)).reshape(-1, 64)
+    fingerprint = np.packbits(bits.sum(axis=0) * 2 > len(bits))
+    return int.from_bytes(fingerprint.tobytes(), "big")
+
+
+def dedup_chunks(chunks, max_distance=SIMHASH_MAX_DISTANCE):
+    """Drop chunks that are near-duplicates of an earlier chunk.
+
+    The 64-bit hash is cut into max_distance + 1 bands. Two hashes within
+    max_distance bits must agree exactly on at least one band, so only
+    chunks sharing a band are compared.
+    """
+    bands = max_distance + 1
+    band_bits = 64 // bands
+    band_mask = (1 << band_bits) - 1
+    buckets = defaultdict(list)
+    kept_hashes = []
+    kept = []
+
+    for chunk in chunks:
+        value = simhash(chunk["text"])
+        keys = [(band, value >> (band * band_bits) & band_mask) for band in range(bands)]
+
+        duplicate = any(
+            bin(value ^ kept_hashes[other]).count("1") <= max_distance
+            for key in keys
+            for other in buckets[key]
+        )
+        if duplicate:
+            continue
+
+        for key in keys:
+            buckets[key].append(len(kept_hashes))
+        kept_hashes.append(value)
+        kept.append(chunk)
+
+    return kept
+
+
+def chunk_pages(pages, max_chars=CHUNK_MAX_CHARS):
+    boilerplate = find_boilerplate(pages)
+    chunks = []
+    for page in pages:
+        chunks.extend(chunk_page(page, boilerplate, max_chars))
+    return dedup_chunks(chunks)
+
+
+if __name__ == "__main__":
+    from rag.corpus import DATA_DIR, load_pages
+    from rag.chunk_store import CHUNK_STORE_DIR, write_chunk_store
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    pages = load_pages(filename)
+    chunks = chunk_pages(pages)
+    write_chunk_store(chunks)
+
+    source_chars = sum(len(page["markdown"]) for page in pages)
+    chunk_chars = sum(len(chunk["text"]) for chunk in chunks)
+    print(f"{len(pages)} pages ({source_chars} chars) -> {len(chunks)} chunks ({chunk_chars} chars) in {CHUNK_STORE_DIR}")
@@ -0,0 +1,36 @@
+import os
+import json
+import functools
+
+
+# A JSON array of {url, markdown} pages, or the JSONL file written by
+# `python -m crawler.site_crawler`.
+DATA_DIR = os.path.abspath(os.getenv("CORPUS_PATH", './data/pti_markdown_results_all.json'))
+
+
+def read_jsonl(filename):
+    with open(filename, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def load_pages(filename=DATA_DIR):
+    """Parse the scraped pages file into a list of {url, markdown} dicts."""
+    if filename.endswith(".jsonl"):
+        data = read_jsonl(filename)
+    else:
+        with open(filename, "r", encoding="utf-8") as file:
+            data = json.load(file)
+
+    # Later crawls of the same URL win.
+    pages = {}
+    for item in data:
+        if item.get("markdown"):
+            pages[item["url"]] = item
+    return list(pages.values())
+
+
+@functools.lru_cache(maxsize=None)
+def get_pages(filename=DATA_DIR):
+    # The corpus is ~4 MB of JSON; parse it on first use rather than at
+    # import time, and only once per process. Callers must not mutate it.
+    return load_pages(filename)
@@ -0,0 +1,130 @@
+import os
+import asyncio
+import threading
+
+import numpy as np
+
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_DIM = 384
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", "0"))  # 0 leaves the library default
+# "torch", "onnx" or "onnx-quantized" (int8 dynamic quantization, needs optimum[onnxruntime])
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "avx2")
+EMBEDDING_MODEL_DIR = os.path.abspath(os.getenv("EMBEDDING_MODEL_DIR", "./data/models"))
+
+
+class EmbeddingService:
+    """Process-wide sentence embedding model.
+
+    The model is loaded lazily on the first call and then reused. Each call
+    deduplicates its texts before encoding them in batches of `batch_size`,
+    so LightRAG inserts and queries, the answer cache and the local
+    retriever all share one copy of the weights.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, batch_size=EMBEDDING_BATCH_SIZE,
+                 num_threads=EMBEDDING_NUM_THREADS, backend=EMBEDDING_BACKEND,
+                 quantization=EMBEDDING_QUANTIZATION, model_dir=EMBEDDING_MODEL_DIR):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.backend = backend
+        self.quantization = quantization
+        self.model_dir = model_dir
+
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        import torch
+        # Streamlit's file watcher trips over torch.classes' dynamic __path__.
+        torch.classes.__path__ = []
+
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "torch":
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            return SentenceTransformer(self.model_name, device="cpu")
+
+        try:
+            return self._load_onnx_model()
+        except ImportError as e:
+            print(f"ONNX embedding backend unavailable ({e}), falling back to torch")
+            self.backend = "torch"
+            return self._load_model()
+
+    def _load_onnx_model(self):
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+        import onnxruntime
+
+        model_kwargs = {}
+        if self.num_threads:
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.num_threads
+            model_kwargs["session_options"] = session_options
+
+        if self.backend == "onnx":
+            return SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+        # Export and quantize once, then load the stored int8 model from disk
+        # on every later start.
+        local_dir = os.path.join(self.model_dir, f"{self.model_name}-onnx")
+        file_name = f"onnx/model_qint8_{self.quantization}.onnx"
+        if not os.path.exists(os.path.join(local_dir, file_name)):
+            model = SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+            model.save(local_dir)
+            export_dynamic_quantized_onnx_model(model, self.quantization, local_dir)
+
+        model_kwargs["file_name"] = file_name
+        return SentenceTransformer(local_dir, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    def encode(self, texts, normalize=False):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+        # LightRAG often sends the same entity/relation text several times
+        # in one batch; encode each distinct text once.
+        unique_texts = list(dict.fromkeys(texts))
+        embeddings = self.model.encode(
+            unique_texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=normalize,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+
+        if len(unique_texts) == len(texts):
+            return embeddings
+        index = {text: i for i, text in enumerate(unique_texts)}
+        return embeddings[[index[text] for text in texts]]
+
+    async def aencode(self, texts, normalize=False):
+        # Encoding is CPU-bound; keep it off the event loop LightRAG runs on.
+        return await asyncio.to_thread(self.encode, texts, normalize)
+
+
+_embedding_service = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    """Return the process-wide embedding service."""
+    global _embedding_service
+    if _embedding_service is None:
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
+    return _embedding_service
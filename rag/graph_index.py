@@ -0,0 +1,275 @@
+"""Compiled, memory-mappable form of LightRAG's knowledge graph.
+
+    python -m rag.graph_index [data/lrag]
+
+compiles `graph_chunk_entity_relation.graphml` into
+`graph_chunk_entity_relation.csr`, a single file holding:
+
+- interned node ids: node i's name is name_bytes[name_offsets[i]:name_offsets[i + 1]],
+  found through a sorted array of name hashes;
+- CSR adjacency: node i's neighbours are indices[indptr[i]:indptr[i + 1]]
+  (sorted), and edge_ids gives the undirected edge behind each entry;
+- edge weights and endpoints, one row per edge;
+- node and edge attributes as JSON blobs, decoded only when asked for.
+
+Every array is a view into one np.memmap, so opening the graph costs the
+same whatever its size.
+"""
+import os
+import sys
+import json
+import struct
+import hashlib
+
+import numpy as np
+
+
+MAGIC = b"PTICSR1\0"
+ALIGNMENT = 64
+
+ARRAYS = (
+    "name_hashes", "name_order", "name_offsets", "name_bytes",
+    "node_attr_offsets", "node_attr_bytes",
+    "indptr", "indices", "edge_ids",
+    "edge_src", "edge_tgt", "weights", "edge_attr_offsets", "edge_attr_bytes",
+)
+
+
+def name_hash(name):
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def pack_strings(strings):
+    """(offsets, bytes) with string i at bytes[offsets[i]:offsets[i + 1]]."""
+    data = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in data])
+    return offsets, np.frombuffer(b"".join(data), dtype=np.uint8)
+
+
+def compile_graph(nodes, edges):
+    """Arrays for an undirected graph.
+
+    `nodes` is [(name, attrs)] and `edges` is [(source, target, attrs)],
+    one entry per node pair, as networkx's `nodes(data=True)` and
+    `edges(data=True)` return them.
+    """
+    names = [name for name, _ in nodes]
+    ids = {name: i for i, name in enumerate(names)}
+    n, m = len(names), len(edges)
+
+    hashes = np.array([name_hash(name) for name in names], dtype=np.uint64)
+    order = np.argsort(hashes, kind="stable")
+    name_offsets, name_bytes = pack_strings(names)
+    node_attr_offsets, node_attr_bytes = pack_strings(json.dumps(attrs, ensure_ascii=False) for _, attrs in nodes)
+
+    edge_src = np.array([ids[source] for source, _, _ in edges], dtype=np.int32)
+    edge_tgt = np.array([ids[target] for _, target, _ in edges], dtype=np.int32)
+    weights = np.array([float(attrs.get("weight", 1.0)) for _, _, attrs in edges], dtype=np.float32)
+    edge_attr_offsets, edge_attr_bytes = pack_strings(json.dumps(attrs, ensure_ascii=False) for _, _, attrs in edges)
+
+    # Each undirected edge is listed under both of its endpoints.
+    rows = np.concatenate([edge_src, edge_tgt])
+    cols = np.concatenate([edge_tgt, edge_src])
+    entry_edges = np.concatenate([np.arange(m, dtype=np.int32)] * 2)
+    entries = np.lexsort((cols, rows))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(rows, minlength=n))
+
+    return {
+        "name_hashes": hashes[order],
+        "name_order": order.astype(np.int32),
+        "name_offsets": name_offsets,
+        "name_bytes": name_bytes,
+        "node_attr_offsets": node_attr_offsets,
+        "node_attr_bytes": node_attr_bytes,
+        "indptr": indptr,
+        "indices": cols[entries],
+        "edge_ids": entry_edges[entries],
+        "edge_src": edge_src,
+        "edge_tgt": edge_tgt,
+        "weights": weights,
+        "edge_attr_offsets": edge_attr_offsets,
+        "edge_attr_bytes": edge_attr_bytes,
+    }
+
+
+def compile_networkx(graph):
+    return compile_graph(list(graph.nodes(data=True)), list(graph.edges(data=True)))
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_graph(path, arrays):
+    """Write `arrays` as one file: magic, header length, JSON header, arrays."""
+    layout, offset = {}, 0
+    for name in ARRAYS:
+        array = np.ascontiguousarray(arrays[name])
+        arrays[name] = array
+        offset = _aligned(offset)
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = json.dumps(layout).encode("utf-8")
+    base = _aligned(len(MAGIC) + 8 + len(header))
+
+    with open(path + ".tmp", "wb") as file:
+        file.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for name in ARRAYS:
+            file.write(b"\0" * (base + layout[name]["offset"] - file.tell()))
+            file.write(arrays[name].tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def read_graph(path):
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a compiled graph")
+    (header_length,) = struct.unpack("<Q", bytes(buffer[len(MAGIC):len(MAGIC) + 8]))
+    layout = json.loads(bytes(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length]))
+    base = _aligned(len(MAGIC) + 8 + header_length)
+
+    arrays = {}
+    for name, spec in layout.items():
+        dtype = np.dtype(spec["dtype"])
+        start = base + spec["offset"]
+        size = int(np.prod(spec["shape"])) * dtype.itemsize
+        arrays[name] = buffer[start:start + size].view(dtype).reshape(spec["shape"])
+    return arrays
+
+
+class CsrGraph:
+    """Read-only graph over compiled arrays; nodes are ints, names on demand."""
+
+    def __init__(self, arrays):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def open(cls, path):
+        return cls(read_graph(path))
+
+    @classmethod
+    def from_networkx(cls, graph):
+        return cls(compile_networkx(graph))
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def number_of_edges(self):
+        return len(self.weights)
+
+    def node_id(self, name):
+        h = np.uint64(name_hash(name))
+        i = int(np.searchsorted(self.name_hashes, h))
+        while i < len(self.name_hashes) and self.name_hashes[i] == h:
+            node = int(self.name_order[i])
+            if self.name(node) == name:
+                return node
+            i += 1
+        return None
+
+    def node_ids(self, names):
+        """`node_id` of each of `names` (-1 if absent), with one search for all."""
+        hashes = np.array([name_hash(name) for name in names], dtype=np.uint64)
+        positions = np.searchsorted(self.name_hashes, hashes)
+        hit = positions < len(self.name_hashes)
+        hit[hit] = self.name_hashes[positions[hit]] == hashes[hit]
+        nodes = np.full(len(names), -1, dtype=np.int64)
+        for i in np.flatnonzero(hit):
+            node = int(self.name_order[positions[i]])
+            if self.name(node) != names[i]:
+                # A hash collision: fall back to walking the equal hashes.
+                node = self.node_id(names[i])
+            nodes[i] = -1 if node is None else node
+        return nodes
+
+    def degrees(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return self.indptr[nodes + 1] - self.indptr[nodes]
+
+    def name(self, node):
+        return bytes(self.name_bytes[self.name_offsets[node]:self.name_offsets[node + 1]]).decode("utf-8")
+
+    def node_attrs(self, node):
+        return json.loads(bytes(self.node_attr_bytes[self.node_attr_offsets[node]:self.node_attr_offsets[node + 1]]))
+
+    def edge_attrs(self, edge):
+        return json.loads(bytes(self.edge_attr_bytes[self.edge_attr_offsets[edge]:self.edge_attr_offsets[edge + 1]]))
+
+    def degree(self, node):
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def edge_id(self, source, target):
+        start = self.indptr[source]
+        row = self.neighbors(source)
+        k = int(np.searchsorted(row, target))
+        return int(self.edge_ids[start + k]) if k < len(row) and row[k] == target else None
+
+    def entries(self, nodes):
+        """Positions in `indices`/`edge_ids` of every neighbour of `nodes`,
+        and how many belong to each node."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = self.indptr[nodes]
+        counts = self.indptr[nodes + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return positions, counts
+
+    def k_hop(self, seeds, depth, max_nodes):
+        """(nodes within `depth` hops of `seeds` in breadth-first order, truncated?)"""
+        visited = np.zeros(len(self), dtype=bool)
+        frontier = np.unique(np.asarray(seeds, dtype=np.int64))
+        visited[frontier] = True
+        levels, found = [frontier], len(frontier)
+        for _ in range(depth):
+            # At exactly max_nodes, one more level tells whether anything was cut off.
+            if found > max_nodes or not len(frontier):
+                break
+            positions, _ = self.entries(frontier)
+            reached = self.indices[positions]
+            reached = reached[~visited[reached]]
+            _, first = np.unique(reached, return_index=True)
+            frontier = reached[np.sort(first)].astype(np.int64)
+            visited[frontier] = True
+            levels.append(frontier)
+            found += len(frontier)
+        nodes = np.concatenate(levels)
+        return nodes[:max_nodes], len(nodes) > max_nodes
+
+    def edges_within(self, nodes):
+        """Ids of the edges with both endpoints in `nodes`."""
+        inside = np.zeros(len(self), dtype=bool)
+        inside[nodes] = True
+        positions, _ = self.entries(nodes)
+        return np.unique(self.edge_ids[positions][inside[self.indices[positions]]])
+
+    def to_networkx(self):
+        import networkx as nx
+
+        graph = nx.Graph()
+        graph.add_nodes_from((self.name(node), self.node_attrs(node)) for node in range(len(self)))
+        graph.add_edges_from((self.name(int(self.edge_src[edge])), self.name(int(self.edge_tgt[edge])),
+                              self.edge_attrs(edge)) for edge in range(self.number_of_edges()))
+        return graph
+
+
+def compile_graphml(graphml_path, csr_path):
+    import networkx as nx
+
+    graph = nx.read_graphml(graphml_path)
+    write_graph(csr_path, compile_networkx(graph))
+    return graph.number_of_nodes(), graph.number_of_edges()
+
+
+if __name__ == "__main__":
+    working_dir = sys.argv[1] if len(sys.argv) > 1 else "./data/lrag"
+    source = os.path.join(working_dir, "graph_chunk_entity_relation.graphml")
+    target = os.path.join(working_dir, "graph_chunk_entity_relation.csr")
+    nodes, edges = compile_graphml(source, target)
+    print(f"Compiled {nodes} nodes and {edges} edges into {target}")
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import hashlib
+
+from lightrag.base import DocStatus
+from lightrag.utils import always_get_an_event_loop
+
+from rag.corpus import load_pages
+
+
+LEDGER_FILENAME = "ingest_ledger.json"
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "8"))
+
+INDEXED = "indexed"
+PENDING = "pending"
+
+
+def page_doc_id(url):
+    # Stable per URL, so a changed page replaces its previous version.
+    return "page-" + hashlib.md5(url.encode("utf-8")).hexdigest()
+
+
+def content_hash(markdown):
+    return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+
+def page_document(page):
+    return f"url: {page['url']} \n content: {page['markdown']} \n\n"
+
+
+class IngestLedger:
+    """Per-URL record of what has been indexed into a LightRAG working dir.
+
+    Every change is written to disk straight away (via an atomic rename),
+    so an interrupted run resumes from the last page it finished.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def mark(self, url, doc_id, digest, status):
+        self.entries[url] = {"doc_id": doc_id, "content_hash": digest, "status": status}
+
+    def remove(self, url):
+        self.entries.pop(url, None)
+
+
+class IngestPlan:
+
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.unchanged = []
+
+    def summary(self):
+        return {
+            "added": len(self.added),
+            "changed": len(self.changed),
+            "removed": len(self.removed),
+            "unchanged": len(self.unchanged),
+        }
+
+
+def plan_ingest(ledger, pages, removed=None):
+    plan = IngestPlan()
+    seen = set()
+
+    for page in pages:
+        url = page["url"]
+        seen.add(url)
+        entry = ledger.entries.get(url)
+        if entry is None:
+            plan.added.append(page)
+        elif entry["status"] != INDEXED or entry["content_hash"] != content_hash(page["markdown"]):
+            # Pending entries were interrupted mid-insert; redo them.
+            plan.changed.append(page)
+        else:
+            plan.unchanged.append(page)
+
+    if removed is None:
+        plan.removed = [url for url in ledger.entries if url not in seen]
+    else:
+        plan.removed = [url for url in removed if url in ledger.entries and url not in seen]
+    return plan
+
+
+async def aingest_pages(rag, pages, batch_size=INGEST_BATCH_SIZE, removed=None):
+    """Bring `rag` in line with `pages`, touching only what changed.
+
+    Each page is its own LightRAG document keyed by URL. Unchanged pages
+    are skipped, changed pages are deleted and re-inserted (so only their
+    chunks are re-embedded) and pages that disappeared are deleted.
+
+    With `removed` given, `pages` need only be the pages that changed (as
+    from the crawler) and just the `removed` URLs are deleted.
+    """
+    ledger = IngestLedger(os.path.join(rag.working_dir, LEDGER_FILENAME))
+    plan = plan_ingest(ledger, pages, removed)
+    print(f"Ingest plan: {plan.summary()}")
+
+    for url in plan.removed:
+        await rag.adelete_by_doc_id(ledger.entries[url]["doc_id"])
+        ledger.remove(url)
+        ledger.save()
+
+    for page in plan.changed:
+        await rag.adelete_by_doc_id(page_doc_id(page["url"]))
+
+    to_insert = plan.changed + plan.added
+    for start in range(0, len(to_insert), batch_size):
+        batch = to_insert[start:start + batch_size]
+        doc_ids = [page_doc_id(page["url"]) for page in batch]
+
+        for page, doc_id in zip(batch, doc_ids):
+            ledger.mark(page["url"], doc_id, content_hash(page["markdown"]), PENDING)
+        ledger.save()
+
+        await rag.ainsert(
+            [page_document(page) for page in batch],
+            ids=doc_ids,
+            file_paths=[page["url"] for page in batch],
+        )
+
+        # LightRAG records a failed extraction in doc_status instead of
+        # raising; those pages stay pending and are redone next run.
+        failed = []
+        for page, doc_id in zip(batch, doc_ids):
+            status = await rag.doc_status.get_by_id(doc_id)
+            if status is not None and status.get("status") == DocStatus.PROCESSED:
+                ledger.mark(page["url"], doc_id, content_hash(page["markdown"]), INDEXED)
+            else:
+                failed.append(page["url"])
+        ledger.save()
+        if failed:
+            print(f"Not indexed, will retry: {', '.join(failed)}")
+        print(f"Ingested {min(start + batch_size, len(to_insert))}/{len(to_insert)} pages")
+
+    return plan
+
+
+def ingest_pages(rag, pages, batch_size=INGEST_BATCH_SIZE, removed=None):
+    loop = always_get_an_event_loop()
+    return loop.run_until_complete(aingest_pages(rag, pages, batch_size, removed))
+
+
+if __name__ == "__main__":
+    from rag.chunk_store import get_chunk_store
+    from rag.rag_agent_func import rag as init_rag
+
+    if len(sys.argv) > 1:
+        pages = load_pages(sys.argv[1])
+    else:
+        pages = get_chunk_store().pages()
+    plan = ingest_pages(init_rag(), pages)
+    print(f"Done: {plan.summary()}")
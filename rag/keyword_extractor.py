@@ -0,0 +1,216 @@
+"""Local keyword extraction for LightRAG queries.
+
+Before retrieving anything, a LightRAG query normally asks the LLM for the
+question's high- and low-level keywords. `KeywordExtractor` derives them
+locally instead:
+
+- low-level keywords are the knowledge-graph entities the question names,
+  followed by its most specific phrases (by IDF over the chunk store);
+- high-level keywords are relationship keywords from the graph that the
+  question mentions, followed by the same phrases.
+
+Passed in QueryParam, they make LightRAG skip its own extraction, so the
+only LLM call left per query is the answer.
+"""
+import os
+import re
+import math
+import threading
+from collections import Counter
+
+from retrieval.hybrid_retriever import STOPWORDS, TOKEN_RE, tokenize
+
+
+# "local", or "llm" to let LightRAG ask the LLM as before.
+LIGHTRAG_KEYWORDS = os.getenv("LIGHTRAG_KEYWORDS", "local")
+KEYWORDS_MAX = 5
+MAX_PHRASE_WORDS = 3
+GRAPH_FILENAME = "graph_chunk_entity_relation.graphml"
+GRAPHML_NS = "{http://graphml.graphdrawing.org/xmlns}"
+
+PARENTHETICAL_RE = re.compile(r"\(([^)]*)\)")
+# Words that carry the question's form rather than its subject.
+QUESTION_WORDS = frozenset("""
+about any can could did do does get give know list many me much my please should tell than
+there they their them us we would
+""".split())
+
+
+def entity_aliases(name):
+    """Ways a question may refer to an entity, e.g. for
+    "Petroleum Training Institute (PTI) Effurun" also "PTI" and
+    "Petroleum Training Institute"."""
+    aliases = {name, name.split("(")[0], PARENTHETICAL_RE.sub(" ", name), *PARENTHETICAL_RE.findall(name)}
+    return [alias for alias in aliases if tokenize(alias)]
+
+
+def read_graph(path):
+    """(entity names, relationship keywords) from LightRAG's GraphML file."""
+    import xml.etree.ElementTree as ET
+
+    root = ET.parse(path).getroot()
+    keys = {key.get("id"): key.get("attr.name") for key in root.iter(f"{GRAPHML_NS}key")}
+    entities = [node.get("id") for node in root.iter(f"{GRAPHML_NS}node")]
+    themes = set()
+    for edge in root.iter(f"{GRAPHML_NS}edge"):
+        for data in edge.iter(f"{GRAPHML_NS}data"):
+            if keys.get(data.get("key")) == "keywords" and data.text:
+                themes.update(keyword.strip() for keyword in data.text.split(",") if keyword.strip())
+    return entities, sorted(themes)
+
+
+def unique(items):
+    return list(dict.fromkeys(items))
+
+
+class KeywordExtractor:
+    """Fitted once on the corpus; follows the graph as ingestion grows it."""
+
+    def __init__(self, texts, graph_path=None, max_keywords=KEYWORDS_MAX):
+        document_frequency = Counter()
+        documents = 0
+        for text in texts:
+            document_frequency.update(set(tokenize(text)))
+            documents += 1
+        self.idf = {token: math.log((documents + 1) / (count + 1)) + 1
+                    for token, count in document_frequency.items()}
+        # Words the corpus never uses (names, codes) are the most specific.
+        self.default_idf = math.log(documents + 1) + 1
+
+        self.graph_path = graph_path
+        self.max_keywords = max_keywords
+        self.graph_mtime = None
+        self.entities = {}  # alias tokens -> entity name
+        self.max_entity_words = 1
+        self.themes = {}  # first token -> [(theme tokens, theme)]
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Re-read the graph if it changed since it was last read."""
+        path = self.graph_path
+        mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+        if mtime == self.graph_mtime:
+            return
+        with self._lock:
+            if mtime == self.graph_mtime:
+                return
+            names, keywords = read_graph(path) if mtime is not None else ([], [])
+
+            entities = {}
+            for name in names:
+                for alias in entity_aliases(name):
+                    entities.setdefault(tuple(tokenize(alias)), name)
+            themes = {}
+            for theme in keywords:
+                theme_tokens = tuple(tokenize(theme))
+                if theme_tokens:
+                    themes.setdefault(theme_tokens[0], []).append((theme_tokens, theme))
+
+            self.entities, self.themes = entities, themes
+            self.max_entity_words = max(map(len, entities), default=1)
+            self.graph_mtime = mtime
+
+    def specificity(self, tokens):
+        return sum(self.idf.get(token, self.default_idf) for token in tokens)
+
+    def _entities(self, tokens):
+        """Entities named in `tokens` (longest alias first) and which tokens they cover."""
+        found, used = [], [False] * len(tokens)
+        i = 0
+        while i < len(tokens):
+            for n in range(min(self.max_entity_words, len(tokens) - i), 0, -1):
+                name = self.entities.get(tuple(tokens[i:i + n]))
+                if name is not None:
+                    found.append(name)
+                    used[i:i + n] = [True] * n
+                    i += n
+                    break
+            else:
+                i += 1
+        return found, used
+
+    def _phrases(self, query, tokens, used):
+        # Runs of content words between stopwords, at most MAX_PHRASE_WORDS
+        # long; question words and words already covered by an entity are
+        # left out.
+        runs, run = [], 0
+        for word in TOKEN_RE.findall(query.lower()):
+            if word in STOPWORDS:
+                run += 1
+            else:
+                runs.append(run)
+
+        phrases, current, previous = [], [], None
+        for token, run, is_used in zip(tokens, runs, used):
+            skip = is_used or token in QUESTION_WORDS
+            if current and (skip or run != previous or len(current) == MAX_PHRASE_WORDS):
+                phrases.append(current)
+                current = []
+            if not skip:
+                current.append(token)
+            previous = run
+        if current:
+            phrases.append(current)
+        phrases.sort(key=self.specificity, reverse=True)
+        return [" ".join(phrase) for phrase in phrases]
+
+    def _themes(self, tokens):
+        present = set(tokens)
+        matches = [(theme_tokens, theme)
+                   for token in present for theme_tokens, theme in self.themes.get(token, ())
+                   if present.issuperset(theme_tokens)]
+        matches.sort(key=lambda match: self.specificity(match[0]), reverse=True)
+        return [theme for _, theme in matches]
+
+    def extract(self, query, conversation_history=()):
+        """(high-level keywords, low-level keywords) for `query`.
+
+        A follow-up that names no entity ("and the fees?") borrows the
+        entities of the previous question.
+        """
+        self.refresh()
+        tokens = tokenize(query)
+        entities, used = self._entities(tokens)
+        if not entities:
+            for message in reversed(conversation_history):
+                if isinstance(message, dict) and message.get("role") == "user" and message.get("content") != query:
+                    entities, _ = self._entities(tokenize(message["content"]))
+                    break
+        phrases = self._phrases(query, tokens, used)
+
+        low_level = unique(entities + phrases)[:self.max_keywords]
+        # Relationships are also found by the names of their entities.
+        high_level = unique(self._themes(tokens) + phrases)[:self.max_keywords] or entities[:self.max_keywords]
+        return high_level, low_level
+
+
+_keyword_extractors = {}
+_keyword_extractors_lock = threading.Lock()
+
+
+def get_keyword_extractor(working_dir=None):
+    """Return the process-wide extractor for the LightRAG store in `working_dir`."""
+    if working_dir not in _keyword_extractors:
+        with _keyword_extractors_lock:
+            if working_dir not in _keyword_extractors:
+                from rag.chunk_store import get_chunk_store
+                graph_path = os.path.join(working_dir, GRAPH_FILENAME) if working_dir else None
+                _keyword_extractors[working_dir] = KeywordExtractor(
+                    (chunk["text"] for chunk in get_chunk_store()), graph_path)
+    return _keyword_extractors[working_dir]
+
+
+def keyword_params(rag, query, conversation_history=()):
+    """QueryParam keyword arguments carrying locally extracted keywords.
+
+    Empty (so LightRAG asks the LLM) when LIGHTRAG_KEYWORDS=llm or nothing
+    could be extracted.
+    """
+    if LIGHTRAG_KEYWORDS != "local":
+        return {}
+    high_level, low_level = get_keyword_extractor(getattr(rag, "working_dir", None)).extract(
+        query, conversation_history)
+    if not high_level and not low_level:
+        return {}
+    return {"hl_keywords": high_level, "ll_keywords": low_level}
@@ -0,0 +1,822 @@
+"""LightRAG storages backed by SQLite and a memory-mapped float32 matrix.
+
+LightRAG's default JSON storages parse every file into memory when the
+storages are initialized and rewrite whole files on each update. These keep
+KV records and document status in one SQLite database, and vectors in an
+append-only `vdb_<namespace>.f32` file per namespace that is memory-mapped
+for queries. Opening them reads nothing up front; updates are appended,
+and the file is compacted once enough of it is dead rows.
+The knowledge graph is served from the compiled CSR file of
+rag/graph_index.py instead of a networkx graph parsed from GraphML.
+
+`register_storages()` makes the classes selectable by name, e.g.
+LightRAG(kv_storage="SqliteKVStorage", ...). Existing JSON files in the
+working dir are imported the first time a namespace is opened, and the
+GraphML graph is compiled whenever it is newer than its compiled copy.
+"""
+import os
+import json
+import asyncio
+import time
+import base64
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, final
+
+import numpy as np
+from lightrag.base import (BaseGraphStorage, BaseKVStorage, BaseVectorStorage, DocProcessingStatus, DocStatus,
+                           DocStatusStorage)
+from lightrag.namespace import NameSpace, is_namespace
+from lightrag.types import KnowledgeGraph, KnowledgeGraphEdge, KnowledgeGraphNode
+from lightrag.utils import compute_mdhash_id, load_json
+
+from rag.graph_index import CsrGraph, compile_graph, compile_graphml, compile_networkx, write_graph
+from retrieval.reranker import RERANK_CANDIDATES, get_reranker
+
+
+# "sqlite" for the storages below, "json" for LightRAG's defaults.
+LIGHTRAG_STORAGE = os.getenv("LIGHTRAG_STORAGE", "sqlite")
+LIGHTRAG_DB_NAME = "lightrag.sqlite3"
+# A vector file is rewritten without its dead rows (replaced or deleted
+# vectors) once they are more than this fraction of it.
+LIGHTRAG_VECTOR_COMPACT_RATIO = float(os.getenv("LIGHTRAG_VECTOR_COMPACT_RATIO", "0.3"))
+VECTOR_COMPACT_MIN_ROWS = 1024  # dead rows; below this compacting is not worth it
+VECTOR_COPY_BATCH_ROWS = 4096
+
+SCHEMA = """
+create table if not exists kv (
+    namespace text not null,
+    id text not null,
+    value text not null,
+    primary key (namespace, id)
+) without rowid;
+create table if not exists doc_status (
+    namespace text not null,
+    id text not null,
+    status text not null,
+    value text not null,
+    primary key (namespace, id)
+) without rowid;
+create index if not exists idx_doc_status_status on doc_status(namespace, status);
+create table if not exists vectors (
+    namespace text not null,
+    id text not null,
+    row integer not null,
+    created_at real not null,
+    meta text not null,
+    primary key (namespace, id)
+) without rowid;
+create table if not exists vector_files (
+    namespace text primary key,
+    generation integer not null,
+    rows integer not null
+) without rowid;
+"""
+
+STORAGE_CLASSES = {
+    "KV_STORAGE": "SqliteKVStorage",
+    "VECTOR_STORAGE": "MemmapVectorDBStorage",
+    "DOC_STATUS_STORAGE": "SqliteDocStatusStorage",
+    "GRAPH_STORAGE": "CsrGraphStorage",
+}
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+class Database:
+    """One SQLite connection per file, shared by every storage in the process."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+        self.conn.executescript(SCHEMA)
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def write(self, sql, rows):
+        with self.lock, self.conn:
+            self.conn.executemany(sql, rows)
+
+    @contextmanager
+    def transaction(self, mode="immediate"):
+        """The connection inside a transaction, committed at the end of the block.
+
+        By default the transaction takes SQLite's write lock up front, so it
+        also keeps writers in other processes out while the block runs;
+        "deferred" gives a consistent snapshot for reads.
+        """
+        with self.lock:
+            self.conn.execute(f"begin {mode}")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def data_version(self):
+        # Changes whenever another connection (e.g. another worker process)
+        # commits to the database.
+        with self.lock:
+            return self.conn.execute("pragma data_version").fetchone()[0]
+
+
+def get_database(working_dir):
+    path = os.path.join(working_dir, LIGHTRAG_DB_NAME)
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = Database(path)
+        return _databases[path]
+
+
+def register_storages():
+    """Make the storages selectable by name in LightRAG(...)."""
+    from lightrag import kg
+
+    for storage_type, name in STORAGE_CLASSES.items():
+        kg.STORAGES[name] = __name__
+        if name not in kg.STORAGE_IMPLEMENTATIONS[storage_type]["implementations"]:
+            kg.STORAGE_IMPLEMENTATIONS[storage_type]["implementations"].append(name)
+        kg.STORAGE_ENV_REQUIREMENTS[name] = []
+
+
+def storage_kwargs():
+    """LightRAG keyword arguments selecting the storages from LIGHTRAG_STORAGE."""
+    if LIGHTRAG_STORAGE != "sqlite":
+        return {}
+    register_storages()
+    return {
+        "kv_storage": STORAGE_CLASSES["KV_STORAGE"],
+        "vector_storage": STORAGE_CLASSES["VECTOR_STORAGE"],
+        "doc_status_storage": STORAGE_CLASSES["DOC_STATUS_STORAGE"],
+        "graph_storage": STORAGE_CLASSES["GRAPH_STORAGE"],
+    }
+
+
+@final
+@dataclass
+class SqliteKVStorage(BaseKVStorage):
+
+    def __post_init__(self):
+        self._db = get_database(self.global_config["working_dir"])
+        self._json_file = os.path.join(self.global_config["working_dir"], f"kv_store_{self.namespace}.json")
+
+    async def initialize(self):
+        if os.path.exists(self._json_file) and not self._db.query(
+                "select 1 from kv where namespace = ? limit 1", (self.namespace,)):
+            data = load_json(self._json_file) or {}
+            await self.upsert(data)
+            print(f"Imported {len(data)} records from {self._json_file}")
+
+    async def index_done_callback(self) -> None:
+        # Every upsert is already committed.
+        pass
+
+    async def get_all(self) -> dict[str, Any]:
+        rows = self._db.query("select id, value from kv where namespace = ?", (self.namespace,))
+        return {id: json.loads(value) for id, value in rows}
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        rows = self._db.query("select value from kv where namespace = ? and id = ?", (self.namespace, id))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        found = dict(self._db.query(
+            f"select id, value from kv where namespace = ? and id in ({','.join('?' * len(ids))})",
+            (self.namespace, *ids),
+        )) if ids else {}
+        return [json.loads(found[id]) if id in found else None for id in ids]
+
+    async def filter_keys(self, keys: set[str]) -> set[str]:
+        keys = list(keys)
+        found = {row[0] for row in self._db.query(
+            f"select id from kv where namespace = ? and id in ({','.join('?' * len(keys))})",
+            (self.namespace, *keys),
+        )} if keys else set()
+        return set(keys) - found
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        self._db.write(
+            "insert or replace into kv (namespace, id, value) values (?, ?, ?)",
+            [(self.namespace, id, json.dumps(value, ensure_ascii=False)) for id, value in data.items()],
+        )
+
+    async def delete(self, ids: list[str]) -> None:
+        self._db.write("delete from kv where namespace = ? and id = ?", [(self.namespace, id) for id in ids])
+
+    async def drop_cache_by_modes(self, modes: list[str] | None = None) -> bool:
+        if not modes:
+            return False
+        try:
+            await self.delete(modes)
+            return True
+        except Exception:
+            return False
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            self._db.write("delete from kv where namespace = ?", [(self.namespace,)])
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+
+@final
+@dataclass
+class SqliteDocStatusStorage(DocStatusStorage):
+    """Document status, with the status in its own indexed column."""
+
+    def __post_init__(self):
+        self._db = get_database(self.global_config["working_dir"])
+        self._json_file = os.path.join(self.global_config["working_dir"], f"kv_store_{self.namespace}.json")
+
+    async def initialize(self):
+        if os.path.exists(self._json_file) and not self._db.query(
+                "select 1 from doc_status where namespace = ? limit 1", (self.namespace,)):
+            data = load_json(self._json_file) or {}
+            await self.upsert(data)
+            print(f"Imported {len(data)} records from {self._json_file}")
+
+    async def index_done_callback(self) -> None:
+        pass
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        rows = self._db.query("select value from doc_status where namespace = ? and id = ?", (self.namespace, id))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        found = dict(self._db.query(
+            f"select id, value from doc_status where namespace = ? and id in ({','.join('?' * len(ids))})",
+            (self.namespace, *ids),
+        )) if ids else {}
+        return [json.loads(found[id]) for id in ids if id in found]
+
+    async def filter_keys(self, keys: set[str]) -> set[str]:
+        keys = list(keys)
+        found = {row[0] for row in self._db.query(
+            f"select id from doc_status where namespace = ? and id in ({','.join('?' * len(keys))})",
+            (self.namespace, *keys),
+        )} if keys else set()
+        return set(keys) - found
+
+    async def get_status_counts(self) -> dict[str, int]:
+        counts = {status.value: 0 for status in DocStatus}
+        counts.update(self._db.query(
+            "select status, count(*) from doc_status where namespace = ? group by status", (self.namespace,)))
+        return counts
+
+    async def get_docs_by_status(self, status: DocStatus) -> dict[str, DocProcessingStatus]:
+        result = {}
+        for id, value in self._db.query(
+                "select id, value from doc_status where namespace = ? and status = ?", (self.namespace, status.value)):
+            data = json.loads(value)
+            if "content" not in data and "content_summary" in data:
+                data["content"] = data["content_summary"]
+            data.setdefault("file_path", "no-file-path")
+            try:
+                result[id] = DocProcessingStatus(**data)
+            except (KeyError, TypeError) as e:
+                print(f"Skipping document {id} with bad status record: {e}")
+        return result
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        self._db.write(
+            "insert or replace into doc_status (namespace, id, status, value) values (?, ?, ?, ?)",
+            [(self.namespace, id, value["status"], json.dumps(value, ensure_ascii=False))
+             for id, value in data.items()],
+        )
+
+    async def delete(self, doc_ids: list[str]) -> None:
+        self._db.write("delete from doc_status where namespace = ? and id = ?",
+                       [(self.namespace, id) for id in doc_ids])
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            self._db.write("delete from doc_status where namespace = ?", [(self.namespace,)])
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+
+@final
+@dataclass
+class MemmapVectorDBStorage(BaseVectorStorage):
+    """Normalized float32 vectors in an append-only, memory-mapped file.
+
+    SQLite maps each id to its row in the file plus its metadata, and keeps
+    the number of rows committed to the file: anything past it is a torn
+    write and is cut off. An upsert appends new rows and repoints the ids;
+    rows no longer referenced are dead until the file is compacted into the
+    next generation, `vdb_<namespace>.<generation>.f32`. Only the (id, row)
+    table is held in memory, and it is reloaded when another process has
+    written to the database.
+    """
+
+    def __post_init__(self):
+        kwargs = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        self.cosine_better_than_threshold = kwargs.get("cosine_better_than_threshold")
+        if self.cosine_better_than_threshold is None:
+            raise ValueError("cosine_better_than_threshold must be specified in vector_db_storage_cls_kwargs")
+
+        working_dir = self.global_config["working_dir"]
+        self._db = get_database(working_dir)
+        self._working_dir = working_dir
+        self._json_file = os.path.join(working_dir, f"vdb_{self.namespace}.json")
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._dim = self.embedding_func.embedding_dim
+
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._ids = self._rows = None
+        self._version = None
+
+    async def initialize(self):
+        with self._lock, self._db.transaction() as conn:
+            generation, rows = self._file_state(conn)
+            self._truncate(self._vector_path(generation), rows)
+        if not rows and os.path.exists(self._json_file):
+            self._import_json()
+
+    def _vector_path(self, generation):
+        name = f"vdb_{self.namespace}.f32" if generation == 0 else f"vdb_{self.namespace}.{generation}.f32"
+        return os.path.join(self._working_dir, name)
+
+    def _file_state(self, conn):
+        """(generation, committed rows) of this namespace's vector file."""
+        state = conn.execute("select generation, rows from vector_files where namespace = ?",
+                             (self.namespace,)).fetchone()
+        if state is not None:
+            return state
+        # Stores written before the row count was kept: rows past the last
+        # referenced one are dead or torn.
+        last, = conn.execute("select max(row) from vectors where namespace = ?", (self.namespace,)).fetchone()
+        return 0, 0 if last is None else last + 1
+
+    def _set_file_state(self, conn, generation, rows):
+        conn.execute("insert or replace into vector_files (namespace, generation, rows) values (?, ?, ?)",
+                     (self.namespace, generation, rows))
+
+    def _truncate(self, vector_file, rows):
+        size = rows * 4 * self._dim
+        if os.path.exists(vector_file) and os.path.getsize(vector_file) > size:
+            print(f"Truncating {vector_file} to its {rows} committed rows")
+            os.truncate(vector_file, size)
+
+    def _import_json(self):
+        # NanoVectorDB's format: base64 float32 matrix (already normalized)
+        # plus one metadata record per row.
+        storage = load_json(self._json_file) or {}
+        data = storage.get("data", [])
+        matrix = np.frombuffer(base64.b64decode(storage.get("matrix", "")), dtype=np.float32)
+        self._append(
+            [record["__id__"] for record in data],
+            matrix.reshape(-1, self._dim),
+            [record.get("__created_at__", time.time()) for record in data],
+            [{k: v for k, v in record.items() if not k.startswith("__")} for record in data],
+        )
+        print(f"Imported {len(data)} vectors from {self._json_file}")
+
+    def _append(self, ids, vectors, created_at, metas):
+        with self._lock, self._db.transaction() as conn:
+            generation, first_row = self._file_state(conn)
+            vector_file = self._vector_path(generation)
+            self._truncate(vector_file, first_row)
+            with open(vector_file, "ab") as file:
+                file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+            conn.executemany(
+                "insert or replace into vectors (namespace, id, row, created_at, meta) values (?, ?, ?, ?, ?)",
+                [(self.namespace, id, first_row + i, created_at[i], json.dumps(metas[i], ensure_ascii=False))
+                 for i, id in enumerate(ids)],
+            )
+            self._set_file_state(conn, generation, first_row + len(ids))
+            self._version = None
+        self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        with self._lock, self._db.transaction() as conn:
+            generation, rows = self._file_state(conn)
+            live, = conn.execute("select count(*) from vectors where namespace = ?", (self.namespace,)).fetchone()
+            dead = rows - live
+            if dead < VECTOR_COMPACT_MIN_ROWS or dead <= rows * LIGHTRAG_VECTOR_COMPACT_RATIO:
+                return
+            old_file = self._compact(conn, generation, rows)
+            self._matrix = None
+            self._version = None
+        # Processes still mapping the old file keep it until they reload.
+        try:
+            os.remove(old_file)
+        except OSError as e:
+            print(f"Could not remove {old_file}: {e}")
+
+    def _compact(self, conn, generation, rows):
+        """Copy the live rows, in row order, into the next generation's file.
+
+        Runs inside `conn`'s transaction; the ids are repointed when it
+        commits. Returns the old file.
+        """
+        live = conn.execute("select id, row from vectors where namespace = ? order by row",
+                            (self.namespace,)).fetchall()
+        old_file, new_file = self._vector_path(generation), self._vector_path(generation + 1)
+        matrix = np.memmap(old_file, dtype=np.float32, mode="r", shape=(rows, self._dim))
+        with open(new_file, "wb") as file:
+            for start in range(0, len(live), VECTOR_COPY_BATCH_ROWS):
+                batch = [row for _, row in live[start:start + VECTOR_COPY_BATCH_ROWS]]
+                file.write(np.ascontiguousarray(matrix[batch]).tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        del matrix
+        conn.executemany("update vectors set row = ? where namespace = ? and id = ?",
+                         [(i, self.namespace, id) for i, (id, _) in enumerate(live)])
+        self._set_file_state(conn, generation + 1, len(live))
+        print(f"Compacted {old_file}: {rows - len(live)} dead rows dropped, {len(live)} kept in {new_file}")
+        return old_file
+
+    def _index(self):
+        """(ids, rows, matrix) for the live vectors, reloaded when stale."""
+        version = self._db.data_version()
+        with self._lock:
+            if self._version is None or version != self._version:
+                # One snapshot, so the rows and the file they point into agree.
+                with self._db.transaction("deferred") as conn:
+                    rows = conn.execute("select id, row from vectors where namespace = ? order by row",
+                                        (self.namespace,)).fetchall()
+                    generation, count = self._file_state(conn)
+                self._ids = [id for id, _ in rows]
+                self._rows = np.array([row for _, row in rows], dtype=np.int64)
+                # np.memmap refuses empty files. Rows appended since the
+                # state was read are not mapped yet.
+                vector_file = self._vector_path(generation)
+                self._matrix = np.memmap(vector_file, dtype=np.float32, mode="r",
+                                         shape=(count, self._dim)) if count and os.path.exists(vector_file) else None
+                self._version = version
+            return self._ids, self._rows, self._matrix
+
+    def _records(self, ids):
+        if not ids:
+            return {}
+        rows = self._db.query(
+            f"select id, created_at, meta from vectors where namespace = ? and id in ({','.join('?' * len(ids))})",
+            (self.namespace, *ids),
+        )
+        return {id: {**json.loads(meta), "__id__": id, "__created_at__": created_at} for id, created_at, meta in rows}
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        contents = [value["content"] for value in data.values()]
+        embeddings = np.concatenate([
+            await self.embedding_func(contents[i:i + self._max_batch_size])
+            for i in range(0, len(contents), self._max_batch_size)
+        ]).astype(np.float32)
+        if len(embeddings) != len(data):
+            print(f"Embedding is not 1-1 with data, {len(embeddings)} != {len(data)}")
+            return
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        now = time.time()
+        self._append(
+            list(data),
+            embeddings / np.maximum(norms, 1e-12),
+            [now] * len(data),
+            [{k: v for k, v in value.items() if k in self.meta_fields} for value in data.values()],
+        )
+
+    async def query(self, query: str, top_k: int, ids: list[str] | None = None) -> list[dict[str, Any]]:
+        # LightRAG has no rerank step of its own, so text chunks are
+        # reranked here: over-fetch candidates and keep the best `top_k`.
+        reranker = get_reranker() if is_namespace(self.namespace, NameSpace.VECTOR_STORE_CHUNKS) else None
+        if reranker is None or reranker.failed:
+            return await self._query(query, top_k)
+        candidates = await self._query(query, max(top_k, RERANK_CANDIDATES))
+        return await asyncio.to_thread(
+            reranker.rerank, query, candidates, [record["id"] for record in candidates],
+            [record.get("content", "") for record in candidates], top_k)
+
+    async def _query(self, query, top_k):
+        embedding = (await self.embedding_func([query]))[0].astype(np.float32)
+        embedding /= max(float(np.linalg.norm(embedding)), 1e-12)
+
+        live_ids, rows, matrix = self._index()
+        if matrix is None or not live_ids:
+            return []
+        # Score the whole mapped file and pick the live rows afterwards:
+        # no copy of the matrix, and dead rows are few.
+        scores = (matrix @ embedding)[rows]
+        top = np.argsort(-scores)[:top_k] if top_k >= len(scores) else np.argpartition(-scores, top_k)[:top_k]
+        top = [i for i in top[np.argsort(-scores[top])] if scores[i] > self.cosine_better_than_threshold]
+
+        records = self._records([live_ids[i] for i in top])
+        results = []
+        for i in top:
+            record = records.get(live_ids[i])
+            if record is not None:
+                results.append({**record, "id": live_ids[i], "distance": float(scores[i]),
+                                "created_at": record["__created_at__"]})
+        return results
+
+    @property
+    async def client_storage(self):
+        # The shape of NanoVectorDB's storage, which LightRAG scans when
+        # deleting documents.
+        rows = self._db.query("select id, created_at, meta from vectors where namespace = ?", (self.namespace,))
+        return {"data": [{**json.loads(meta), "__id__": id, "__created_at__": created_at}
+                         for id, created_at, meta in rows]}
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        return self._records([id]).get(id)
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        records = self._records(ids)
+        return [records[id] for id in ids if id in records]
+
+    async def search_by_prefix(self, prefix: str) -> list[dict[str, Any]]:
+        rows = self._db.query(
+            "select id, created_at, meta from vectors where namespace = ? and substr(id, 1, ?) = ?",
+            (self.namespace, len(prefix), prefix),
+        )
+        return [{**json.loads(meta), "__id__": id, "__created_at__": created_at, "id": id}
+                for id, created_at, meta in rows]
+
+    async def delete(self, ids: list[str]):
+        self._db.write("delete from vectors where namespace = ? and id = ?", [(self.namespace, id) for id in ids])
+        with self._lock:
+            self._version = None
+        self._compact_if_needed()
+
+    async def delete_entity(self, entity_name: str) -> None:
+        await self.delete([compute_mdhash_id(entity_name, prefix="ent-")])
+
+    async def delete_entity_relation(self, entity_name: str) -> None:
+        rows = self._db.query(
+            "select id from vectors where namespace = ? "
+            "and (json_extract(meta, '$.src_id') = ? or json_extract(meta, '$.tgt_id') = ?)",
+            (self.namespace, entity_name, entity_name),
+        )
+        await self.delete([id for id, in rows])
+
+    async def index_done_callback(self) -> bool:
+        # Vectors are fsynced and ids committed on every upsert.
+        return True
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            with self._lock, self._db.transaction() as conn:
+                generation, _ = self._file_state(conn)
+                conn.execute("delete from vectors where namespace = ?", (self.namespace,))
+                conn.execute("delete from vector_files where namespace = ?", (self.namespace,))
+                self._matrix = None
+                self._version = None
+                vector_file = self._vector_path(generation)
+                if os.path.exists(vector_file):
+                    os.remove(vector_file)
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+
+@final
+@dataclass
+class CsrGraphStorage(BaseGraphStorage):
+    """Knowledge graph served from a compiled, memory-mapped CSR file.
+
+    Queries read the mapped arrays directly. Ingestion needs a mutable
+    graph, so the first write loads a networkx copy that serves every call
+    until `index_done_callback` writes it back as GraphML and recompiles.
+    The compiled file is reopened when another process replaces it.
+    """
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._graphml_file = os.path.join(working_dir, f"graph_{self.namespace}.graphml")
+        self._csr_file = os.path.join(working_dir, f"graph_{self.namespace}.csr")
+        self._lock = threading.Lock()
+        self._csr = None
+        self._csr_version = None
+        self._nx = None
+
+    async def initialize(self):
+        if os.path.exists(self._graphml_file) and (
+                not os.path.exists(self._csr_file)
+                or os.path.getmtime(self._graphml_file) > os.path.getmtime(self._csr_file)):
+            nodes, edges = compile_graphml(self._graphml_file, self._csr_file)
+            print(f"Compiled {nodes} nodes and {edges} edges from {self._graphml_file}")
+
+    def _graph(self):
+        """The writable networkx graph if there is one, else the compiled graph."""
+        if self._nx is not None:
+            return self._nx
+        version = os.stat(self._csr_file).st_mtime_ns if os.path.exists(self._csr_file) else None
+        with self._lock:
+            if self._csr is None or version != self._csr_version:
+                self._csr = CsrGraph.open(self._csr_file) if version else CsrGraph(compile_graph([], []))
+                self._csr_version = version
+            return self._csr
+
+    def _writable(self):
+        if self._nx is None:
+            self._nx = self._graph().to_networkx()
+        return self._nx
+
+    async def has_node(self, node_id: str) -> bool:
+        graph = self._graph()
+        if graph is self._nx:
+            return graph.has_node(node_id)
+        return graph.node_id(node_id) is not None
+
+    async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        return await self.get_edge(source_node_id, target_node_id) is not None
+
+    async def node_degree(self, node_id: str) -> int:
+        graph = self._graph()
+        if graph is self._nx:
+            return graph.degree(node_id) if graph.has_node(node_id) else 0
+        node = graph.node_id(node_id)
+        return graph.degree(node) if node is not None else 0
+
+    async def edge_degree(self, src_id: str, tgt_id: str) -> int:
+        return await self.node_degree(src_id) + await self.node_degree(tgt_id)
+
+    async def get_node(self, node_id: str) -> dict[str, str] | None:
+        graph = self._graph()
+        if graph is self._nx:
+            return graph.nodes.get(node_id)
+        node = graph.node_id(node_id)
+        return graph.node_attrs(node) if node is not None else None
+
+    async def get_edge(self, source_node_id: str, target_node_id: str) -> dict[str, str] | None:
+        graph = self._graph()
+        if graph is self._nx:
+            return graph.edges.get((source_node_id, target_node_id))
+        source, target = graph.node_id(source_node_id), graph.node_id(target_node_id)
+        if source is None or target is None:
+            return None
+        edge = graph.edge_id(source, target)
+        return graph.edge_attrs(edge) if edge is not None else None
+
+    async def get_node_edges(self, source_node_id: str) -> list[tuple[str, str]] | None:
+        graph = self._graph()
+        if graph is self._nx:
+            return list(graph.edges(source_node_id)) if graph.has_node(source_node_id) else None
+        node = graph.node_id(source_node_id)
+        if node is None:
+            return None
+        return [(source_node_id, graph.name(int(neighbor))) for neighbor in graph.neighbors(node)]
+
+    # Batch lookups, for LightRAG versions whose query path uses them: one
+    # vectorized pass over the CSR arrays instead of a call per node.
+
+    async def get_nodes_batch(self, node_ids: list[str]) -> dict[str, dict]:
+        graph = self._graph()
+        if graph is self._nx:
+            return {node_id: graph.nodes[node_id] for node_id in node_ids if graph.has_node(node_id)}
+        nodes = graph.node_ids(node_ids)
+        return {node_id: graph.node_attrs(int(node)) for node_id, node in zip(node_ids, nodes) if node >= 0}
+
+    async def node_degrees_batch(self, node_ids: list[str]) -> dict[str, int]:
+        graph = self._graph()
+        if graph is self._nx:
+            return {node_id: graph.degree(node_id) if graph.has_node(node_id) else 0 for node_id in node_ids}
+        nodes = graph.node_ids(node_ids)
+        degrees = np.where(nodes >= 0, graph.degrees(np.maximum(nodes, 0)), 0)
+        return {node_id: int(degree) for node_id, degree in zip(node_ids, degrees)}
+
+    async def edge_degrees_batch(self, edge_pairs: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+        degrees = await self.node_degrees_batch(list({node_id for pair in edge_pairs for node_id in pair}))
+        return {(source, target): degrees[source] + degrees[target] for source, target in edge_pairs}
+
+    async def get_edges_batch(self, pairs: list[dict[str, str]]) -> dict[tuple[str, str], dict]:
+        graph = self._graph()
+        if graph is self._nx:
+            edges = {}
+            for pair in pairs:
+                edge = graph.edges.get((pair["src"], pair["tgt"]))
+                if edge is not None:
+                    edges[(pair["src"], pair["tgt"])] = edge
+            return edges
+        names = list({name for pair in pairs for name in (pair["src"], pair["tgt"])})
+        ids = dict(zip(names, graph.node_ids(names)))
+        edges = {}
+        for pair in pairs:
+            source, target = ids[pair["src"]], ids[pair["tgt"]]
+            edge = graph.edge_id(int(source), int(target)) if source >= 0 and target >= 0 else None
+            if edge is not None:
+                edges[(pair["src"], pair["tgt"])] = graph.edge_attrs(edge)
+        return edges
+
+    async def get_nodes_edges_batch(self, node_ids: list[str]) -> dict[str, list[tuple[str, str]]]:
+        graph = self._graph()
+        if graph is self._nx:
+            return {node_id: list(graph.edges(node_id)) if graph.has_node(node_id) else [] for node_id in node_ids}
+        nodes = graph.node_ids(node_ids)
+        found = nodes >= 0
+        positions, counts = graph.entries(nodes[found])
+        neighbors = graph.indices[positions]
+        # Decode each neighbour's name once, however many nodes share it.
+        unique, inverse = np.unique(neighbors, return_inverse=True)
+        names = [graph.name(int(node)) for node in unique]
+        neighbor_names = iter([names[i] for i in inverse])
+        edges = {node_id: [] for node_id in node_ids}
+        for node_id, count in zip((node_id for node_id, hit in zip(node_ids, found) if hit), counts):
+            edges[node_id] = [(node_id, next(neighbor_names)) for _ in range(int(count))]
+        return edges
+
+    async def upsert_node(self, node_id: str, node_data: dict[str, str]) -> None:
+        self._writable().add_node(node_id, **node_data)
+
+    async def upsert_edge(self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]) -> None:
+        self._writable().add_edge(source_node_id, target_node_id, **edge_data)
+
+    async def delete_node(self, node_id: str) -> None:
+        graph = self._writable()
+        if graph.has_node(node_id):
+            graph.remove_node(node_id)
+
+    async def remove_nodes(self, nodes: list[str]):
+        graph = self._writable()
+        graph.remove_nodes_from([node for node in nodes if graph.has_node(node)])
+
+    async def remove_edges(self, edges: list[tuple[str, str]]):
+        graph = self._writable()
+        graph.remove_edges_from([(source, target) for source, target in edges if graph.has_edge(source, target)])
+
+    async def embed_nodes(self, algorithm: str) -> tuple[np.ndarray[Any, Any], list[str]]:
+        # LightRAG never calls this (NetworkXStorage's node2vec is marked
+        # unused upstream), so there are no node embeddings to return.
+        return np.empty((0, 0), dtype=np.float32), []
+
+    async def get_all_labels(self) -> list[str]:
+        graph = self._graph()
+        if graph is self._nx:
+            return sorted(str(node) for node in graph.nodes())
+        return sorted(graph.name(node) for node in range(len(graph)))
+
+    async def get_knowledge_graph(self, node_label: str, max_depth: int = 3, max_nodes: int = 1000) -> KnowledgeGraph:
+        graph = self._graph()
+        if graph is self._nx:
+            graph = CsrGraph.from_networkx(graph)
+
+        result = KnowledgeGraph()
+        if node_label == "*":
+            # The best-connected nodes.
+            degrees = np.diff(graph.indptr)
+            nodes = np.argsort(-degrees, kind="stable")[:max_nodes]
+            result.is_truncated = len(graph) > max_nodes
+        else:
+            seed = graph.node_id(node_label)
+            if seed is None:
+                print(f"Node {node_label} not found in the graph")
+                return result
+            nodes, result.is_truncated = graph.k_hop([seed], max_depth, max_nodes)
+
+        for node in nodes:
+            name = graph.name(int(node))
+            result.nodes.append(KnowledgeGraphNode(id=name, labels=[name], properties=graph.node_attrs(int(node))))
+        for edge in graph.edges_within(nodes):
+            source, target = sorted((graph.name(int(graph.edge_src[edge])), graph.name(int(graph.edge_tgt[edge]))))
+            result.edges.append(KnowledgeGraphEdge(
+                id=f"{source}-{target}", type="DIRECTED", source=source, target=target,
+                properties=graph.edge_attrs(int(edge))))
+        return result
+
+    async def index_done_callback(self) -> bool:
+        graph = self._nx
+        if graph is None:
+            return True
+        import networkx as nx
+
+        try:
+            # GraphML stays the portable copy (LIGHTRAG_STORAGE=json reads it).
+            nx.write_graphml(graph, self._graphml_file + ".tmp")
+            os.replace(self._graphml_file + ".tmp", self._graphml_file)
+            write_graph(self._csr_file, compile_networkx(graph))
+        except Exception as e:
+            print(f"Error saving graph {self.namespace}: {e}")
+            return False
+        self._nx = None
+        return True
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            with self._lock:
+                for path in (self._graphml_file, self._csr_file):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._nx = None
+                self._csr = None
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
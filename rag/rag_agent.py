@@ -4,12 +4,15 @@ import sys
 import asyncio
 import numpy as np
 import nest_asyncio
-from google import genai
-from google.genai import types
 from lightrag import LightRAG, QueryParam
 from lightrag.kg.shared_storage import initialize_pipeline_status
 from lightrag.utils import EmbeddingFunc
-from sentence_transformers import SentenceTransformer
+from llm.provider import get_llm_provider
+from rag.embedding_service import EMBEDDING_DIM, get_embedding_service
+from rag.lightrag_storage import storage_kwargs
+from rag.chunk_store import get_chunk_store
+from rag.ingest import ingest_pages
+from rag.keyword_extractor import keyword_params
 from dotenv import load_dotenv
 
 
@@ -30,14 +33,12 @@ class RagAgent:
         self.working_dir = "data/lightrag"
         self.history_messages = None
 
-        google_api_key = os.getenv('GOOGLE_API_KEY')
-        print(google_api_key) 
-        self.client = genai.Client(api_key=google_api_key)
+        self.provider = get_llm_provider()
 
         self.rag = asyncio.run(self.initialize_rag())
 
-        # This needs to be done just once.
-        self.insert_data_to_db(self.get_markdown_from_file())
+        # Incremental: pages already in the working dir are skipped.
+        ingest_pages(self.rag, get_chunk_store().pages())
 
         self.retrieve(prompt)
 
@@ -46,20 +47,19 @@ class RagAgent:
             working_dir=self.working_dir,
             llm_model_func=self.cag_response_call,
             embedding_func=EmbeddingFunc(
-                embedding_dim=384,
+                embedding_dim=EMBEDDING_DIM,
                 max_token_size=8192,
                 func=self.embedding_func,
             ),
+            **storage_kwargs(),
         )
         await rag.initialize_storages()
         await initialize_pipeline_status()
 
         return rag
     
-    async def embedding_func(texts: list[str]) -> np.ndarray:
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-        embeddings = model.encode(texts, convert_to_numpy=True)
-        return embeddings
+    async def embedding_func(self, texts: list[str]) -> np.ndarray:
+        return await get_embedding_service().aencode(texts)
 
     def retrieve(self, search_query: str, conversation_history: str) -> str:
         """Retrieve relevant documents from ChromaDB based on a search query."""
@@ -69,7 +69,8 @@ class RagAgent:
                 mode="mix", 
                 top_k=5,
                 conversation_history=conversation_history,  # Add the conversation history
-                history_turns=3  # Number of recent conversation turns to consider
+                history_turns=3,  # Number of recent conversation turns to consider
+                **keyword_params(self.rag, search_query),
             )
         )
         return result
@@ -97,11 +98,5 @@ class RagAgent:
         
         combined_prompt += f"user: {prompt}"
 
-        response = self.client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=[combined_prompt],
-            config=types.GenerateContentConfig(max_output_tokens=500, temperature=0.1)
-        )
-        
-        return(response.text)
+        return self.provider.generate("answer", combined_prompt, max_output_tokens=500, temperature=0.1)
 
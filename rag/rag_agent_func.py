@@ -1,19 +1,27 @@
 import os
 import json
 import numpy as np
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
-from lightrag.utils import EmbeddingFunc
+from lightrag.utils import EmbeddingFunc, always_get_an_event_loop
 from lightrag import LightRAG, QueryParam
-from sentence_transformers import SentenceTransformer
+from lightrag.prompt import PROMPTS
 from lightrag.kg.shared_storage import initialize_pipeline_status
 
 import asyncio
+import threading
 import nest_asyncio
-import torch
 
-torch.classes.__path__ = []
+from backends import ChatError
+from cache.semantic_cache import get_answer_cache
+from llm.history import PROMPT_TOKEN_BUDGET, estimate_tokens, get_history_manager
+from llm.provider import get_llm_provider
+from observability.metrics import span
+from rag.embedding_service import EMBEDDING_DIM, get_embedding_service
+from rag.lightrag_storage import storage_kwargs
+from rag.chunk_store import get_chunk_store
+from rag.ingest import ingest_pages
+from rag.keyword_extractor import get_keyword_extractor, keyword_params
+from retrieval.reranker import get_reranker
 
 # Apply nest_asyncio to solve event loop issues
 nest_asyncio.apply()
@@ -36,10 +44,11 @@ if not os.path.exists(WORKING_DIR):
 
 
 async def llm_model_func(
-    prompt, system_prompt=None, history_messages=[], keyword_extraction=False, **kwargs
+    prompt, system_prompt=None, history_messages=[], keyword_extraction=False, provider=None, **kwargs
 ) -> str:
-    # 1. Initialize the GenAI Client with your Gemini API Key
-    client = genai.Client(api_key=gemini_api_key)
+    # 1. Use the shared provider; keyword extraction goes to a cheaper model
+    provider = provider or get_llm_provider()
+    task = "keywords" if keyword_extraction else "rag_answer"
 
     # 2. Combine prompts: system prompt, history, and user prompt
     if history_messages is None:
@@ -57,31 +66,31 @@ async def llm_model_func(
     
     combined_prompt += f"system: {system_prompt}\n\n"
 
-    for msg in history_messages:
-        # Each msg is expected to be a dict: {"role": "...", "content": "..."}
-        combined_prompt += f"{msg['role']}: {msg['content']}\n"
+    # Each msg is expected to be a dict: {"role": "...", "content": "..."}.
+    # Older turns are summarized so the history stays within the budget
+    # left over by the system prompt and the (context-carrying) prompt.
+    history = get_history_manager().compact(
+        history_messages, PROMPT_TOKEN_BUDGET - estimate_tokens(system_prompt + prompt)
+    )
+    if history:
+        combined_prompt += f"{history}\n"
 
     # Finally, add the new user prompt
     combined_prompt += f"user: {prompt}"
 
-    # 3. Call the Gemini model
-    response = client.models.generate_content(
-        # model="gemini-1.5-flash",
-        model="gemini-1.5-pro",
-        contents=[combined_prompt],
-        config=types.GenerateContentConfig(max_output_tokens=500, temperature=0.1, response_mime_type="text/plain"),
-    )
+    # 3. Call the Gemini model. LightRAG asks for an async iterator of text
+    # chunks when QueryParam.stream is set.
+    if kwargs.get("stream"):
+        return provider.astream(task, combined_prompt, response_mime_type="text/plain")
 
-    print(f"LLM: {response.text}")
+    response = await provider.agenerate(task, combined_prompt, response_mime_type="text/plain")
 
     # 4. Return the response text
-    return response.text
+    return response
 
 
 async def embedding_func(texts: list[str]) -> np.ndarray:
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = model.encode(texts, convert_to_numpy=True)
-    return embeddings
+    return await get_embedding_service().aencode(texts)
 
 
 async def initialize_rag():
@@ -89,10 +98,11 @@ async def initialize_rag():
         working_dir=WORKING_DIR,
         llm_model_func=llm_model_func,
         embedding_func=EmbeddingFunc(
-            embedding_dim=384,
+            embedding_dim=EMBEDDING_DIM,
             max_token_size=8192,
             func=embedding_func,
         ),
+        **storage_kwargs(),
     )
 
     await rag.initialize_storages()
@@ -101,6 +111,11 @@ async def initialize_rag():
     return rag
 
 
+def is_failed_answer(answer):
+    # LightRAG answers with its fail_response text instead of raising.
+    return not isinstance(answer, str) or not answer.strip() or PROMPTS["fail_response"] in answer
+
+
 def rag_retrieve(rag, search_query: str, conversation_history=[]) -> str:
     """Retrieve relevant documents using LightRag based on a search query."""
 
@@ -122,20 +137,73 @@ def rag_retrieve(rag, search_query: str, conversation_history=[]) -> str:
         - Target format and length: {response_type}
     """
 
+    cache = get_answer_cache()
+    cached = cache.get(search_query, namespace="lightrag", conversation_history=conversation_history)
+    if cached is not None:
+        return cached
+
     result = rag.query(
         search_query, 
         param=QueryParam(
             mode="mix", 
             conversation_history=conversation_history,
-            history_turns=3
+            history_turns=3,
+            **keyword_params(rag, search_query, conversation_history),
         ),
         # system_prompt=custom_prompt
     )
 
-    print(f"Result: {result}")
+    if not is_failed_answer(result):
+        cache.put(search_query, result, namespace="lightrag", conversation_history=conversation_history)
     return result
 
 
+def rag_retrieve_stream(rag, search_query: str, conversation_history=[]):
+    """Yield the LightRag answer as text chunks while Gemini generates it."""
+    cache = get_answer_cache()
+    cached = cache.get(search_query, namespace="lightrag", conversation_history=conversation_history)
+    if cached is not None:
+        yield cached
+        return
+
+    loop = always_get_an_event_loop()
+
+    # With stream=True, aquery returns once retrieval is done; generation
+    # happens as the stream is consumed. Keywords are extracted locally, so
+    # generation is the only LLM call.
+    with span("retrieve"):
+        result = loop.run_until_complete(rag.aquery(
+            search_query,
+            param=QueryParam(
+                mode="mix",
+                conversation_history=conversation_history,
+                history_turns=3,
+                stream=True,
+                **keyword_params(rag, search_query, conversation_history),
+            ),
+        ))
+
+    # LightRAG's own cache hands back whole answers rather than a stream.
+    if isinstance(result, str):
+        if not is_failed_answer(result):
+            cache.put(search_query, result, namespace="lightrag", conversation_history=conversation_history)
+        yield result
+        return
+
+    chunks = []
+    while True:
+        try:
+            chunk = loop.run_until_complete(result.__anext__())
+        except StopAsyncIteration:
+            break
+        chunks.append(chunk)
+        yield chunk
+
+    answer = "".join(chunks)
+    if not is_failed_answer(answer):
+        cache.put(search_query, answer, namespace="lightrag", conversation_history=conversation_history)
+
+
 def get_markdown_from_file(filename=DATA_DIR):
     with open(filename, "r", encoding="utf-8") as file:
         data = json.load(file)
@@ -150,11 +218,14 @@ def get_markdown_from_file(filename=DATA_DIR):
 def save_markdown_to_file(markdowns, filename=MD_DIR):
     with open(filename, "w", encoding="utf-8") as file:
         file.write(markdowns)
-    print("file created successfully")
 
 
-def rag_insert_data_to_db(rag, markdowns=get_markdown_from_file()):
-    rag.insert(markdowns)
+def rag_insert_data_to_db(rag, pages=None):
+    # One LightRAG document per page, with boilerplate stripped; only new or
+    # changed pages are inserted.
+    if pages is None:
+        pages = get_chunk_store().pages()
+    return ingest_pages(rag, pages)
 
 
 def rag():
@@ -164,6 +235,41 @@ def rag():
     return rag
 
 
+class LightRagBackend:
+    """Chat backend answering from the LightRAG store in WORKING_DIR."""
+
+    def __init__(self):
+        with span("client_init"):
+            self.rag = rag()
+            get_keyword_extractor(self.rag.working_dir)
+            reranker = get_reranker()
+            if reranker is not None:
+                reranker.warm_up()
+
+    def chat(self, prompt, conversation_history=[], mode=None):
+        return rag_retrieve(self.rag, prompt, conversation_history)
+
+    def stream_chat(self, prompt, conversation_history=[], mode=None):
+        try:
+            yield from rag_retrieve_stream(self.rag, prompt, conversation_history)
+        except Exception as e:
+            print(f"Streamed answer failed: {e}")
+            raise ChatError() from e
+
+
+_lightrag_backend = None
+_lightrag_backend_lock = threading.Lock()
+
+
+def get_lightrag_backend():
+    global _lightrag_backend
+    if _lightrag_backend is None:
+        with _lightrag_backend_lock:
+            if _lightrag_backend is None:
+                _lightrag_backend = LightRagBackend()
+    return _lightrag_backend
+
+
 # if __name__ == "__main__":
 #     init = rag()
 #     rag_insert_data_to_db(init)
\ No newline at end of file
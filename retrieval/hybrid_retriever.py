@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import asyncio
+import threading
+
+import numpy as np
+
+from rag.chunk_store import get_chunk_store
+
+
+INDEX_DIR = os.path.abspath(os.getenv("LOCAL_INDEX_DIR", "./data/index"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how i in is it its of on or that the this to was
+were what when where which who why will with you your
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def build_index(chunks, embed=None, index_dir=INDEX_DIR):
+    """Write the BM25 postings and dense embedding matrix for `chunks`.
+
+    `chunks` is a ChunkStore (or any sequence of {url, text} dicts); the
+    index refers to chunks by position and reads their text from the store.
+    Every array is stored as its own .npy file so `HybridIndex` can
+    memory-map it instead of reading it into memory.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    digest = chunks.digest() if hasattr(chunks, "digest") else None
+    chunks = list(chunks)
+
+    vocab = {}
+    doc_terms = []
+    doc_len = np.zeros(len(chunks), dtype=np.float32)
+    for doc_id, chunk in enumerate(chunks):
+        counts = {}
+        for token in tokenize(chunk["text"]):
+            term_id = vocab.setdefault(token, len(vocab))
+            counts[term_id] = counts.get(term_id, 0) + 1
+        doc_terms.append(counts)
+        doc_len[doc_id] = sum(counts.values())
+
+    # Invert into CSR form: postings for term t live in
+    # posting_docs[term_offsets[t]:term_offsets[t + 1]].
+    postings = [[] for _ in range(len(vocab))]
+    for doc_id, counts in enumerate(doc_terms):
+        for term_id, count in counts.items():
+            postings[term_id].append((doc_id, count))
+
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum([len(p) for p in postings])
+    posting_docs = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=term_offsets[-1])
+    posting_tf = np.fromiter((c for p in postings for _, c in p), dtype=np.float32, count=term_offsets[-1])
+
+    doc_freq = np.diff(term_offsets).astype(np.float32)
+    idf = np.log(1 + (len(chunks) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    np.save(os.path.join(index_dir, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(index_dir, "posting_docs.npy"), posting_docs)
+    np.save(os.path.join(index_dir, "posting_tf.npy"), posting_tf)
+    np.save(os.path.join(index_dir, "idf.npy"), idf)
+    np.save(os.path.join(index_dir, "doc_len.npy"), doc_len)
+
+    if embed is not None:
+        dense = np.asarray(embed([chunk["text"] for chunk in chunks]), dtype=np.float32)
+        dense /= np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+        np.save(os.path.join(index_dir, "dense.npy"), dense)
+
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump({"vocab": list(vocab), "chunk_count": len(chunks), "chunk_digest": digest}, file, ensure_ascii=False)
+
+
+def min_max(scores):
+    low, high = scores.min(), scores.max()
+    if high <= low:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+class HybridIndex:
+    """BM25 + dense retrieval over a prebuilt, memory-mapped local index."""
+
+    def __init__(self, index_dir=INDEX_DIR, embed=None, chunks=None):
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self.term_offsets = load("term_offsets.npy")
+        self.posting_docs = load("posting_docs.npy")
+        self.posting_tf = load("posting_tf.npy")
+        self.idf = load("idf.npy")
+        self.doc_len = load("doc_len.npy")
+        self.avg_doc_len = float(self.doc_len.mean()) if len(self.doc_len) else 0.0
+
+        dense_path = os.path.join(index_dir, "dense.npy")
+        self.dense = np.load(dense_path, mmap_mode="r") if os.path.exists(dense_path) else None
+        self.embed = embed
+
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.vocab = {term: term_id for term_id, term in enumerate(meta["vocab"])}
+
+        self.chunks = chunks if chunks is not None else get_chunk_store()
+        if len(self.chunks) != meta["chunk_count"]:
+            raise ValueError(f"{index_dir} was built for {meta['chunk_count']} chunks, the chunk store has "
+                             f"{len(self.chunks)}; rebuild it with `python -m retrieval.hybrid_retriever`")
+        # The same number of chunks can still be different text.
+        if hasattr(self.chunks, "digest") and self.chunks.digest() != meta.get("chunk_digest"):
+            raise ValueError(f"{index_dir} was built from a different chunk store; "
+                             f"rebuild it with `python -m retrieval.hybrid_retriever`")
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def bm25_scores(self, query):
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        term_ids = [self.vocab[token] for token in set(tokenize(query)) if token in self.vocab]
+        if not term_ids:
+            return scores
+
+        term_ids = np.array(term_ids)
+        starts, ends = self.term_offsets[term_ids], self.term_offsets[term_ids + 1]
+        docs = np.concatenate([self.posting_docs[start:end] for start, end in zip(starts, ends)])
+        tf = np.concatenate([self.posting_tf[start:end] for start, end in zip(starts, ends)])
+        idf = np.repeat(self.idf[term_ids], ends - starts)
+
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[docs] / self.avg_doc_len)
+        contributions = idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return np.bincount(docs, weights=contributions, minlength=len(self.chunks)).astype(np.float32)
+
+    def dense_scores(self, query):
+        embedding = np.asarray(self.embed([query])[0], dtype=np.float32)
+        embedding /= max(float(np.linalg.norm(embedding)), 1e-12)
+        return self.dense @ embedding
+
+    def search(self, query, top_k=3, alpha=0.5):
+        """Return [(chunk_index, score)] best first.
+
+        Like LlamaCloud's hybrid mode, `alpha` weighs dense against sparse
+        relevance: 1.0 is dense only, 0.0 is BM25 only. Both score vectors
+        are min-max normalized before they are mixed.
+        """
+        if not len(self.chunks):
+            return []
+
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        if alpha < 1:
+            scores += (1 - alpha) * min_max(self.bm25_scores(query))
+        if alpha > 0 and self.dense is not None and self.embed is not None:
+            scores += alpha * min_max(self.dense_scores(query))
+
+        top_k = min(top_k, len(self.chunks))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [(int(i), float(scores[i])) for i in ranked if scores[i] > 0]
+
+
+class LocalHybridRetriever:
+    """Drop-in for the LlamaCloud retriever used by `LmmaIndexAgent`.
+
+    `retrieve`/`aretrieve` return llama_index `NodeWithScore`s, so the
+    agent's synthesis and prompt building work unchanged.
+    """
+
+    def __init__(self, index=None, top_k=3, alpha=0.5):
+        if index is None:
+            from rag.embedding_service import get_embedding_service
+            index = HybridIndex(embed=lambda texts: get_embedding_service().encode(texts, normalize=True))
+        self.index = index
+        self.top_k = top_k
+        self.alpha = alpha
+
+    def retrieve(self, query):
+        from llama_index.core.schema import NodeWithScore, TextNode
+
+        nodes = []
+        for chunk_index, score in self.index.search(query, self.top_k, self.alpha):
+            chunk = self.index.chunks[chunk_index]
+            node = TextNode(id_=f"local-{chunk_index}", text=chunk["text"], metadata={"url": chunk["url"]})
+            nodes.append(NodeWithScore(node=node, score=score))
+        return nodes
+
+    async def aretrieve(self, query):
+        # Search is CPU-bound and sub-millisecond once the query is embedded.
+        return await asyncio.to_thread(self.retrieve, query)
+
+
+_local_retriever = None
+_local_retriever_lock = threading.Lock()
+
+
+def local_index_exists(index_dir=INDEX_DIR):
+    return os.path.exists(os.path.join(index_dir, "meta.json"))
+
+
+def get_local_retriever():
+    """Return the shared local retriever, or None if no index has been built."""
+    global _local_retriever
+    if _local_retriever is None and local_index_exists():
+        with _local_retriever_lock:
+            if _local_retriever is None:
+                _local_retriever = LocalHybridRetriever()
+    return _local_retriever
+
+
+if __name__ == "__main__":
+    from rag.embedding_service import get_embedding_service
+
+    chunks = get_chunk_store()
+    build_index(chunks, embed=get_embedding_service().encode)
+    print(f"Indexed {len(chunks)} chunks into {INDEX_DIR}")
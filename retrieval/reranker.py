@@ -0,0 +1,214 @@
+"""Local cross-encoder reranking for any first-stage retriever.
+
+A retriever fetches RERANK_CANDIDATES candidates; `Reranker.rerank` scores
+every (query, candidate) pair with a small cross-encoder in one batched
+forward pass on CPU and keeps the best. Scores are cached per (query,
+chunk id). If scoring does not finish within RERANK_BUDGET_MS (or the
+model is still loading), the first-stage order is kept and the scores
+still land in the cache for the next time the question is asked. If the
+model cannot be loaded at all the reranker is marked failed, and callers
+fall back to the reranking they would use without it.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from observability.metrics import REGISTRY, span, stats_collector
+
+
+# "llamacloud" for LlamaCloud's own reranking, "local" for the cross-encoder
+# below (needs torch; LlamaCloud still reranks what it falls back to), "off"
+# for first-stage order.
+RERANKER = os.getenv("RERANKER", "llamacloud")
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_MAX_LENGTH = 512  # tokens per (query, passage) pair
+
+
+def query_hash(query):
+    return hashlib.blake2b(" ".join(query.lower().split()).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def load_cross_encoder(model_name=RERANKER_MODEL_NAME):
+    import torch
+    # Streamlit's file watcher trips over torch.classes' dynamic __path__.
+    torch.classes.__path__ = []
+
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+
+
+class Reranker:
+    """Process-wide cross-encoder, loaded once, with a score cache.
+
+    `predict(pairs)` returns one relevance score per (query, text) pair;
+    by default it is the cross-encoder's, loaded in the background on first
+    use. Scoring runs on a single worker thread so concurrent turns do not
+    fight over the CPU; a turn that would wait past its budget falls back.
+    """
+
+    def __init__(self, predict=None, budget_ms=RERANK_BUDGET_MS, cache_size=RERANK_CACHE_SIZE):
+        self._predict = predict
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+
+        self._model = None
+        self._loading = None
+        self.failed = False
+        self._cache = OrderedDict()  # (query hash, chunk id) -> score, least recently used first
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+        self.reranked = 0
+        self.fallbacks = 0
+        self.cache_hits = 0
+        self.scored = 0
+
+    def load(self):
+        """Load the model in the calling thread (e.g. before workers fork)."""
+        self._load()
+
+    def warm_up(self):
+        """Start loading the model in the background."""
+        if self.ready or self.failed:
+            return None
+        with self._lock:
+            if self._loading is None:
+                self._loading = self._executor.submit(self._load)
+            return self._loading
+
+    def _load(self):
+        with self._load_lock:
+            if self.ready or self.failed:
+                return
+            try:
+                self._model = load_cross_encoder()
+            except Exception as e:
+                self.failed = True
+                print(f"ERROR: could not load reranker {RERANKER_MODEL_NAME}; LlamaCloud retrieval falls back "
+                      f"to its own reranking, local and LightRAG retrieval to first-stage order: {e!r}")
+
+    @property
+    def ready(self):
+        return self._predict is not None or self._model is not None
+
+    def predict(self, pairs):
+        if self._predict is not None:
+            return np.asarray(self._predict(pairs), dtype=np.float32)
+        return np.asarray(self._model.predict(pairs, batch_size=len(pairs), show_progress_bar=False),
+                          dtype=np.float32)
+
+    def _score(self, query, keys, texts):
+        """Scores for every candidate; only uncached pairs reach the model."""
+        with self._lock:
+            cached = [self._cache.get(key) for key in keys]
+            for key, score in zip(keys, cached):
+                if score is not None:
+                    self._cache.move_to_end(key)
+        missing = [i for i, score in enumerate(cached) if score is None]
+        if missing:
+            scores = self.predict([(query, texts[i]) for i in missing])
+            with self._lock:
+                for i, score in zip(missing, scores):
+                    cached[i] = float(score)
+                    self._cache[keys[i]] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                self.scored += len(missing)
+                self.cache_hits += len(keys) - len(missing)
+        else:
+            with self._lock:
+                self.cache_hits += len(keys)
+        return np.array(cached, dtype=np.float32)
+
+    def rerank(self, query, candidates, ids, texts, top_n=RERANK_TOP_N):
+        """`candidates` (in first-stage order) reordered by relevance, best `top_n` first.
+
+        `ids` and `texts` are the candidates' chunk ids and texts.
+        """
+        if len(candidates) <= 1:
+            return list(candidates)[:top_n]
+        with span("rerank"):
+            if not self.ready:
+                if not self.failed:
+                    self.warm_up()
+                with self._lock:
+                    self.fallbacks += 1
+                return list(candidates)[:top_n]
+
+            digest = query_hash(query)
+            keys = [(digest, chunk_id) for chunk_id in ids]
+            future = self._executor.submit(self._score, query, keys, list(texts))
+            try:
+                scores = future.result(timeout=self.budget_ms / 1000)
+            except FutureTimeoutError:
+                # Keep first-stage order; the scores still reach the cache.
+                with self._lock:
+                    self.fallbacks += 1
+                return list(candidates)[:top_n]
+
+            with self._lock:
+                self.reranked += 1
+            order = np.argsort(-scores, kind="stable")[:top_n]
+            return [candidates[i] for i in order]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": int(self.ready),
+                "failed": int(self.failed),
+                "reranked": self.reranked,
+                "fallbacks": self.fallbacks,
+                "cache_hits": self.cache_hits,
+                "scored": self.scored,
+                "cache_size": len(self._cache),
+            }
+
+
+class RerankingRetriever:
+    """Wraps a retriever returning llama_index `NodeWithScore`s so that
+    `retrieve`/`aretrieve` return its candidates reranked."""
+
+    def __init__(self, retriever, reranker, top_n=RERANK_TOP_N):
+        self.retriever = retriever
+        self.reranker = reranker
+        self.top_n = top_n
+
+    def _rerank(self, query, nodes):
+        return self.reranker.rerank(
+            query, nodes, [node.node.node_id for node in nodes], [node.node.get_content() for node in nodes],
+            self.top_n)
+
+    def retrieve(self, query):
+        return self._rerank(query, self.retriever.retrieve(query))
+
+    async def aretrieve(self, query):
+        import asyncio
+        nodes = await self.retriever.aretrieve(query)
+        return await asyncio.to_thread(self._rerank, query, nodes)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Return the process-wide reranker, or None unless RERANKER=local."""
+    global _reranker
+    if RERANKER != "local":
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+                REGISTRY.add_collector(stats_collector(
+                    "pti_reranker", _reranker.stats, counters=("reranked", "fallbacks", "cache_hits", "scored")))
+    return _reranker
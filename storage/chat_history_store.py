@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import threading
+
+
+CHAT_HISTORY_TABLE = "chat_history"
+# Messages loaded when a private session starts; older ones load on demand.
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "40"))
+# Only these columns are read back; `user_id` is already known.
+CHAT_HISTORY_COLUMNS = "id, role, content, timestamp"
+# "supabase" or "sqlite" (local file, for offline development)
+CHAT_HISTORY_STORE = os.getenv("CHAT_HISTORY_STORE", "supabase")
+SQLITE_CHAT_HISTORY_PATH = os.path.abspath(os.getenv("SQLITE_CHAT_HISTORY_PATH", "./data/chat_history.sqlite3"))
+# Rows per request when scanning the whole table (PostgREST caps responses at 1000).
+SCAN_PAGE_SIZE = 1000
+
+
+def page_result(rows, limit):
+    """Turn `limit + 1` newest-first rows into (chronological rows, cursor).
+
+    The cursor is the (timestamp, id) of the oldest returned row, or None
+    when there is nothing older left to load.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = (rows[-1]["timestamp"], rows[-1]["id"]) if has_more else None
+    return rows[::-1], cursor
+
+
+class SupabaseChatHistoryStore:
+    """`chat_history` rows in Supabase (schema in db.sql).
+
+    `client` is a supabase Client or the Streamlit SupabaseConnection; both
+    expose `.table()`. Queries are executed directly rather than through
+    st_supabase_connection's execute_query, so the store also works from
+    background threads.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def insert(self, rows):
+        # A single multi-row INSERT; "minimal" skips echoing the rows back.
+        self.client.table(CHAT_HISTORY_TABLE).insert(rows, returning="minimal").execute()
+
+    def fetch_page(self, user_id, limit=CHAT_HISTORY_PAGE_SIZE, before=None):
+        """Return up to `limit` of the user's messages older than `before`.
+
+        Keyset pagination on (timestamp, id), served by
+        idx_chat_history_user_timestamp: the cost depends on `limit`, not on
+        how long the user's history is.
+        """
+        query = (
+            self.client.table(CHAT_HISTORY_TABLE)
+            .select(CHAT_HISTORY_COLUMNS)
+            .eq("user_id", user_id)
+        )
+        if before is not None:
+            timestamp, row_id = before
+            query = query.or_(f'timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",id.lt.{row_id})')
+        response = (
+            query.order("timestamp", desc=True)
+            .order("id", desc=True)
+            .limit(limit + 1)
+            .execute()
+        )
+        return page_result(response.data or [], limit)
+
+    def recent_user_questions(self, limit):
+        """Contents of the `limit` most recent user messages, across all users."""
+        questions = []
+        while len(questions) < limit:
+            start = len(questions)
+            end = min(limit, start + SCAN_PAGE_SIZE) - 1
+            response = (
+                self.client.table(CHAT_HISTORY_TABLE)
+                .select("content")
+                .eq("role", "user")
+                .order("timestamp", desc=True)
+                .order("id", desc=True)
+                .range(start, end)
+                .execute()
+            )
+            rows = response.data or []
+            questions += [row["content"] for row in rows]
+            if len(rows) < end - start + 1:
+                break
+        return questions
+
+
+class SqliteChatHistoryStore:
+    """Local stand-in for the Supabase table, for offline development and tests."""
+
+    def __init__(self, path=SQLITE_CHAT_HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(f"""
+                create table if not exists {CHAT_HISTORY_TABLE} (
+                  id integer primary key autoincrement,
+                  user_id text not null,
+                  role text not null,
+                  content text not null,
+                  timestamp text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+                );
+                create index if not exists idx_chat_history_user_timestamp
+                  on {CHAT_HISTORY_TABLE}(user_id, timestamp desc, id desc);
+            """)
+
+    def insert(self, rows):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"insert into {CHAT_HISTORY_TABLE} (user_id, role, content, timestamp) values (?, ?, ?, ?)",
+                [(row["user_id"], row["role"], row["content"], row["timestamp"]) for row in rows],
+            )
+
+    def fetch_page(self, user_id, limit=CHAT_HISTORY_PAGE_SIZE, before=None):
+        query = f"select {CHAT_HISTORY_COLUMNS} from {CHAT_HISTORY_TABLE} where user_id = ?"
+        params = [user_id]
+        if before is not None:
+            query += " and (timestamp < ? or (timestamp = ? and id < ?))"
+            params += [before[0], before[0], before[1]]
+        query += " order by timestamp desc, id desc limit ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            cursor = self._connection.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, values)) for values in cursor.fetchall()]
+        return page_result(rows, limit)
+
+    def recent_user_questions(self, limit):
+        with self._lock:
+            rows = self._connection.execute(
+                f"select content from {CHAT_HISTORY_TABLE} where role = 'user' order by timestamp desc, id desc limit ?",
+                (limit,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        self._connection.close()
+
+
+def create_chat_history_store(supabase=None):
+    """Build the store selected by CHAT_HISTORY_STORE.
+
+    Outside Streamlit (e.g. command-line tools) pass no client; one is made
+    from SUPABASE_URL and SUPABASE_KEY.
+    """
+    if CHAT_HISTORY_STORE == "sqlite":
+        return SqliteChatHistoryStore()
+    if supabase is None:
+        from supabase import create_client
+        supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    return SupabaseChatHistoryStore(supabase)
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import threading
+
+from observability.metrics import span
+
+
+CHAT_HISTORY_QUEUE_SIZE = int(os.getenv("CHAT_HISTORY_QUEUE_SIZE", "1000"))
+CHAT_HISTORY_BATCH_SIZE = int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "50"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "0.5"))
+CHAT_HISTORY_MAX_RETRIES = int(os.getenv("CHAT_HISTORY_MAX_RETRIES", "4"))
+CHAT_HISTORY_SPOOL_PATH = os.path.abspath(os.getenv("CHAT_HISTORY_SPOOL_PATH", "./data/chat_history_spool.jsonl"))
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+SPOOL_REPLAY_INTERVAL = 30.0
+
+_STOP = object()
+
+
+class ChatHistoryWriter:
+    """Write-behind persistence for chat messages.
+
+    `enqueue` only puts rows on a bounded in-process queue and returns, so
+    a chat turn never waits on the database. A background worker drains
+    the queue in multi-row batches and retries failed inserts with jittered
+    exponential backoff. Rows it still cannot write, or that arrive while
+    the queue is full, are appended to a local JSONL spool file. The spool
+    is replayed into the store once inserts succeed again: it is renamed to
+    `<spool>.replaying` first and removed only once every row is written,
+    so a crash during the replay repeats it rather than losing rows.
+    """
+
+    def __init__(self, store, max_queue=CHAT_HISTORY_QUEUE_SIZE, batch_size=CHAT_HISTORY_BATCH_SIZE,
+                 flush_interval=CHAT_HISTORY_FLUSH_INTERVAL, max_retries=CHAT_HISTORY_MAX_RETRIES,
+                 spool_path=CHAT_HISTORY_SPOOL_PATH):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spool_path = spool_path
+
+        self.written = 0
+        self.retries = 0
+        self.spooled = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()  # counters
+        self._spool_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._last_spool_replay = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, rows):
+        """Queue one turn's rows for writing; never blocks."""
+        rows = list(rows)
+        if not rows:
+            return
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            print("Chat history queue full, spooling rows to disk")
+            self._spool(rows)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._maybe_replay_spool()
+                continue
+
+            items = [item]
+            batch = [] if item is _STOP else list(item)
+            # Coalesce whatever else is already waiting into the same INSERT.
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+                if item is not _STOP:
+                    batch.extend(item)
+
+            stopping = any(item is _STOP for item in items)
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _write(self, rows):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("persist"):
+                    self.store.insert(rows)
+            except Exception as e:
+                # On shutdown there is no time to back off; spool instead.
+                if attempt == self.max_retries or self._closing.is_set():
+                    print(f"Could not save chat history ({e}), spooling {len(rows)} rows")
+                    break
+                with self._lock:
+                    self.retries += 1
+                time.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0))
+            else:
+                with self._lock:
+                    self.written += len(rows)
+                self._maybe_replay_spool(force=True)
+                return
+        self._spool(rows)
+
+    def _spool(self, rows, path=None):
+        with self._spool_lock:
+            os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+            with open(path or self.spool_path, "a", encoding="utf-8") as file:
+                for row in rows:
+                    file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        if path is None:
+            with self._lock:
+                self.spooled += len(rows)
+
+    @property
+    def replay_path(self):
+        return self.spool_path + ".replaying"
+
+    def _read_replay(self):
+        rows = []
+        with open(self.replay_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Blank, or cut short by a crash while spooling.
+                    continue
+        return rows
+
+    def _maybe_replay_spool(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_spool_replay < SPOOL_REPLAY_INTERVAL:
+            return
+        self._last_spool_replay = now
+
+        with self._spool_lock:
+            # A replay cut short (by a crash or the store) is finished first;
+            # rows spooled meanwhile go to a new spool file.
+            if not os.path.exists(self.replay_path):
+                if not os.path.exists(self.spool_path):
+                    return
+                os.replace(self.spool_path, self.replay_path)
+        rows = self._read_replay()
+
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                self.store.insert(batch)
+            except Exception:
+                # Still unreachable: keep only the rest for the next attempt.
+                if start:
+                    tmp_path = self.replay_path + ".tmp"
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    self._spool(rows[start:], path=tmp_path)
+                    os.replace(tmp_path, self.replay_path)
+                return
+            with self._lock:
+                self.written += len(batch)
+                self.spooled = max(0, self.spooled - len(batch))
+        os.remove(self.replay_path)
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been written or spooled."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=5.0):
+        if self._closing.is_set():
+            return
+        self._closing.set()
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "retries": self.retries,
+                "spooled": self.spooled,
+            }
@@ -0,0 +1,96 @@
+import os
+
+os.environ["API_PRELOAD"] = "0"
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.server as server
+from backends import ChatError
+
+
+KEY = "secret-key"
+
+
+class FakeBackend:
+
+    def __init__(self):
+        self.turns = []
+        self.error = None
+
+    def stream_chat(self, prompt, conversation_history=[], mode=None, session=None):
+        self.turns.append({"prompt": prompt, "mode": mode, "session": session})
+        yield f"{mode} answer"
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(server, "API_KEYS", [KEY])
+    monkeypatch.setattr(server, "_backend", backend)
+    monkeypatch.setattr(server, "get_faq_index", lambda: None)
+    return backend
+
+
+@pytest.fixture
+def client(backend):
+    # Without the lifespan, so nothing builds a real backend.
+    return TestClient(server.app)
+
+
+def auth(key=KEY):
+    return {"Authorization": f"Bearer {key}"}
+
+
+def test_public_mode_needs_no_key(client):
+    response = client.post("/v1/chat", json={"message": "When does admission open?"})
+    assert response.status_code == 200
+    assert response.json()["answer"] == "public answer"
+
+
+@pytest.mark.parametrize("headers", [{}, auth("wrong-key"), {"Authorization": KEY}])
+def test_private_mode_needs_a_key(client, backend, headers):
+    response = client.post("/v1/chat", json={"message": "Show me the budget", "mode": "private"}, headers=headers)
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"] == "Bearer"
+    assert backend.turns == []
+
+
+def test_private_mode_with_a_key(client):
+    response = client.post("/v1/chat", json={"message": "Show me the budget", "mode": "private"}, headers=auth())
+    assert response.status_code == 200
+    assert response.json()["answer"] == "private answer"
+
+
+def test_only_authenticated_clients_choose_their_session(client, backend):
+    client.post("/v1/chat", json={"message": "Hi", "session": "someone-else"})
+    client.post("/v1/chat", json={"message": "Hi", "session": "whatsapp-123"}, headers=auth())
+    assert [turn["session"] for turn in backend.turns] == ["testclient", "client:whatsapp-123"]
+
+
+def test_metrics_need_a_key(client):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=auth("wrong-key")).status_code == 401
+    response = client.get("/metrics", headers=auth())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+
+def test_without_keys_nothing_is_authenticated(client, monkeypatch):
+    monkeypatch.setattr(server, "API_KEYS", [])
+    assert client.get("/metrics", headers=auth("")).status_code == 401
+    assert client.post("/v1/chat", json={"message": "Hi", "mode": "private"}, headers=auth("")).status_code == 401
+
+
+def test_backend_failures(client, backend):
+    backend.error = ChatError("Sorry, try again")
+    response = client.post("/v1/chat", json={"message": "Hi"})
+    assert response.status_code == 502
+    assert response.json()["detail"] == "Sorry, try again"
+
+    events = client.post("/v1/chat/stream", json={"message": "Hi"}).text
+    assert 'data: {"text": "public answer"}' in events
+    assert 'event: error\ndata: {"detail": "Sorry, try again"}' in events
+    assert "event: done" not in events
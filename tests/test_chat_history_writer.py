@@ -0,0 +1,96 @@
+import json
+import os
+
+from storage.chat_history_writer import ChatHistoryWriter
+
+
+class FakeStore:
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    def insert(self, rows):
+        if self.down:
+            raise ConnectionError("database unreachable")
+        self.rows.extend(rows)
+
+
+def rows(*contents):
+    return [{"user_id": "u", "role": "user", "content": content} for content in contents]
+
+
+def writer_for(store, tmp_path, **kwargs):
+    return ChatHistoryWriter(store, max_retries=0, flush_interval=0.01, spool_path=str(tmp_path / "spool.jsonl"),
+                             **kwargs)
+
+
+def test_rows_are_written_in_order(tmp_path):
+    store = FakeStore()
+    writer = writer_for(store, tmp_path)
+    writer.enqueue(rows("a", "b"))
+    writer.enqueue(rows("c"))
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert [row["content"] for row in store.rows] == ["a", "b", "c"]
+    assert writer.stats()["written"] == 3
+
+
+def test_failed_rows_are_spooled_and_replayed(tmp_path):
+    store = FakeStore()
+    store.down = True
+    writer = writer_for(store, tmp_path)
+    writer.enqueue(rows("a", "b"))
+    assert writer.flush(timeout=5)
+    assert store.rows == []
+    assert writer.stats()["spooled"] == 2
+
+    store.down = False
+    writer.enqueue(rows("c"))
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert sorted(row["content"] for row in store.rows) == ["a", "b", "c"]
+    assert writer.stats()["spooled"] == 0
+    assert not os.path.exists(tmp_path / "spool.jsonl")
+    assert not os.path.exists(tmp_path / "spool.jsonl.replaying")
+
+
+def test_an_interrupted_replay_is_finished_later(tmp_path):
+    # What a crash during a replay leaves behind, plus rows spooled since.
+    with open(tmp_path / "spool.jsonl.replaying", "w", encoding="utf-8") as file:
+        for row in rows("a", "b"):
+            file.write(json.dumps(row) + "\n")
+        file.write('{"user_id": "u", "ro')
+    with open(tmp_path / "spool.jsonl", "w", encoding="utf-8") as file:
+        file.write(json.dumps(rows("c")[0]) + "\n")
+
+    store = FakeStore()
+    writer = writer_for(store, tmp_path)
+    writer.enqueue(rows("d"))
+    assert writer.flush(timeout=5)
+    writer.close()
+    # The spool written while the replay file was pending.
+    writer._maybe_replay_spool(force=True)
+    assert sorted(row["content"] for row in store.rows) == ["a", "b", "c", "d"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_failed_replay_keeps_the_unwritten_rows(tmp_path):
+    store = FakeStore()
+    writer = writer_for(store, tmp_path, batch_size=2)
+    writer.close()
+    writer._spool(rows("a", "b", "c"))
+
+    inserts = []
+
+    def insert(batch):
+        inserts.append(batch)
+        if len(inserts) > 1:
+            raise ConnectionError("database unreachable")
+        store.rows.extend(batch)
+
+    store.insert = insert
+    writer._maybe_replay_spool(force=True)
+    assert [row["content"] for row in store.rows] == ["a", "b"]
+    with open(tmp_path / "spool.jsonl.replaying", encoding="utf-8") as file:
+        assert [json.loads(line)["content"] for line in file] == ["c"]
@@ -0,0 +1,37 @@
+import os
+
+from rag.chunk_store import ChunkStore, chunk_store_exists, write_chunk_store
+
+
+CHUNKS = [
+    {"url": "https://pti.edu.ng/a", "text": "First chunk.", "offset": 0},
+    {"url": "https://pti.edu.ng/a", "text": "Second chunk, ünicode.", "offset": 14},
+    {"url": "https://pti.edu.ng/b", "text": "Third chunk."},
+]
+
+
+def test_round_trip(tmp_path):
+    assert not chunk_store_exists(str(tmp_path))
+    write_chunk_store(CHUNKS, str(tmp_path))
+    assert chunk_store_exists(str(tmp_path))
+
+    store = ChunkStore(str(tmp_path))
+    assert list(store) == [{"offset": 0, **chunk} for chunk in CHUNKS]
+    assert store.pages() == [
+        {"url": "https://pti.edu.ng/a", "markdown": "First chunk.\n\nSecond chunk, ünicode."},
+        {"url": "https://pti.edu.ng/b", "markdown": "Third chunk."},
+    ]
+
+
+def test_rewrite_leaves_open_stores_intact(tmp_path):
+    write_chunk_store(CHUNKS, str(tmp_path))
+    old = ChunkStore(str(tmp_path))
+
+    write_chunk_store([{"url": "https://pti.edu.ng/c", "text": "Only chunk."}], str(tmp_path))
+    new = ChunkStore(str(tmp_path))
+
+    assert [chunk["text"] for chunk in old] == [chunk["text"] for chunk in CHUNKS]
+    assert [chunk["text"] for chunk in new] == ["Only chunk."]
+    assert old.digest() != new.digest()
+    # Only the current version is kept on disk.
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("v")]) == 1
@@ -0,0 +1,73 @@
+import pytest
+
+from cache.faq_index import FaqIndex, compile_index, faq_key, fuzzy_match
+
+
+ENTRIES = [
+    {"question": "When does the academic session start?", "answer": "session start", "approved": True},
+    {"question": "What are the admission requirements?", "variants": ["admission requirements for PTI"],
+     "answer": "admission", "approved": True},
+    {"question": "How much are the school fees?", "answer": "fees", "approved": True},
+    {"question": "Who is the rector of PTI?", "answer": "unapproved", "approved": False},
+]
+
+
+@pytest.fixture
+def faq(tmp_path):
+    compile_index(ENTRIES, str(tmp_path))
+    return FaqIndex(str(tmp_path))
+
+
+def test_faq_key_keeps_question_words():
+    assert faq_key("When does the academic session start?") == "when does academic session start"
+    assert faq_key("Where is PTI?") != faq_key("Who is PTI?")
+
+
+@pytest.mark.parametrize("question, answer", [
+    ("When does the academic session start?", "session start"),
+    ("when does the academic session START", "session start"),
+    ("Admission requirements for PTI", "admission"),
+    ("How much are school fees", "fees"),
+    # Stopwords and word order do not change the question.
+    ("When does academic session start", "session start"),
+    ("School fees: how much?", "fees"),
+])
+def test_match(faq, question, answer):
+    assert faq.lookup(question) == answer
+
+
+@pytest.mark.parametrize("question", [
+    "When does the academic session end?",
+    "Where does the academic session start?",
+    "What are the admission requirements for HND Petroleum Engineering?",
+    "How much are the hostel fees?",
+    "When does the academic session start at PTI?",
+    "Who is the rector of PTI?",
+    "",
+])
+def test_near_misses(faq, question):
+    assert faq.lookup(question) is None
+
+
+def test_follow_ups_miss(faq):
+    history = [
+        {"role": "user", "content": "What courses are offered?"},
+        {"role": "assistant", "content": "Many."},
+        {"role": "user", "content": "How much are the school fees?"},
+    ]
+    assert faq.lookup("How much are the school fees?", history) is None
+    assert faq.lookup("How much are the school fees?", history[-1:]) == "fees"
+
+
+def test_stats(faq):
+    faq.lookup("How much are the school fees?")
+    faq.lookup("School fees: how much?")
+    faq.lookup("When does the academic session end?")
+    stats = faq.stats()
+    assert (stats["exact_hits"], stats["fuzzy_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["size"] == 3
+
+
+def test_fuzzy_match_needs_every_word():
+    assert fuzzy_match("how much school fees", "how much school fees")
+    assert not fuzzy_match("how much hostel fees", "how much school fees")
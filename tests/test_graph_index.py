@@ -0,0 +1,113 @@
+import asyncio
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from rag.graph_index import CsrGraph, compile_networkx, read_graph, write_graph
+from rag.lightrag_storage import CsrGraphStorage
+
+
+def sample_graph():
+    # a - b - c - d, plus b - e and an isolated f.
+    graph = nx.Graph()
+    graph.add_node("f", entity_type="org")
+    for source, target in [("a", "b"), ("b", "c"), ("c", "d"), ("b", "e")]:
+        graph.add_edge(source, target, weight=2.0, description=f"{source}-{target}")
+    for node in "abcde":
+        graph.nodes[node]["entity_type"] = "person"
+    return graph
+
+
+@pytest.fixture
+def graph(tmp_path):
+    write_graph(str(tmp_path / "graph.csr"), compile_networkx(sample_graph()))
+    return CsrGraph(read_graph(str(tmp_path / "graph.csr")))
+
+
+def names(graph, nodes):
+    return [graph.name(int(node)) for node in nodes]
+
+
+def test_lookups(graph):
+    b = graph.node_id("b")
+    assert graph.name(b) == "b"
+    assert graph.node_id("missing") is None
+    assert sorted(names(graph, graph.neighbors(b))) == ["a", "c", "e"]
+    assert graph.degree(b) == 3
+    assert graph.edge_attrs(graph.edge_id(b, graph.node_id("c")))["description"] in ("b-c", "c-b")
+    assert graph.edge_id(b, graph.node_id("d")) is None
+    assert list(graph.node_ids(["c", "missing", "a"])) == [graph.node_id("c"), -1, graph.node_id("a")]
+
+
+@pytest.mark.parametrize("depth, expected", [
+    (0, [{"a"}]),
+    (1, [{"a"}, {"b"}]),
+    (2, [{"a"}, {"b"}, {"c", "e"}]),
+    (3, [{"a"}, {"b"}, {"c", "e"}, {"d"}]),
+    (9, [{"a"}, {"b"}, {"c", "e"}, {"d"}]),
+])
+def test_k_hop_is_breadth_first(graph, depth, expected):
+    nodes, truncated = graph.k_hop([graph.node_id("a")], depth, max_nodes=100)
+    found = names(graph, nodes)
+    levels, start = [], 0
+    for level in expected:
+        levels.append(set(found[start:start + len(level)]))
+        start += len(level)
+    assert levels == expected and start == len(found)
+    assert not truncated
+
+
+def test_k_hop_truncates(graph):
+    nodes, truncated = graph.k_hop([graph.node_id("a")], 3, max_nodes=2)
+    assert names(graph, nodes) == ["a", "b"]
+    assert truncated
+
+
+def test_edges_within(graph):
+    nodes = [graph.node_id(name) for name in "abc"]
+    edges = {tuple(sorted((graph.name(int(graph.edge_src[e])), graph.name(int(graph.edge_tgt[e])))))
+             for e in graph.edges_within(nodes)}
+    assert edges == {("a", "b"), ("b", "c")}
+
+
+def test_round_trips_through_networkx(graph):
+    copy = graph.to_networkx()
+    assert nx.utils.graphs_equal(copy, sample_graph())
+
+
+def storage(tmp_path):
+    write_graph(str(tmp_path / "graph_chunk_entity_relation.csr"), compile_networkx(sample_graph()))
+    return CsrGraphStorage(namespace="chunk_entity_relation", global_config={"working_dir": str(tmp_path)},
+                           embedding_func=None)
+
+
+def test_batch_methods_match_the_per_node_ones(tmp_path):
+    graph = storage(tmp_path)
+    ids = ["a", "b", "f", "missing"]
+    pairs = [("a", "b"), ("b", "c"), ("a", "missing")]
+
+    async def check():
+        nodes = await graph.get_nodes_batch(ids)
+        assert nodes == {node_id: await graph.get_node(node_id) for node_id in ids if await graph.has_node(node_id)}
+        assert await graph.node_degrees_batch(ids) == {node_id: await graph.node_degree(node_id) for node_id in ids}
+        assert await graph.edge_degrees_batch(pairs) == {pair: await graph.edge_degree(*pair) for pair in pairs}
+        edges = await graph.get_edges_batch([{"src": source, "tgt": target} for source, target in pairs])
+        assert edges == {pair: await graph.get_edge(*pair) for pair in pairs if await graph.get_edge(*pair)}
+        node_edges = await graph.get_nodes_edges_batch(ids)
+        assert node_edges == {node_id: await graph.get_node_edges(node_id) or [] for node_id in ids}
+
+        # The writable networkx copy answers the same way.
+        await graph.upsert_node("g", {"entity_type": "person"})
+        assert await graph.node_degrees_batch(ids) == {"a": 1, "b": 3, "f": 0, "missing": 0}
+        assert sorted(map(sorted, (await graph.get_nodes_edges_batch(["b"]))["b"])) == [["a", "b"], ["b", "c"],
+                                                                                         ["b", "e"]]
+
+    asyncio.run(check())
+
+
+def test_empty_batches(tmp_path):
+    graph = storage(tmp_path)
+    assert asyncio.run(graph.get_nodes_edges_batch(["missing"])) == {"missing": []}
+    assert asyncio.run(graph.node_degrees_batch([])) == {}
+    assert np.array_equal(CsrGraph(compile_networkx(nx.Graph())).node_ids([]), np.array([], dtype=np.int64))
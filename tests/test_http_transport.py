@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from llm.http_transport import LoopLocalTransport
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connections are pooled
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def test_one_client_serves_many_event_loops(url):
+    transport = LoopLocalTransport()
+    client = httpx.AsyncClient(transport=transport)
+
+    async def get():
+        return (await client.get(url)).text
+
+    # One loop per turn, as asyncio.run does, and a loop on another thread.
+    assert [asyncio.run(get()) for _ in range(3)] == ["ok"] * 3
+    results = []
+    thread = threading.Thread(target=lambda: results.append(asyncio.run(get())))
+    thread.start()
+    thread.join()
+    assert results == ["ok"]
+
+
+def test_each_loop_gets_its_own_pool():
+    transport = LoopLocalTransport()
+
+    async def pool():
+        return transport._transport()
+
+    async def same_loop():
+        return await pool() is await pool()
+
+    assert asyncio.run(same_loop())
+    assert asyncio.run(pool()) is not asyncio.run(pool())
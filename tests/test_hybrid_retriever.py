@@ -0,0 +1,28 @@
+import pytest
+
+from rag.chunk_store import ChunkStore, write_chunk_store
+from retrieval.hybrid_retriever import HybridIndex, build_index
+
+
+CHUNKS = [
+    {"url": "https://pti.edu.ng/admissions", "text": "Admission requirements for the ND programme."},
+    {"url": "https://pti.edu.ng/fees", "text": "School fees are paid at the start of the session."},
+]
+
+
+def test_index_opens_on_the_store_it_was_built_from(tmp_path):
+    write_chunk_store(CHUNKS, str(tmp_path / "chunks"))
+    store = ChunkStore(str(tmp_path / "chunks"))
+    build_index(store, index_dir=str(tmp_path / "index"))
+
+    index = HybridIndex(str(tmp_path / "index"), chunks=store)
+    assert index.bm25_scores("school fees").argmax() == 1
+
+
+def test_index_rejects_a_store_with_the_same_count_but_other_text(tmp_path):
+    write_chunk_store(CHUNKS, str(tmp_path / "chunks"))
+    build_index(ChunkStore(str(tmp_path / "chunks")), index_dir=str(tmp_path / "index"))
+
+    write_chunk_store([{**chunk, "text": chunk["text"].upper()} for chunk in CHUNKS], str(tmp_path / "chunks"))
+    with pytest.raises(ValueError, match="different chunk store"):
+        HybridIndex(str(tmp_path / "index"), chunks=ChunkStore(str(tmp_path / "chunks")))
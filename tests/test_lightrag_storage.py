@@ -0,0 +1,89 @@
+import asyncio
+import os
+import zlib
+
+import numpy as np
+import pytest
+from lightrag.utils import EmbeddingFunc
+
+import rag.lightrag_storage as lightrag_storage
+from rag.lightrag_storage import MemmapVectorDBStorage
+
+
+DIM = 16
+
+
+async def embed(texts):
+    # A fixed random direction per text, so a text is its own nearest match.
+    return np.array([np.random.default_rng(zlib.crc32(text.encode())).standard_normal(DIM) for text in texts],
+                    dtype=np.float32)
+
+
+def storage(working_dir):
+    vectors = MemmapVectorDBStorage(
+        namespace="entities",
+        global_config={"working_dir": str(working_dir), "embedding_batch_num": 4,
+                       "vector_db_storage_cls_kwargs": {"cosine_better_than_threshold": 0.5}},
+        embedding_func=EmbeddingFunc(embedding_dim=DIM, max_token_size=8192, func=embed),
+        meta_fields={"entity_name"},
+    )
+    asyncio.run(vectors.initialize())
+    return vectors
+
+
+def records(names):
+    return {f"ent-{name}": {"content": name, "entity_name": name} for name in names}
+
+
+def top(vectors, text):
+    results = asyncio.run(vectors.query(text, top_k=1))
+    return results[0]["entity_name"] if results else None
+
+
+def vector_files(working_dir):
+    return sorted(name for name in os.listdir(working_dir) if name.endswith(".f32"))
+
+
+@pytest.fixture(autouse=True)
+def small_compactions(monkeypatch):
+    monkeypatch.setattr(lightrag_storage, "VECTOR_COMPACT_MIN_ROWS", 2)
+
+
+def test_query_finds_the_nearest_vector(tmp_path):
+    vectors = storage(tmp_path)
+    asyncio.run(vectors.upsert(records(["alpha", "beta", "gamma"])))
+    assert [top(vectors, name) for name in ["gamma", "alpha"]] == ["gamma", "alpha"]
+    assert asyncio.run(vectors.get_by_id("ent-beta"))["entity_name"] == "beta"
+
+
+def test_dead_rows_are_compacted_into_the_next_generation(tmp_path):
+    vectors = storage(tmp_path)
+    names = ["alpha", "beta", "gamma", "delta"]
+    asyncio.run(vectors.upsert(records(names)))
+    assert vector_files(tmp_path) == ["vdb_entities.f32"]
+
+    # Re-upserting appends new rows; the old ones are dead.
+    asyncio.run(vectors.upsert(records(names[:3])))
+    assert vector_files(tmp_path) == ["vdb_entities.1.f32"]
+    assert os.path.getsize(tmp_path / "vdb_entities.1.f32") == 4 * 4 * DIM
+    assert [top(vectors, name) for name in names] == names
+
+    asyncio.run(vectors.delete(["ent-alpha", "ent-beta", "ent-gamma"]))
+    assert vector_files(tmp_path) == ["vdb_entities.2.f32"]
+    assert top(vectors, "alpha") is None and top(vectors, "delta") == "delta"
+
+    # A fresh instance, as after a restart, reads the same generation.
+    assert top(storage(tmp_path), "delta") == "delta"
+
+
+def test_a_torn_write_is_cut_off(tmp_path):
+    vectors = storage(tmp_path)
+    asyncio.run(vectors.upsert(records(["alpha", "beta"])))
+    # Rows written to the file by an upsert that never committed.
+    with open(tmp_path / "vdb_entities.f32", "ab") as file:
+        file.write(np.ones(DIM + 3, dtype=np.float32).tobytes())
+
+    vectors = storage(tmp_path)
+    assert os.path.getsize(tmp_path / "vdb_entities.f32") == 2 * 4 * DIM
+    asyncio.run(vectors.upsert(records(["gamma"])))
+    assert [top(vectors, name) for name in ["alpha", "beta", "gamma"]] == ["alpha", "beta", "gamma"]
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+from backends import ChatError
+from llm.scheduler import ChatScheduler, ScheduledBackend, TokenBucket
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    assert [bucket._reserve(None) for _ in range(3)] == [0, 0, 0]
+    # Waiting callers queue up behind each other.
+    assert [bucket._reserve(None) for _ in range(2)] == [0.5, 1.0]
+    clock.now = 1.0
+    assert bucket._reserve(None) == 0.5
+    assert bucket.stats()["waits"] == 3
+
+
+def test_token_bucket_rejects_waits_past_the_deadline():
+    bucket = TokenBucket(rate=1, burst=1, clock=FakeClock())
+    bucket._reserve(None)
+    with pytest.raises(TimeoutError):
+        bucket._reserve(timeout=0.5)
+    assert bucket.stats()["rejected"] == 1
+    assert bucket._reserve(timeout=1) == 1
+
+
+def test_a_zero_rate_is_unlimited():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket._reserve(0) == 0 for _ in range(100))
+
+
+def gated(chunks, gate, calls):
+    def run():
+        calls.append(chunks)
+        gate.wait(5)
+        yield from chunks
+    return run
+
+
+def test_identical_questions_share_one_flight():
+    scheduler = ChatScheduler(concurrency=2)
+    gate, calls = threading.Event(), []
+    first = scheduler.submit("key", gated(["a", "b"], gate, calls))
+    second = scheduler.submit("key", gated(["x"], gate, calls))
+    assert first is second
+    gate.set()
+    assert list(first) == list(second) == ["a", "b"]
+    assert calls == [["a", "b"]]
+    assert scheduler.stats()["coalesced"] == 1
+
+    # Once answered, the same question runs again.
+    assert list(scheduler.submit("key", gated(["c"], gate, calls))) == ["c"]
+
+
+def test_a_failure_reaches_every_asker():
+    scheduler = ChatScheduler(concurrency=1)
+    gate = threading.Event()
+
+    def run():
+        gate.wait(5)
+        yield "partial"
+        raise ChatError()
+
+    flights = [scheduler.submit("key", run) for _ in range(2)]
+    gate.set()
+    for flight in flights:
+        chunks = []
+        with pytest.raises(ChatError):
+            for chunk in flight:
+                chunks.append(chunk)
+        assert chunks == ["partial"]
+
+
+def test_sessions_take_turns():
+    scheduler = ChatScheduler(concurrency=1)
+    gate, order = threading.Event(), []
+
+    def run(name):
+        def turn():
+            order.append(name)
+            gate.wait(5)
+            return iter(())
+        return turn
+
+    flights = [scheduler.submit(None, run("a1"), session="a")]
+    flights += [scheduler.submit(None, run(name), session="a") for name in ("a2", "a3")]
+    flights.append(scheduler.submit(None, run("b1"), session="b"))
+    gate.set()
+    for flight in flights:
+        list(flight)
+    assert order == ["a1", "b1", "a2", "a3"] or order == ["a1", "a2", "b1", "a3"]
+
+
+class EchoBackend:
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+
+    def stream_chat(self, prompt, conversation_history=[], mode=None):
+        self.calls.append((prompt, list(conversation_history)))
+        self.gate.wait(5)
+        yield f"answer to {prompt}"
+
+
+def test_only_stand_alone_questions_are_coalesced():
+    backend = EchoBackend()
+    scheduled = ScheduledBackend(backend, "echo", scheduler=ChatScheduler(concurrency=4))
+    question = "What are the school fees?"
+    follow_up = [{"role": "user", "content": "Tell me about PTI"}, {"role": "assistant", "content": "PTI is..."},
+                 {"role": "user", "content": question}]
+    streams = [scheduled.stream_chat(question, [{"role": "user", "content": question}], mode="public"),
+               scheduled.stream_chat(question.upper(), [], mode="public"),
+               scheduled.stream_chat(question, follow_up, mode="public"),
+               scheduled.stream_chat(question, [], mode="private")]
+    # The generators submit on their first step; hold the answers until all
+    # four are in.
+    threads = [threading.Thread(target=lambda stream=stream: list(stream)) for stream in streams]
+    for thread in threads:
+        thread.start()
+    while sum(scheduled.scheduler.stats()[counter] for counter in ("submitted", "coalesced")) < 4:
+        time.sleep(0.01)
+    backend.gate.set()
+    for thread in threads:
+        thread.join(5)
+    # One public stand-alone run, one follow-up, one private run.
+    assert len(backend.calls) == 3
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USE_CACHE = """
+import sys
+from cache.semantic_cache import get_answer_cache
+cache = get_answer_cache()
+cache.put("What are the school fees?", "N50,000", namespace="llamacloud-public")
+print(type(cache).__name__, cache.get("What are the school fees?", namespace="llamacloud-public"),
+      "torch" in sys.modules)
+"""
+
+
+def run(**overrides):
+    # A fresh interpreter, so the flag is read with these settings.
+    env = {name: value for name, value in os.environ.items() if name != "ANSWER_CACHE"}
+    env.update(overrides)
+    result = subprocess.run([sys.executable, "-c", USE_CACHE], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True)
+    return result.stdout.split()
+
+
+def test_llamacloud_runs_without_the_cache_or_torch():
+    assert run(CHAT_BACKEND="llamacloud") == ["NoAnswerCache", "None", "False"]
+
+
+@pytest.mark.parametrize("env", [{"CHAT_BACKEND": "lightrag", "ANSWER_CACHE": "0"},
+                                 {"CHAT_BACKEND": "cag", "ANSWER_CACHE": "0"}])
+def test_the_cache_can_be_turned_off(env):
+    assert run(**env)[0] == "NoAnswerCache"
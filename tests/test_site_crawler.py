@@ -0,0 +1,60 @@
+import json
+
+import httpx
+
+from crawler.site_crawler import GONE, CrawlLedger, SiteCrawler
+
+
+SEED = "https://pti.edu.ng"
+
+
+def page(body, links=()):
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return f"<html><body><main><h1>{body}</h1><p>{body} text.</p>{anchors}</main></body></html>"
+
+
+def site(pages):
+    def handler(request):
+        html = pages.get(request.url.path or "/")
+        if html is None:
+            return httpx.Response(404)
+        return httpx.Response(200, html=html)
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def crawl(tmp_path, pages, max_pages=100):
+    crawler = SiteCrawler([SEED], output=str(tmp_path / "pages.jsonl"),
+                          ledger=CrawlLedger(str(tmp_path / "ledger.jsonl")), max_pages=max_pages,
+                          client=site(pages), max_retries=0)
+    return crawler.crawl()
+
+
+def crawled_urls(tmp_path):
+    with open(tmp_path / "pages.jsonl", encoding="utf-8") as file:
+        return {json.loads(line)["url"] for line in file}
+
+
+def test_unlinked_pages_are_gone_after_a_complete_crawl(tmp_path):
+    result = crawl(tmp_path, {"/": page("Home", ["/a", "/b"]), "/a": page("A"), "/b": page("B")})
+    assert len(result.changed) == 3
+    assert crawled_urls(tmp_path) == {SEED, f"{SEED}/a", f"{SEED}/b"}
+
+    # /b still exists but nothing links to it any more.
+    result = crawl(tmp_path, {"/": page("Home", ["/a"]), "/a": page("A"), "/b": page("B")})
+    assert result.gone == [f"{SEED}/b"]
+    assert crawled_urls(tmp_path) == {SEED, f"{SEED}/a"}
+    assert CrawlLedger(str(tmp_path / "ledger.jsonl")).entries[f"{SEED}/b"]["outcome"] == GONE
+
+
+def test_a_truncated_crawl_forgets_nothing(tmp_path):
+    crawl(tmp_path, {"/": page("Home", ["/a", "/b"]), "/a": page("A"), "/b": page("B")})
+
+    result = crawl(tmp_path, {"/": page("Home", ["/a", "/b"]), "/a": page("A"), "/b": page("B")}, max_pages=2)
+    assert result.gone == []
+    assert crawled_urls(tmp_path) == {SEED, f"{SEED}/a", f"{SEED}/b"}
+
+
+def test_404_pages_are_gone(tmp_path):
+    crawl(tmp_path, {"/": page("Home", ["/a"]), "/a": page("A")})
+    result = crawl(tmp_path, {"/": page("Home", ["/a"])})
+    assert result.gone == [f"{SEED}/a"]